@@ -1,22 +1,89 @@
+import time
+
+_boot_started = time.perf_counter()
+
+import asyncio
 import importlib
 import os
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
 
-import uvicorn as uvicorn
+from aerich import Command
 from fastapi import FastAPI
-from tortoise.contrib.fastapi import register_tortoise
+from tortoise import Tortoise
+from tortoise.contrib.fastapi import RegisterTortoise
 
+from v1.app import role_graph
+from v1.app.jobs import runner as job_runner
+from v1.app.models import DEFAULT_TENANT_ID
 from v1.app.role_scopes import RoleScopes
+from v1.app.scopes import validate_role_scopes
 from v1.app.schemas import UserPayload
+from v1 import tracing
+from v1.lifecycle import lifecycle, serve
+from v1.profiling import loop_monitor
+from v1.instrumentation import instrument_tortoise
+from v1.middleware import (
+    AdmissionMiddleware,
+    CompressionMiddleware,
+    LifecycleMiddleware,
+    QueryStatsMiddleware,
+    TracingMiddleware,
+)
 from v1.settings import settings, logger
-from v1.app import UserCRUD, Role
+from v1.app import TenantCRUD, UserCRUD, RoleCRUD
+
+startup_timings: dict[str, float] = {"imports": time.perf_counter() - _boot_started}
+
+
+@contextmanager
+def startup_phase(name: str):
+    """Record how long a boot phase took, reported once startup completes"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - started
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Boots the worker, then drains it and closes the database pool on shutdown"""
+    if settings.api.startup_mode == "dev":
+        with startup_phase("migrations"):
+            await migrate()
+
+    started = time.perf_counter()
+    async with orm:
+        startup_timings["tortoise_init"] = time.perf_counter() - started
+        await seed()
+        lifecycle.phase = "ready"
+        yield
+        await shutdown()
+
+    lifecycle.phase = "stopped"
+    logger.info("Shutdown complete")
 
 
 application = FastAPI(
     title=settings.api.title,
     version=f"{settings.api.version}.{settings.api.build_version}",
     root_path="/v1",
+    lifespan=lifespan,
 )
-
+application.add_middleware(CompressionMiddleware)
+application.add_middleware(QueryStatsMiddleware)
+if settings.server.admission_control:
+    # Outside compression and query counting, so shed requests cost next to nothing
+    application.add_middleware(AdmissionMiddleware)
+if settings.telemetry.trace_exporter != "off":
+    # Added last so it wraps compression and the whole request is traced
+    application.add_middleware(TracingMiddleware)
+# Outermost, so requests turned away while draining cost nothing and all others are counted
+application.add_middleware(LifecycleMiddleware)
+instrument_tortoise()
+
+MIGRATIONS = Path(__file__).resolve().parent / "migrations"
 TORTOISE_CONFIG = {
     "connections": {"default": settings.db_url},
     "apps": {
@@ -28,21 +95,38 @@ TORTOISE_CONFIG = {
 }
 
 
-def configure_tortoise(app: FastAPI):
+def configure_tortoise(app: FastAPI) -> RegisterTortoise:
     """
-    Generates a list of paths to the models, includes aerich, then registers Tortoise
+    Registers Tortoise's exception handlers, connections are opened by the lifespan \n
+    The schema always comes from the aerich migrations, never from the models: indexes,
+    triggers and extensions the queries rely on only exist there
 
     :param app: Instance of FastAPI class
-    :return:
+    :return: Context manager initializing Tortoise and closing its connections
     """
-    register_tortoise(
+    return RegisterTortoise(
         app,
         config=TORTOISE_CONFIG,
-        generate_schemas=True,
+        generate_schemas=False,
         add_exception_handlers=True,
     )
 
 
+async def migrate() -> None:
+    """
+    Apply pending aerich migrations, as `aerich upgrade` would. \n
+    Only used in the `dev` startup mode: with several workers booting at once,
+    migrations have to run once, before they start.
+    """
+    command = Command(tortoise_config=TORTOISE_CONFIG, location=str(MIGRATIONS))
+    try:
+        await command.init()
+        for version in await command.upgrade(run_in_transaction=True):
+            logger.info(f"Applied migration {version}")
+    finally:
+        await Tortoise.close_connections()
+
+
 def include_routers(app: FastAPI):
     """
     Routers must contain the variables **__tags__** and **__prefix__** \n
@@ -51,6 +135,15 @@ def include_routers(app: FastAPI):
     :param app: Instance of FastAPI class
     :return: None
     """
+    if settings.api.startup_mode == "fast":
+        from v1.routers import ROUTERS
+
+        for module in ROUTERS:
+            app.include_router(
+                module.router, tags=module.__tags__, prefix=module.__prefix__
+            )
+        return
+
     for module_name in os.listdir(settings.api.version_path / "routers"):
         if module_name.startswith("_") or not module_name.endswith(".py"):
             continue
@@ -64,27 +157,76 @@ def include_routers(app: FastAPI):
         )
 
 
-configure_tortoise(application)
-include_routers(application)
+with startup_phase("tortoise_config"):
+    orm = configure_tortoise(application)
+with startup_phase("routers"):
+    include_routers(application)
 
 
-@application.on_event("startup")  # if using RegisterTortoise
 async def seed():
-    roles = RoleScopes.build_all_role_scopes().keys()
     admin = {"username": "admin", "email": "admin@example.com", "password": "admin123"}
 
-    for r in roles:
-        role, created = await Role.get_or_create(name=r, defaults={"name": r})
-        if created:
-            logger.info(f"Seeded default role: {role.name}")
-
-    if settings.is_prod:
-        return
-
-    _, created = await UserCRUD.create(UserPayload(**admin), is_admin=True)
-    if created:
-        logger.info(f"Seeded non-prod admin.")
+    if issues := RoleScopes.validate_scopes() + RoleScopes.validate_exclusions():
+        raise RuntimeError("Invalid built-in roles:\n" + "\n".join(issues))
+
+    with startup_phase("seed_tenant"):
+        if await TenantCRUD.seed_default():
+            logger.info("Seeded default tenant")
+
+    with startup_phase("seed_roles"):
+        for name in await RoleCRUD.seed_defaults():
+            logger.info(f"Seeded default role: {name}")
+
+    with startup_phase("role_graph"):
+        snapshot = await role_graph.refresh()
+    for issue in validate_role_scopes(
+        {name: snapshot.scopes_for(name) for name in snapshot.role_ids}
+    ):
+        logger.warning(issue)
+    application.state.role_graph_watcher = asyncio.create_task(
+        role_graph.watch(settings.role_graph_refresh_seconds)
+    )
+    if settings.telemetry.loop_stall_ms:
+        loop_monitor.start()
+
+    if interrupted := await job_runner.fail_interrupted(settings.jobs_stale_seconds):
+        logger.warning(f"Marked {interrupted} abandoned job(s) as failed")
+    if await UserCRUD.has_pending_scopes():
+        # Left behind by an interrupted role deletion; platform admins follow it
+        await job_runner.submit_once("scopes.resync", tenant_id=DEFAULT_TENANT_ID)
+
+    if not settings.is_prod:
+        with startup_phase("seed_admin"):
+            # Checked first so an existing admin doesn't cost a password hash
+            if not await UserCRUD.exists(admin["email"]):
+                await UserCRUD.create(UserPayload(**admin), is_admin=True)
+                logger.info(f"Seeded non-prod admin.")
+
+    startup_timings["total"] = time.perf_counter() - _boot_started
+    logger.info(
+        f"Startup ({settings.api.startup_mode} mode): "
+        + ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in startup_timings.items())
+    )
 
 
-# if __name__ == "__main__":
-#     uvicorn.run("main:application", host="0.0.0.0", port=8000, reload=True)
+async def shutdown():
+    """
+    Waits for in-flight requests, then background jobs, and stops the worker's
+    background tasks, all within `SHUTDOWN_TIMEOUT` seconds of the exit signal
+    """
+    # Already started by the exit signal when served through `v1.lifecycle.serve`
+    lifecycle.begin_draining(settings.server.shutdown_timeout)
+    if not await lifecycle.drain():
+        logger.warning(f"{lifecycle.requests} request(s) unfinished at shutdown")
+    if cancelled := await job_runner.drain(lifecycle.remaining):
+        logger.warning(f"Cancelled {cancelled} unfinished job(s)")
+
+    if watcher := getattr(application.state, "role_graph_watcher", None):
+        watcher.cancel()
+    loop_monitor.stop()
+    tracing.exporter.shutdown()
+
+
+if __name__ == "__main__":
+    # Production server profile, see `_ServerSettings`
+    serve("main:application", **settings.server.uvicorn_options())
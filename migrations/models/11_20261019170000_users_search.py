@@ -0,0 +1,18 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE EXTENSION IF NOT EXISTS "pg_trgm";
+        CREATE INDEX "idx_users_username_prefix" ON "users" (lower("username") text_pattern_ops);
+        CREATE INDEX "idx_users_email_prefix" ON "users" (lower("email") text_pattern_ops);
+        CREATE INDEX "idx_users_username_trgm" ON "users" USING GIN (lower("username") gin_trgm_ops);
+        CREATE INDEX "idx_users_email_trgm" ON "users" USING GIN (lower("email") gin_trgm_ops);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_users_email_trgm";
+        DROP INDEX IF EXISTS "idx_users_username_trgm";
+        DROP INDEX IF EXISTS "idx_users_email_prefix";
+        DROP INDEX IF EXISTS "idx_users_username_prefix";"""
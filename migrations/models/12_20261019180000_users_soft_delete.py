@@ -0,0 +1,15 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "users" ADD "deleted_at" TIMESTAMPTZ;
+        CREATE INDEX "idx_users_email_active" ON "users" ("email") WHERE "is_active" AND "deleted_at" IS NULL;
+        CREATE INDEX "idx_users_id_live" ON "users" ("id") WHERE "deleted_at" IS NULL;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_users_id_live";
+        DROP INDEX IF EXISTS "idx_users_email_active";
+        ALTER TABLE "users" DROP COLUMN "deleted_at";"""
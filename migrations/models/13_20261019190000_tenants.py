@@ -0,0 +1,81 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "tenants" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "slug" VARCHAR(64) NOT NULL UNIQUE,
+    "name" TEXT NOT NULL
+);
+        INSERT INTO "tenants" ("id", "slug", "name") VALUES (1, 'default', 'Default') ON CONFLICT DO NOTHING;
+        SELECT setval(pg_get_serial_sequence('tenants', 'id'), (SELECT max("id") FROM "tenants"));
+        ALTER TABLE "users" ADD "tenant_id" INT NOT NULL DEFAULT 1 REFERENCES "tenants" ("id") ON DELETE RESTRICT;
+        DROP INDEX IF EXISTS "uid_users_email_133a6f";
+        CREATE UNIQUE INDEX "uid_users_tenant_id_email" ON "users" ("tenant_id", "email");
+        DROP INDEX IF EXISTS "idx_users_email_active";
+        CREATE INDEX "idx_users_email_active" ON "users" ("tenant_id", "email") WHERE "is_active" AND "deleted_at" IS NULL;
+        DROP INDEX IF EXISTS "idx_users_id_live";
+        CREATE INDEX "idx_users_id_live" ON "users" ("tenant_id", "id") WHERE "deleted_at" IS NULL;
+        DROP INDEX IF EXISTS "idx_users_username_prefix";
+        CREATE INDEX "idx_users_username_prefix" ON "users" ("tenant_id", lower("username") text_pattern_ops);
+        DROP INDEX IF EXISTS "idx_users_email_prefix";
+        CREATE INDEX "idx_users_email_prefix" ON "users" ("tenant_id", lower("email") text_pattern_ops);
+        ALTER TABLE "roles" ADD "tenant_id" INT REFERENCES "tenants" ("id") ON DELETE CASCADE;
+        DROP INDEX IF EXISTS "uid_roles_name_e5bfae";
+        CREATE UNIQUE INDEX "uid_roles_tenant_id_name" ON "roles" ("tenant_id", "name");
+        CREATE UNIQUE INDEX "uid_roles_builtin_name" ON "roles" ("name") WHERE "tenant_id" IS NULL;
+        ALTER TABLE "user_roles" ADD "tenant_id" INT;
+        UPDATE "user_roles" ur SET "tenant_id" = u."tenant_id" FROM "users" u WHERE u."id" = ur."users_id";
+        ALTER TABLE "user_roles" ALTER COLUMN "tenant_id" SET NOT NULL;
+        CREATE INDEX "idx_user_roles_tenant_role" ON "user_roles" ("tenant_id", "role_id", "users_id");
+        CREATE OR REPLACE FUNCTION "user_roles_set_tenant"() RETURNS trigger AS $$
+BEGIN
+    SELECT "tenant_id" INTO NEW."tenant_id" FROM "users" WHERE "id" = NEW."users_id";
+    IF EXISTS (
+        SELECT 1 FROM "roles"
+        WHERE "id" = NEW."role_id" AND "tenant_id" IS NOT NULL AND "tenant_id" <> NEW."tenant_id"
+    ) THEN
+        RAISE EXCEPTION 'Role % belongs to another tenant than user %', NEW."role_id", NEW."users_id"
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+        CREATE TRIGGER "trg_user_roles_set_tenant" BEFORE INSERT OR UPDATE ON "user_roles"
+    FOR EACH ROW EXECUTE FUNCTION "user_roles_set_tenant"();
+        ALTER TABLE "change_events" ADD "tenant_id" INT;
+        CREATE INDEX "idx_change_events_tenant_id" ON "change_events" ("tenant_id", "id");
+        ALTER TABLE "jobs" ADD "tenant_id" INT;
+        UPDATE "jobs" SET "tenant_id" = 1;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "jobs" DROP COLUMN "tenant_id";
+        DROP INDEX IF EXISTS "idx_change_events_tenant_id";
+        ALTER TABLE "change_events" DROP COLUMN "tenant_id";
+        DROP TRIGGER IF EXISTS "trg_user_roles_set_tenant" ON "user_roles";
+        DROP FUNCTION IF EXISTS "user_roles_set_tenant"();
+        DROP INDEX IF EXISTS "idx_user_roles_tenant_role";
+        ALTER TABLE "user_roles" DROP COLUMN "tenant_id";
+        DELETE FROM "roles" WHERE "tenant_id" IS NOT NULL;
+        DROP INDEX IF EXISTS "uid_roles_builtin_name";
+        DROP INDEX IF EXISTS "uid_roles_tenant_id_name";
+        ALTER TABLE "roles" DROP COLUMN "tenant_id";
+        CREATE UNIQUE INDEX "uid_roles_name_e5bfae" ON "roles" ("name");
+        DELETE FROM "users" WHERE "tenant_id" <> 1;
+        DROP INDEX IF EXISTS "idx_users_email_prefix";
+        CREATE INDEX "idx_users_email_prefix" ON "users" (lower("email") text_pattern_ops);
+        DROP INDEX IF EXISTS "idx_users_username_prefix";
+        CREATE INDEX "idx_users_username_prefix" ON "users" (lower("username") text_pattern_ops);
+        DROP INDEX IF EXISTS "idx_users_id_live";
+        CREATE INDEX "idx_users_id_live" ON "users" ("id") WHERE "deleted_at" IS NULL;
+        DROP INDEX IF EXISTS "idx_users_email_active";
+        CREATE INDEX "idx_users_email_active" ON "users" ("email") WHERE "is_active" AND "deleted_at" IS NULL;
+        DROP INDEX IF EXISTS "uid_users_tenant_id_email";
+        CREATE UNIQUE INDEX "uid_users_email_133a6f" ON "users" ("email");
+        ALTER TABLE "users" DROP COLUMN "tenant_id";
+        DROP TABLE IF EXISTS "tenants";"""
@@ -0,0 +1,26 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "users" ADD "is_service" BOOL NOT NULL DEFAULT FALSE;
+        CREATE TABLE IF NOT EXISTS "api_keys" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "prefix" VARCHAR(12) NOT NULL UNIQUE,
+    "key_hash" VARCHAR(64) NOT NULL,
+    "name" VARCHAR(64) NOT NULL,
+    "scopes" JSONB,
+    "last_used_at" TIMESTAMPTZ,
+    "expires_at" TIMESTAMPTZ,
+    "revoked_at" TIMESTAMPTZ,
+    "user_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE
+);
+        CREATE INDEX "idx_api_keys_user_id_active" ON "api_keys" ("user_id", "created_at") WHERE "revoked_at" IS NULL;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "api_keys";
+        ALTER TABLE "users" DROP COLUMN "is_service";"""
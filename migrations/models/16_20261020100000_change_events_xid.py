@@ -0,0 +1,13 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "change_events" ADD "xid" xid8 NOT NULL DEFAULT pg_current_xact_id();
+        CREATE INDEX "idx_change_events_xid" ON "change_events" ("xid", "id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_change_events_xid";
+        ALTER TABLE "change_events" DROP COLUMN "xid";"""
@@ -0,0 +1,48 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "roles" ADD "additional_scopes" JSONB NOT NULL DEFAULT '[]';
+        ALTER TABLE "roles" ADD "excluded_scopes" JSONB NOT NULL DEFAULT '[]';
+        CREATE TABLE "role_parents" (
+    "role_id" INT NOT NULL REFERENCES "roles" ("id") ON DELETE CASCADE,
+    "parent_id" INT NOT NULL REFERENCES "roles" ("id") ON DELETE CASCADE
+);
+        CREATE TABLE IF NOT EXISTS "role_graph" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "version" BIGINT NOT NULL  DEFAULT 1
+);
+        INSERT INTO "role_graph" ("id", "version") VALUES (1, 1);
+        UPDATE "roles" SET "additional_scopes" = '["users:me", "equipment:read", "requests:create", "requests:read"]'
+    WHERE "name" = 'student';
+        UPDATE "roles" SET "additional_scopes" = '["equipment:create", "equipment:update", "equipment:delete", "requests:approve", "reports:read"]'
+    WHERE "name" = 'manager';
+        UPDATE "roles" SET "additional_scopes" = '["users:read", "users:create", "requests:update", "requests:approve", "reports:read", "reports:export", "roles:manage"]'
+    WHERE "name" = 'admin';
+        UPDATE "roles" SET "additional_scopes" = '["admin:full"]'
+    WHERE "name" = 'superadmin';
+        UPDATE "roles" SET "excluded_scopes" = '["users:create", "requests:update", "requests:approve", "roles:manage"]'
+    WHERE "name" = 'readonly_admin';
+        UPDATE "roles" SET "excluded_scopes" = '["equipment:delete"]'
+    WHERE "name" = 'junior_manager';
+        INSERT INTO "role_parents" ("role_id", "parent_id")
+    SELECT r."id", p."id" FROM "roles" r JOIN "roles" p ON (r."name", p."name") IN (
+        ('teacher', 'student'),
+        ('manager', 'student'),
+        ('admin', 'student'),
+        ('superadmin', 'admin'),
+        ('superadmin', 'manager'),
+        ('readonly_admin', 'admin'),
+        ('junior_manager', 'manager')
+    );"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "role_graph";
+        DROP TABLE IF EXISTS "role_parents";
+        ALTER TABLE "roles" DROP COLUMN "excluded_scopes";
+        ALTER TABLE "roles" DROP COLUMN "additional_scopes";"""
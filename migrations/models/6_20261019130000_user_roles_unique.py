@@ -0,0 +1,13 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE UNIQUE INDEX IF NOT EXISTS "uidx_user_roles_users_id_role_id" ON "user_roles" ("users_id", "role_id");
+        CREATE UNIQUE INDEX IF NOT EXISTS "uidx_role_parents_role_id_parent_id" ON "role_parents" ("role_id", "parent_id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "uidx_role_parents_role_id_parent_id";
+        DROP INDEX IF EXISTS "uidx_user_roles_users_id_role_id";"""
@@ -0,0 +1,215 @@
+"""
+Time migrations on a populated database and check the plans of hot queries.
+
+    uv run python -m scripts.bench_migrations --db-url asyncpg://... --since 11
+
+Populate a scratch database with `scripts.generate_users` first (1M users is the
+reference size). Migrations from --since on are rolled back and applied again, each in
+its own transaction, so their duration reflects the data they rewrite or index; the
+`aerich` table is left as it was. Hot queries are then run under EXPLAIN ANALYZE, and
+the script exits with status 1 when one of them scans a large table sequentially.
+Never point it at production: rolling back drops columns, tables and their data.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import time
+from pathlib import Path
+
+from tortoise import Tortoise
+
+MIGRATIONS = Path(__file__).resolve().parent.parent / "migrations" / "models"
+# Queries behind login, listings, search, role membership, event feeds and API keys
+QUERIES = {
+    "active_by_email": (
+        'SELECT * FROM "users" WHERE "tenant_id" = $1 AND "email" = $2 '
+        'AND "is_active" AND "deleted_at" IS NULL',
+        ("tenant_id", "email"),
+    ),
+    "by_email": (
+        'SELECT * FROM "users" WHERE "tenant_id" = $1 AND "email" = $2',
+        ("tenant_id", "email"),
+    ),
+    "list_version": (
+        'SELECT count(*), max("updated_at") FROM "users" '
+        'WHERE "tenant_id" = $1 AND "deleted_at" IS NULL',
+        ("tenant_id",),
+    ),
+    "search_prefix": (
+        'SELECT "id" FROM "users" '
+        'WHERE (lower("username") LIKE $2 OR lower("email") LIKE $2) '
+        'AND "tenant_id" = $1 AND "deleted_at" IS NULL AND "id" > 0 '
+        'ORDER BY "id" LIMIT 51',
+        ("tenant_id", "prefix"),
+    ),
+    "search_fuzzy": (
+        'SELECT "id" FROM "users" '
+        'WHERE (lower("username") % $2 OR lower("email") % $2) '
+        'AND "tenant_id" = $1 AND "deleted_at" IS NULL',
+        ("tenant_id", "username"),
+    ),
+    "user_roles": (
+        'SELECT "role_id" FROM "user_roles" WHERE "users_id" = $1',
+        ("user_id",),
+    ),
+    "role_members": (
+        'SELECT "users_id" FROM "user_roles" WHERE "tenant_id" = $1 AND "role_id" = $2 '
+        'AND "users_id" > $3 ORDER BY "users_id" LIMIT 50',
+        ("tenant_id", "role_id", "user_id"),
+    ),
+    "scope_holders": (
+        'SELECT "id" FROM "users" WHERE "id" IN ('
+        'SELECT DISTINCT m."users_id" FROM unnest($2::int[]) AS g("role_id") '
+        'CROSS JOIN LATERAL (SELECT ur."users_id" FROM "user_roles" ur '
+        'JOIN "users" u ON u."id" = ur."users_id" AND u."deleted_at" IS NULL '
+        'WHERE ur."tenant_id" = $1 AND ur."role_id" = g."role_id" AND ur."users_id" > 0 '
+        'ORDER BY ur."users_id" LIMIT 51) AS m ORDER BY 1 LIMIT 51) ORDER BY "id"',
+        ("tenant_id", "role_ids"),
+    ),
+    "events_after": (
+        'SELECT * FROM "change_events" WHERE ("tenant_id" = $1 OR "tenant_id" IS NULL) '
+        'AND "xid" > $2::text::xid8 AND "xid" < pg_snapshot_xmin(pg_current_snapshot()) '
+        'ORDER BY "xid", "id" LIMIT 101',
+        ("tenant_id", "event_position"),
+    ),
+    "active_sessions": (
+        'SELECT * FROM "sessions" WHERE "user_id" = $1 AND "revoked_at" IS NULL',
+        ("user_id",),
+    ),
+    "api_key_prefix": (
+        'SELECT * FROM "api_keys" WHERE "prefix" = $1',
+        ("api_key_prefix",),
+    ),
+}
+
+
+def load_migrations(since: int) -> list[tuple[int, str, object]]:
+    """(number, name, module) of migrations numbered `since` and up, in order"""
+    migrations = []
+    for path in MIGRATIONS.glob("[0-9]*_*.py"):
+        number = int(path.name.partition("_")[0])
+        if number >= since:
+            spec = importlib.util.spec_from_file_location(path.stem, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            migrations.append((number, path.stem, module))
+    return sorted(migrations, key=lambda migration: migration[0])
+
+
+async def replay(connection, db, since: int) -> None:
+    migrations = load_migrations(since)
+    timings = {}
+    for direction, order in (("downgrade", reversed), ("upgrade", iter)):
+        for _, name, module in order(migrations):
+            sql = await getattr(module, direction)(db)
+            started = time.perf_counter()
+            async with connection.transaction():
+                await connection.execute(sql)
+            timings[name, direction] = time.perf_counter() - started
+
+    await connection.execute("ANALYZE")
+    for _, name, _ in migrations:
+        print(
+            f"{name:<48}upgrade={timings[name, 'upgrade']:8.2f} s  "
+            f"downgrade={timings[name, 'downgrade']:8.2f} s"
+        )
+
+
+async def sample_params(connection) -> dict:
+    """Parameters that hit real rows: a live user from the middle of the table"""
+    user = await connection.fetchrow(
+        'SELECT "id", "tenant_id", "username", "email" FROM "users" '
+        'WHERE "id" >= (SELECT (min("id") + max("id")) / 2 FROM "users") '
+        'AND "is_active" AND "deleted_at" IS NULL ORDER BY "id" LIMIT 1'
+    )
+    if user is None:
+        raise SystemExit("No users, run scripts.generate_users first")
+    role_id = await connection.fetchval(
+        'SELECT "role_id" FROM "user_roles" WHERE "users_id" = $1 LIMIT 1', user["id"]
+    )
+    event_position = await connection.fetchval(
+        'SELECT coalesce(min("xid")::text, \'0\') FROM "change_events"'
+    )
+    return {
+        "user_id": user["id"],
+        "tenant_id": user["tenant_id"],
+        "username": user["username"],
+        "email": user["email"],
+        "prefix": user["username"][:3] + "%",
+        "role_id": role_id,
+        "role_ids": [role_id],
+        "event_position": event_position,
+        "api_key_prefix": "qsu_00000000",
+    }
+
+
+def seq_scans(plan: dict, large: set[str]) -> list[str]:
+    """Large tables the plan reads with a sequential scan"""
+    found = []
+    if plan["Node Type"] == "Seq Scan" and plan["Relation Name"] in large:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        found.extend(seq_scans(child, large))
+    return found
+
+
+async def check_plans(connection, min_rows: int) -> list[str]:
+    """
+    Run the hot queries under EXPLAIN ANALYZE
+    :param min_rows: Tables with at least this many (estimated) rows count as large
+    :return: Names of queries that scan a large table sequentially
+    """
+    large = {
+        row["relname"]
+        for row in await connection.fetch(
+            "SELECT relname FROM pg_class "
+            "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace "
+            "AND reltuples >= $1",
+            min_rows,
+        )
+    }
+    params = await sample_params(connection)
+    failed = []
+    for name, (sql, args) in QUERIES.items():
+        explained = await connection.fetchval(
+            f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}",
+            *(params[arg] for arg in args),
+        )
+        result = json.loads(explained)[0]
+        scans = seq_scans(result["Plan"], large)
+        print(
+            f"{name:<24}{result['Execution Time']:10.2f} ms  "
+            f"{'seq scan on ' + ', '.join(scans) if scans else 'ok'}"
+        )
+        if scans:
+            failed.append(name)
+    return failed
+
+
+async def main(args: argparse.Namespace) -> int:
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["v1.app.models"]})
+    db = Tortoise.get_connection("default")
+    try:
+        async with db.acquire_connection() as connection:
+            if args.since is not None:
+                await replay(connection, db, args.since)
+            failed = await check_plans(connection, args.min_rows)
+    finally:
+        await Tortoise.close_connections()
+
+    if failed:
+        print(f"Sequential scans on large tables: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", required=True)
+    parser.add_argument(
+        "--since", type=int, help="Replay migrations from this number on"
+    )
+    parser.add_argument("--min-rows", type=int, default=10_000)
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
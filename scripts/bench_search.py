@@ -0,0 +1,75 @@
+"""
+Measure `UserCRUD.search` latency percentiles on a populated database.
+
+    uv run python -m scripts.bench_search --db-url asyncpg://... --queries 2000
+
+Populate the database with `scripts.generate_users` first (1M users is the reference size).
+Queries are drawn from the generator's vocabulary; the script exits with status 1
+when the p99 of any mode exceeds --target-ms.
+The app settings are imported, so the usual env files and variables must be present.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from tortoise import Tortoise
+
+from scripts.generate_users import SYLLABLES, make_username
+from v1.app import UserCRUD
+
+
+def make_query(rng: random.Random, fuzzy: bool) -> str:
+    if not fuzzy:
+        return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+    # A generated username with one character changed, as a typo would
+    name = list(make_username(rng))
+    name[rng.randrange(len(name))] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    return "".join(name)
+
+
+async def measure(mode: str, args: argparse.Namespace) -> float:
+    rng = random.Random(args.seed)
+    fuzzy = mode == "fuzzy"
+    timings = []
+    for _ in range(args.queries):
+        query = make_query(rng, fuzzy)
+        started = time.perf_counter()
+        _, cursor = await UserCRUD.search(query, fuzzy=fuzzy, limit=args.limit)
+        # Follow one page to include keyset continuation in the sample
+        if cursor and rng.random() < 0.25:
+            await UserCRUD.search(query, fuzzy=fuzzy, limit=args.limit, after=cursor)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    cuts = statistics.quantiles(timings, n=100)
+    print(
+        f"{mode:<8}p50={cuts[49]:8.2f} ms  p95={cuts[94]:8.2f} ms  "
+        f"p99={cuts[98]:8.2f} ms  max={max(timings):8.2f} ms"
+    )
+    return cuts[98]
+
+
+async def main(args: argparse.Namespace) -> int:
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["v1.app.models"]})
+    try:
+        p99 = {mode: await measure(mode, args) for mode in ("prefix", "fuzzy")}
+    finally:
+        await Tortoise.close_connections()
+
+    if slow := [mode for mode, value in p99.items() if value > args.target_ms]:
+        print(f"p99 above {args.target_ms} ms: {', '.join(slow)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", required=True)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--target-ms", type=float, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
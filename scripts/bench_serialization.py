@@ -0,0 +1,98 @@
+"""
+Compare the ORM + pydantic_model_creator response path with the `.values()` fast path
+used by `GET /users/` and `GET /roles/`.
+
+    uv run python -m scripts.bench_serialization --users 5000 --roles 7
+
+Runs against an in-memory SQLite database unless --db-url is given.
+The app settings are imported, so the usual env files and variables must be present.
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from tortoise import Tortoise
+
+from v1.app import RoleCRUD, UserCRUD, models, schemas
+from v1.app.serialization import json_response
+
+
+async def populate(users: int, roles: int, roles_per_user: int) -> None:
+    await models.Role.bulk_create([models.Role(name=f"role{i}") for i in range(roles)])
+    await models.User.bulk_create(
+        [
+            models.User(
+                username=f"user{i}",
+                email=f"user{i}@example.com",
+                password_hash="x",
+                is_active=True,
+            )
+            for i in range(users)
+        ],
+        batch_size=1000,
+    )
+
+    role_objs = await models.Role.all()
+    for i, user in enumerate(await models.User.all()):
+        await user.roles.add(
+            *(role_objs[(i + j) % roles] for j in range(roles_per_user))
+        )
+
+
+async def orm_path(crud, schema) -> bytes:
+    field = create_model_field("response", list[schema])
+    content = await serialize_response(
+        field=field, response_content=await crud.get_all()
+    )
+    return JSONResponse(content).body
+
+
+async def values_path(crud) -> bytes:
+    return json_response(await crud.get_all_rows()).body
+
+
+async def measure(label: str, fn, repeat: int) -> None:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await fn()
+        best = min(best, time.perf_counter() - started)
+
+    print(f"{label:<24}{best * 1000:10.1f} ms{len(body) / 1024:12.1f} KiB")
+
+
+async def main(args: argparse.Namespace) -> None:
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["v1.app.models"]})
+    await Tortoise.generate_schemas()
+    try:
+        await populate(args.users, args.roles, args.roles_per_user)
+
+        print(f"{'path':<24}{'best':>13}{'body':>16}")
+        await measure(
+            "users: orm+pydantic",
+            lambda: orm_path(UserCRUD, schemas.UserSchema),
+            args.repeat,
+        )
+        await measure("users: values", lambda: values_path(UserCRUD), args.repeat)
+        await measure(
+            "roles: orm+pydantic",
+            lambda: orm_path(RoleCRUD, schemas.RoleSchema),
+            args.repeat,
+        )
+        await measure("roles: values", lambda: values_path(RoleCRUD), args.repeat)
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--roles", type=int, default=7)
+    parser.add_argument("--roles-per-user", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
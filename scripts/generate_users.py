@@ -0,0 +1,198 @@
+"""
+Fill the database with generated users for load and latency testing.
+
+    uv run python -m scripts.generate_users --db-url asyncpg://... --users 1000000
+
+Users and their role links are written with COPY in batches. Roles follow a
+production-like mix (mostly students, a few staff, a handful of admins; some users
+hold two roles), a small share of users is inactive or soft-deleted, and
+materialized scopes are filled in, so queries see realistic data.
+The same --seed and --first-id always produce the same rows: IDs, e-mails, roles and
+timestamps. Run it against a migrated database (`aerich upgrade`) whose IDs from
+--first-id on are free, never against production.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from tortoise import Tortoise
+
+from v1.app import role_graph
+
+SYLLABLES = (
+    "an", "bel", "cor", "da", "el", "fin", "gar", "hal", "is", "jo", "ka", "lin",
+    "mar", "nor", "ol", "per", "qui", "ros", "sam", "tor", "ul", "val", "wen", "yas",
+)  # fmt: skip
+DOMAINS = ("example.com", "example.org", "example.net", "mail.test", "corp.test")
+# Share of users per built-in role
+ROLE_WEIGHTS = {
+    "student": 0.80,
+    "teacher": 0.12,
+    "manager": 0.04,
+    "junior_manager": 0.02,
+    "admin": 0.015,
+    "readonly_admin": 0.004,
+    "superadmin": 0.001,
+}
+# Share of users holding a second role, e.g. teachers who also manage equipment
+SECOND_ROLE_RATE = 0.08
+INACTIVE_RATE = 0.04
+DELETED_RATE = 0.01
+# Timestamps are spread over the three years before this point, independent of the clock
+EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+SPREAD_SECONDS = 3 * 365 * 24 * 3600
+USER_COLUMNS = (
+    "id",
+    "tenant_id",
+    "username",
+    "email",
+    "password_hash",
+    "is_active",
+    "effective_scopes",
+    "deleted_at",
+    "created_at",
+    "updated_at",
+)
+LINK_COLUMNS = ("users_id", "role_id", "tenant_id")
+# Not a valid bcrypt/argon2 hash, so generated users can never log in
+PASSWORD_HASH = "!"
+
+
+def make_username(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def pick_roles(rng: random.Random) -> list[str]:
+    names, weights = list(ROLE_WEIGHTS), list(ROLE_WEIGHTS.values())
+    roles = rng.choices(names, weights)
+    if rng.random() < SECOND_ROLE_RATE:
+        second = rng.choices(names, weights)[0]
+        if second != roles[0]:
+            roles.append(second)
+    return roles
+
+
+def generate(
+    seed: int,
+    start: int,
+    count: int,
+    first_id: int,
+    tenant_id: int,
+    role_ids: dict[str, int],
+    scopes: dict[frozenset[str], str],
+) -> tuple[list[tuple], list[tuple]]:
+    """
+    COPY records for users numbered `start` to `start + count - 1`
+    :param first_id: ID of user number 0
+    :param role_ids: Role name -> ID
+    :param scopes: Role set -> JSON of its materialized scopes
+    :return: (users records, user_roles records)
+    """
+    rng = random.Random(seed * 1_000_003 + start)
+    users, links = [], []
+    for number in range(start, start + count):
+        user_id = first_id + number
+        username = make_username(rng)
+        # Unique across seeds, and independent of the rows already in the database
+        email = f"{username}.{seed}.{number}@{rng.choice(DOMAINS)}"
+        roles = pick_roles(rng)
+
+        created_at = EPOCH - timedelta(seconds=rng.randrange(SPREAD_SECONDS))
+        deleted_at = None
+        if rng.random() < DELETED_RATE:
+            deleted_at = created_at + (EPOCH - created_at) * rng.random()
+        is_active = deleted_at is None and rng.random() >= INACTIVE_RATE
+
+        users.append(
+            (
+                user_id,
+                tenant_id,
+                username,
+                email,
+                PASSWORD_HASH,
+                is_active,
+                scopes[frozenset(roles)],
+                deleted_at,
+                created_at,
+                deleted_at or created_at,
+            )
+        )
+        links.extend((user_id, role_ids[role], tenant_id) for role in roles)
+
+    return users, links
+
+
+def scope_sets(
+    snapshot: role_graph.RoleGraphSnapshot, role_ids: dict[str, int]
+) -> dict[frozenset[str], str]:
+    """Materialized scopes (as JSON) of every role set `pick_roles` can produce"""
+    sets = {}
+    for first in ROLE_WEIGHTS:
+        for second in ROLE_WEIGHTS:
+            roles = frozenset((first, second))
+            scopes = set()
+            for role in roles:
+                scopes.update(snapshot.scopes_for_id(role_ids[role]))
+            sets[roles] = json.dumps(sorted(scopes))
+    return sets
+
+
+async def main(args: argparse.Namespace) -> None:
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["v1.app.models"]})
+    db = Tortoise.get_connection("default")
+    try:
+        snapshot = await role_graph.refresh()
+        role_ids = {name: snapshot.role_ids.get(name) for name in ROLE_WEIGHTS}
+        if missing := [name for name, role_id in role_ids.items() if role_id is None]:
+            raise SystemExit(
+                f"Roles {missing} are missing, start the app once to seed roles"
+            )
+        scopes = scope_sets(snapshot, role_ids)
+
+        started = time.perf_counter()
+        async with db.acquire_connection() as connection:
+            for start in range(0, args.users, args.batch_size):
+                count = min(args.batch_size, args.users - start)
+                users, links = generate(
+                    args.seed,
+                    start,
+                    count,
+                    args.first_id,
+                    args.tenant_id,
+                    role_ids,
+                    scopes,
+                )
+                async with connection.transaction():
+                    await connection.copy_records_to_table(
+                        "users", records=users, columns=USER_COLUMNS
+                    )
+                    await connection.copy_records_to_table(
+                        "user_roles", records=links, columns=LINK_COLUMNS
+                    )
+                elapsed = time.perf_counter() - started
+                print(f"{start + count:>10} users  {elapsed:8.1f} s")
+
+            # IDs were set explicitly, move the sequence past them
+            await connection.execute(
+                "SELECT setval(pg_get_serial_sequence('users', 'id'), "
+                '(SELECT max("id") FROM "users"))'
+            )
+            await connection.execute('ANALYZE "users", "user_roles"')
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", required=True)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tenant-id", type=int, default=1)
+    # Well clear of the users the app itself creates
+    parser.add_argument("--first-id", type=int, default=1_000_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,49 @@
+async def test_restricted_key_cannot_use_admin_routes(client, admin_headers):
+    response = await client.post(
+        "/service-accounts/",
+        json={"name": "scope-check", "roles": ["superadmin"]},
+        headers=admin_headers,
+    )
+    assert response.status_code == 200, response.text
+    account_id = response.json()["id"]
+
+    keys = {}
+    for name, scopes in (("restricted", ["users:read"]), ("full", None)):
+        response = await client.post(
+            f"/service-accounts/{account_id}/keys",
+            json={"name": name, "scopes": scopes},
+            headers=admin_headers,
+        )
+        assert response.status_code == 201, response.text
+        keys[name] = {"Authorization": f"Bearer {response.json()['key']}"}
+
+    # The account holds admin:full, but the key was limited to users:read
+    response = await client.get(
+        f"/service-accounts/{account_id}/keys", headers=keys["restricted"]
+    )
+    assert response.status_code == 403
+    assert response.headers["WWW-Authenticate"] == 'Bearer scope="admin:full"'
+
+    response = await client.get(
+        f"/service-accounts/{account_id}/keys", headers=keys["full"]
+    )
+    assert response.status_code == 200
+    assert {key["name"] for key in response.json()} == {"restricted", "full"}
+
+
+async def test_access_token_limited_to_requested_scopes(client):
+    response = await client.post(
+        "/token",
+        data={
+            "username": "admin@example.com",
+            "password": "admin123",
+            "scope": "users:me",
+        },
+    )
+    assert response.status_code == 200, response.text
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    assert (await client.get("/users/me", headers=headers)).status_code == 200
+    assert (
+        await client.get("/service-accounts/1/keys", headers=headers)
+    ).status_code == 403
@@ -0,0 +1,46 @@
+from tortoise.transactions import in_transaction
+
+from tests.conftest import connect
+from v1.app import EventCRUD
+
+
+async def _record(kind: str, count: int = 1) -> None:
+    async with in_transaction():
+        for _ in range(count):
+            await EventCRUD.record(kind, 0, None)
+
+
+async def _kinds_after(cursor: int, limit: int = 100) -> list[str]:
+    return [event["kind"] for event in await EventCRUD.get_after(cursor, limit)]
+
+
+async def test_events_held_back_until_older_transactions_finish(app):
+    start = max([e["position"] for e in await EventCRUD.get_after(0, 10_000)] or [0])
+
+    slow = await connect()
+    try:
+        transaction = slow.transaction()
+        await transaction.start()
+        # Takes its transaction id (and an event id) before the next change commits
+        await slow.execute(
+            'INSERT INTO "change_events" ("kind", "entity_id", "payload") '
+            "VALUES ('slow', 0, '{}')"
+        )
+        await _record("fast")
+
+        # Delivering "fast" now would move the cursor past "slow" for good
+        assert await _kinds_after(start) == []
+        await transaction.commit()
+    finally:
+        await slow.close()
+
+    assert await _kinds_after(start) == ["slow", "fast"]
+
+
+async def test_transactions_not_split_across_pages(app):
+    start = max([e["position"] for e in await EventCRUD.get_after(0, 10_000)] or [0])
+    await _record("first", 2)
+    await _record("second", 2)
+
+    assert await _kinds_after(start, limit=3) == ["first", "first"]
+    assert await _kinds_after(start, limit=1) == ["first", "first"]
@@ -0,0 +1,101 @@
+import asyncpg
+import pytest
+
+from tests.conftest import connect, load_migrations
+
+# Shaped like the sign-up statement of `UserCRUD.create`
+SIGN_UP = """
+    WITH inserted AS (
+        INSERT INTO "users" ("tenant_id", "username", "email", "password_hash", "is_active")
+        VALUES ($1, $2::text, $2::text, '!', TRUE)
+        RETURNING "id"
+    ), linked AS (
+        INSERT INTO "user_roles" ("users_id", "role_id") SELECT "id", $3 FROM inserted
+    )
+    SELECT "id" FROM inserted
+"""
+
+
+async def _migrate(connection, migrations, direction: str) -> None:
+    for _, module in migrations:
+        await connection.execute(await getattr(module, direction)(None))
+
+
+async def test_tenants_migration_round_trip():
+    migrations = load_migrations()
+    before = [m for m in migrations if m[0] < 13]
+    tenants = [m for m in migrations if m[0] == 13]
+
+    connection = await connect()
+    transaction = connection.transaction()
+    await transaction.start()
+    try:
+        # A scratch schema, discarded with the transaction
+        await connection.execute(
+            'CREATE SCHEMA "migration_test";'
+            'SET LOCAL search_path TO "migration_test", public;'
+        )
+        await _migrate(connection, before, "upgrade")
+        role_id = await connection.fetchval(
+            'INSERT INTO "roles" ("name") VALUES (\'student\') RETURNING "id"'
+        )
+        user_id = await connection.fetchval(
+            'INSERT INTO "users" ("username", "email", "password_hash", "is_active") '
+            "VALUES ('old', 'old@example.com', '!', TRUE) RETURNING \"id\""
+        )
+        await connection.execute(
+            'INSERT INTO "user_roles" ("users_id", "role_id") VALUES ($1, $2)',
+            user_id,
+            role_id,
+        )
+
+        for _ in range(2):
+            await _migrate(connection, tenants, "upgrade")
+            # Existing rows land in the default tenant
+            assert (
+                await connection.fetchval(
+                    'SELECT "tenant_id" FROM "user_roles" WHERE "users_id" = $1',
+                    user_id,
+                )
+                == 1
+            )
+
+            tenant_id = await connection.fetchval(
+                'INSERT INTO "tenants" ("slug", "name") VALUES (\'acme\', \'Acme\') '
+                'RETURNING "id"'
+            )
+            new_user = await connection.fetchval(
+                SIGN_UP, tenant_id, "new@example.com", role_id
+            )
+            assert (
+                await connection.fetchval(
+                    'SELECT "tenant_id" FROM "user_roles" WHERE "users_id" = $1',
+                    new_user,
+                )
+                == tenant_id
+            )
+
+            custom_role = await connection.fetchval(
+                'INSERT INTO "roles" ("name", "tenant_id") VALUES (\'custom\', 1) '
+                'RETURNING "id"'
+            )
+            with pytest.raises(asyncpg.ForeignKeyViolationError):
+                async with connection.transaction():
+                    await connection.execute(
+                        'INSERT INTO "user_roles" ("users_id", "role_id") '
+                        "VALUES ($1, $2)",
+                        new_user,
+                        custom_role,
+                    )
+
+            # Down again: other tenants' users and roles go, the rest stays
+            await _migrate(connection, tenants, "downgrade")
+            assert await connection.fetch('SELECT "id" FROM "users"') == [(user_id,)]
+            assert await connection.fetchval('SELECT count(*) FROM "user_roles"') == 1
+            assert not await connection.fetchval(
+                "SELECT count(*) FROM pg_trigger "
+                "WHERE tgrelid = '\"user_roles\"'::regclass AND NOT tgisinternal"
+            )
+    finally:
+        await transaction.rollback()
+        await connection.close()
@@ -0,0 +1,31 @@
+import pytest
+
+from scripts.generate_users import PASSWORD_HASH, ROLE_WEIGHTS, generate
+from v1.app import auth
+
+
+def test_unrecognised_hash_never_verifies():
+    assert auth.verify_password("secret", auth.hash_password("secret"))
+    for stored in (PASSWORD_HASH, "", "plain-text"):
+        assert not auth.verify_password("secret", stored)
+
+
+def test_argon2_hash_without_argon2_cffi():
+    if auth.PasswordHasher is not None:
+        pytest.skip("argon2-cffi is installed")
+    with pytest.raises(RuntimeError, match="argon2-cffi"):
+        auth.verify_password("secret", "$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$aGFzaA")
+
+
+def test_generated_users_are_deterministic():
+    role_ids = {name: number for number, name in enumerate(ROLE_WEIGHTS, 1)}
+    scopes = {
+        frozenset((first, second)): "[]"
+        for first in ROLE_WEIGHTS
+        for second in ROLE_WEIGHTS
+    }
+
+    users, links = generate(7, 100, 50, 1_000_000, 1, role_ids, scopes)
+    assert (users, links) == generate(7, 100, 50, 1_000_000, 1, role_ids, scopes)
+    assert users[0][0] == 1_000_100
+    assert ".7.100@" in users[0][3]
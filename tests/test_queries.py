@@ -0,0 +1,33 @@
+from v1.app import UserCRUD
+from v1.instrumentation import max_queries
+from v1.settings import settings
+
+
+async def test_current_user_query_budget(client, admin_headers):
+    # The user and its roles
+    with max_queries(2):
+        response = await client.get("/users/me", headers=admin_headers)
+    assert response.status_code == 200
+
+
+async def test_user_listing_query_count_is_constant(client, admin_headers):
+    with max_queries(5) as stats:
+        assert (await client.get("/users/", headers=admin_headers)).status_code == 200
+
+    for n in range(5):
+        await UserCRUD.create_service_account(f"listed-{n}", ["student"])
+
+    # Roles are read in one query for all users, not one per user
+    with max_queries(stats.count):
+        assert (await client.get("/users/", headers=admin_headers)).status_code == 200
+
+
+async def test_metrics_require_the_scrape_token(client, monkeypatch):
+    monkeypatch.setattr(settings.telemetry, "metrics_token", "scrape-secret")
+
+    assert (await client.get("/metrics")).status_code == 401
+    response = await client.get(
+        "/metrics", headers={"Authorization": "Bearer scrape-secret"}
+    )
+    assert response.status_code == 200
+    assert "db_queries" in response.text
@@ -0,0 +1,62 @@
+import pytest
+
+from v1.app import RoleCRUD, UserCRUD, models, schemas
+from v1.app.jobs import runner
+
+
+async def test_interrupted_role_deletion_resumes(app):
+    role, _ = await RoleCRUD.create(
+        schemas.RolePayload(name="auditor", additional_scopes=["users:read"])
+    )
+    members = [
+        await UserCRUD.create_service_account(f"auditor-{n}", ["auditor"])
+        for n in range(3)
+    ]
+    assert all(member.effective_scopes == ["users:read"] for member in members)
+
+    async def interrupt(synced: int, total: int) -> None:
+        raise RuntimeError("interrupted")
+
+    with pytest.raises(RuntimeError):
+        await RoleCRUD.delete_role("auditor", progress=interrupt, batch_size=1)
+
+    # The role is gone and its deletion recorded even though the resync stopped early
+    assert not await models.Role.exists(id=role.id)
+    event = await models.ChangeEvent.get(kind="role.deleted", entity_id=role.id)
+    assert event.payload == {"name": "auditor", "users": 3}
+    assert await UserCRUD.has_pending_scopes()
+
+    assert await UserCRUD.resync_scopes() == 2
+    assert not await UserCRUD.has_pending_scopes()
+    for member in members:
+        await member.refresh_from_db(fields=["effective_scopes"])
+        assert member.effective_scopes == []
+
+
+async def test_deleted_users_leave_role_listings(app):
+    await RoleCRUD.create(
+        schemas.RolePayload(name="reviewer", additional_scopes=["users:read"])
+    )
+    member = await UserCRUD.create_service_account("reviewer-0", ["reviewer"])
+    version = await RoleCRUD.get_list_version()
+
+    def reviewers(roles: list[dict]) -> list[int]:
+        role = next(role for role in roles if role["name"] == "reviewer")
+        return [user["id"] for user in role["users"]]
+
+    assert reviewers(await RoleCRUD.get_all_rows()) == [member.id]
+
+    assert await UserCRUD.soft_delete(member.id)
+    assert reviewers(await RoleCRUD.get_all_rows()) == []
+    assert await RoleCRUD.get_list_version() != version
+
+
+async def test_boot_resync_job_is_submitted_once(app):
+    pending = await models.Job.create(kind="scopes.resync")
+
+    assert await runner.submit_once("scopes.resync", tenant_id=1) is None
+
+    pending.status = models.JobStatus.FAILED
+    await pending.save(update_fields=["status"])
+    job = await runner.submit_once("scopes.resync", tenant_id=1)
+    assert job is not None and job.tenant_id == 1
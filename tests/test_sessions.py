@@ -0,0 +1,79 @@
+import datetime as dt
+from datetime import datetime, timedelta
+
+from tests.conftest import ADMIN
+from v1.app import auth, crud
+from v1.app.models import DEFAULT_TENANT_ID
+from v1.settings import settings
+
+
+async def test_session_cookie_is_secure_and_logout_is_a_post(client):
+    response = await client.post("/token", data=ADMIN)
+    assert response.status_code == 200, response.text
+    set_cookie = response.headers["set-cookie"]
+    assert set_cookie.startswith("session=qss_")
+    for attribute in ("HttpOnly", "Secure", "SameSite=lax"):
+        assert attribute in set_cookie
+
+    # Secure cookies aren't sent back over http://test, so pass it explicitly
+    cookie = {"Cookie": set_cookie.split(";")[0]}
+    assert (await client.get("/users/me", headers=cookie)).status_code == 200
+
+    # A cross-site link or image can't log anyone out
+    assert (await client.get("/logout", headers=cookie)).status_code == 405
+
+    response = await client.post("/logout", headers=cookie)
+    assert response.status_code == 200, response.text
+    assert "Secure" in response.headers["set-cookie"]
+    assert (await client.get("/users/me", headers=cookie)).status_code == 401
+
+
+async def test_logout_everywhere_revokes_every_credential(client, monkeypatch):
+    response = await client.post("/token", data=ADMIN)
+    tokens = response.json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    cookie = {"Cookie": response.headers["set-cookie"].split(";")[0]}
+    assert (await client.get("/users/me", headers=cookie)).status_code == 200
+    token_id = auth.parse_session_cookie(cookie["Cookie"].partition("=")[2])
+    cached = crud._session_cache.get(token_id)
+    # Refresh token from before sessions existed: no `jti`
+    legacy = auth.create_refresh_token(ADMIN["username"], tenant_id=DEFAULT_TENANT_ID)
+
+    response = await client.post("/refresh", json={"refresh_token": legacy})
+    assert response.status_code == 401
+    cutoff = datetime.now(dt.UTC) + timedelta(days=1)
+    monkeypatch.setattr(settings.security, "legacy_refresh_tokens_until", cutoff)
+    response = await client.post("/refresh", json={"refresh_token": legacy})
+    assert response.status_code == 200, response.text
+
+    response = await client.post("/logout-everywhere", headers=headers)
+    assert response.status_code == 200, response.text
+    assert (await client.get("/users/me", headers=headers)).status_code == 401
+    assert (await client.get("/users/me", headers=cookie)).status_code == 401
+    # A worker that still has the session cached rejects the cookie too
+    crud._session_cache.set(token_id, cached)
+    assert (await client.get("/users/me", headers=cookie)).status_code == 401
+    for refresh_token in (tokens["refresh_token"], legacy):
+        response = await client.post("/refresh", json={"refresh_token": refresh_token})
+        assert response.status_code == 401
+
+    # Logging in again right away works
+    response = await client.post("/token", data=ADMIN)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert (await client.get("/users/me", headers=headers)).status_code == 200
+
+
+async def test_session_cookie_keeps_login_scopes_and_revocation(client):
+    response = await client.post("/token", data={**ADMIN, "scope": "users:me"})
+    assert response.status_code == 200, response.text
+    cookie = {"Cookie": response.headers["set-cookie"].split(";")[0]}
+
+    assert (await client.get("/users/me", headers=cookie)).status_code == 200
+    # The admin holds admin:full, but the login was limited to users:me
+    response = await client.get("/service-accounts/1/keys", headers=cookie)
+    assert response.status_code == 403
+
+    session_id = (await client.get("/sessions", headers=cookie)).json()[0]["id"]
+    response = await client.delete(f"/sessions/{session_id}", headers=cookie)
+    assert response.status_code == 200, response.text
+    assert (await client.get("/users/me", headers=cookie)).status_code == 401
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from tests.conftest import TEST_DATABASE_URL, connect, load_migrations
+
+ROOT = Path(__file__).resolve().parent.parent
+SCHEMA = "dev_boot"
+# Boots and stops a worker, the way uvicorn drives the lifespan
+BOOT = """
+import asyncio
+
+from main import application, lifespan
+
+
+async def boot():
+    async with lifespan(application):
+        pass
+
+
+asyncio.run(boot())
+"""
+
+
+async def test_dev_mode_boots_an_empty_database():
+    connection = await connect()
+    await connection.execute(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE')
+    await connection.execute(f'CREATE SCHEMA "{SCHEMA}"')
+    try:
+        separator = "&" if "?" in TEST_DATABASE_URL else "?"
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-c",
+            BOOT,
+            cwd=ROOT,
+            env={
+                **os.environ,
+                "STARTUP_MODE": "dev",
+                "DATABASE_URL": f"{TEST_DATABASE_URL}{separator}schema={SCHEMA}",
+            },
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        output, _ = await asyncio.wait_for(process.communicate(), 60)
+        assert process.returncode == 0, output.decode()
+
+        # The schema came from the migrations, not from the models
+        applied = await connection.fetchval(f'SELECT count(*) FROM "{SCHEMA}"."aerich"')
+        assert applied == len(load_migrations())
+        assert await connection.fetchval(
+            "SELECT to_regclass($1)", f'"{SCHEMA}"."uid_roles_builtin_name"'
+        )
+        assert await connection.fetchval(
+            f'SELECT count(*) FROM "{SCHEMA}"."users" WHERE "email" = $1',
+            "admin@example.com",
+        )
+    finally:
+        await connection.execute(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE')
+        await connection.close()
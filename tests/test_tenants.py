@@ -0,0 +1,80 @@
+import pytest
+
+from v1.app import RoleCRUD, TenantCRUD, UserCRUD, models, schemas
+
+ACME_ADMIN = {
+    "username": "acme-admin",
+    "email": "admin@acme.example.com",
+    "password": "acme-admin",
+}
+
+
+@pytest.fixture
+async def acme(app) -> models.Tenant:
+    tenant, _ = await TenantCRUD.create(
+        "acme", "Acme", schemas.UserPayload(**ACME_ADMIN)
+    )
+    # Sign-up grants the shared `user` role, which isn't seeded
+    await RoleCRUD.create(
+        schemas.RolePayload(name="user", inherits_from=["student"]), tenant_id=None
+    )
+    return tenant
+
+
+async def test_tenant_admin_cannot_profile_workers(client, admin_headers, acme):
+    response = await client.post(
+        "/token",
+        data={"username": ACME_ADMIN["email"], "password": ACME_ADMIN["password"]},
+        headers={"X-Tenant": acme.slug},
+    )
+    assert response.status_code == 200, response.text
+    acme_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    # Superadmin of its own tenant only
+    assert "admin:full" in response.json()["scopes"]
+    for path in ("/profiling/stalls", "/tenants/"):
+        assert (await client.get(path, headers=acme_headers)).status_code == 403
+        assert (await client.get(path, headers=admin_headers)).status_code == 200
+
+
+async def test_signup_links_roles_within_the_tenant(client, acme):
+    payload = {
+        "username": "jane",
+        "email": "jane@acme.example.com",
+        "password": "jane-pass",
+    }
+    response = await client.post("/users/", json=payload, headers={"X-Tenant": "acme"})
+    assert response.status_code == 200, response.text
+    # Same lean shape as the other user endpoints, no internal columns
+    assert set(response.json()) == set(schemas.UserOut.model_fields)
+    assert [role["name"] for role in response.json()["roles"]] == ["user"]
+
+    # The user, its role link and its event are written by one statement; the
+    # trigger fills in the link's tenant from the user inserted alongside
+    rows = await models.User._meta.db.execute_query_dict(
+        'SELECT "tenant_id" FROM "user_roles" WHERE "users_id" = $1',
+        [response.json()["id"]],
+    )
+    assert rows == [{"tenant_id": acme.id}]
+
+
+async def test_user_role_helpers_stay_in_their_tenant(acme):
+    member = await UserCRUD.create_service_account("helper-check", ["student"])
+    private, _ = await RoleCRUD.create(
+        schemas.RolePayload(name="acme-auditor"), tenant_id=acme.id
+    )
+
+    # Another tenant's user and custom role are out of reach
+    assert await UserCRUD.get_by_id(member.id, acme.id) is None
+    assert not await UserCRUD.add_role(member.id, "teacher", acme.id)
+    assert not await UserCRUD.add_role(member.id, private.name)
+    assert await RoleCRUD.get_by_id(private.id) is None
+    assert await RoleCRUD.get_by_id(private.id, acme.id) == private
+
+    assert await UserCRUD.add_role(member.id, "teacher")
+    assert await UserCRUD.has_role(member.id, "teacher")
+    assert not await UserCRUD.has_role(member.id, "teacher", acme.id)
+    assert {role.name for role in await UserCRUD.get_user_roles(member.id)} == {
+        "student",
+        "teacher",
+    }
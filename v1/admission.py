@@ -0,0 +1,186 @@
+import asyncio
+import heapq
+import itertools
+import time
+from fnmatch import fnmatchcase
+from functools import lru_cache
+
+from v1 import metrics
+from v1.settings import AdmissionClass, settings
+
+__all__ = ["Shed", "PriorityLimiter", "AdmissionController", "controller"]
+
+queue_depth = metrics.Gauge(
+    "admission_queue_depth", "Requests waiting for admission", labels=("limiter",)
+)
+in_flight = metrics.Gauge(
+    "admission_in_flight", "Admitted requests being served", labels=("limiter",)
+)
+shed_total = metrics.Counter(
+    "admission_shed_total",
+    "Requests rejected with 503 by admission control",
+    labels=("limiter", "reason"),
+)
+wait_seconds = metrics.Histogram(
+    "admission_wait_seconds",
+    "Time requests waited for admission",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    labels=("limiter",),
+)
+
+
+class Shed(Exception):
+    """The request can't be admitted: the queue is full or it waited too long"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class PriorityLimiter:
+    """
+    Concurrency limit with a bounded wait queue. \n
+    Freed slots go to the highest-priority waiter, first come first served within
+    a priority. Only the event loop thread may use it.
+    """
+
+    def __init__(self, name: str, limit: int, queue: int):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    async def acquire(self, priority: int = 0, timeout: float | None = None) -> None:
+        """
+        Take a slot, waiting up to `timeout` seconds for one
+        :raises Shed: The queue is full or the timeout expired
+        """
+        if self.active < self.limit and not self._waiters:
+            self._admit()
+            return
+
+        if len(self._waiters) >= self.queue:
+            shed_total.inc(limiter=self.name, reason="queue_full")
+            raise Shed("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        # heapq pops the smallest entry: negate so higher priorities come first
+        entry = (-priority, next(self._order), future)
+        heapq.heappush(self._waiters, entry)
+        queue_depth.inc(limiter=self.name)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            shed_total.inc(limiter=self.name, reason="timeout")
+            raise Shed("timeout") from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the client went away: pass the slot on
+                self.release()
+            raise
+        finally:
+            # Still queued unless `release` popped it
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                queue_depth.dec(limiter=self.name)
+            wait_seconds.observe(time.perf_counter() - started, limiter=self.name)
+
+    def release(self) -> None:
+        self.active -= 1
+        in_flight.dec(limiter=self.name)
+        while self._waiters and self.active < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            queue_depth.dec(limiter=self.name)
+            if not future.done():
+                self._admit()
+                future.set_result(None)
+
+    def _admit(self) -> None:
+        self.active += 1
+        in_flight.inc(limiter=self.name)
+
+
+class AdmissionController:
+    """
+    Maps requests to admission classes and holds their limiters. \n
+    A request takes a slot of its class, then one of the worker-wide limiter,
+    whose waiters are admitted by class priority.
+    """
+
+    def __init__(
+        self,
+        classes: dict[str, AdmissionClass],
+        routes: dict[str, str],
+        max_concurrency: int,
+        queue: int,
+    ):
+        self.classes = classes
+        self._exact = {
+            route: name for route, name in routes.items() if "*" not in route
+        }
+        self._patterns = [
+            (route, name) for route, name in routes.items() if "*" in route
+        ]
+        self.limiters = {
+            name: PriorityLimiter(name, cls.concurrency, cls.queue)
+            for name, cls in classes.items()
+            if cls.concurrency
+        }
+        self.worker = (
+            PriorityLimiter("worker", max_concurrency, queue)
+            if max_concurrency
+            else None
+        )
+        self.classify = lru_cache(maxsize=1024)(self._classify)
+
+    def _classify(self, method: str, path: str) -> str | None:
+        """Admission class of a request, None when no class applies"""
+        route = f"{method} {path}"
+        if (name := self._exact.get(route)) is None:
+            name = next(
+                (
+                    name
+                    for pattern, name in self._patterns
+                    if fnmatchcase(route, pattern)
+                ),
+                "default",
+            )
+        return name if name in self.classes else None
+
+    async def acquire(self, name: str) -> list[PriorityLimiter]:
+        """
+        Admit a request of the class
+        :return: Limiters to release once the request is done
+        :raises Shed: The class or the worker-wide limit refused the request
+        """
+        cls = self.classes[name]
+        deadline = time.monotonic() + cls.timeout
+        held = []
+        try:
+            for limiter in (self.limiters.get(name), self.worker):
+                if limiter is not None:
+                    timeout = max(deadline - time.monotonic(), 0)
+                    await limiter.acquire(cls.priority, timeout)
+                    held.append(limiter)
+        except BaseException:
+            self.release(held)
+            raise
+
+        return held
+
+    @staticmethod
+    def release(held: list[PriorityLimiter]) -> None:
+        for limiter in reversed(held):
+            limiter.release()
+
+
+controller = AdmissionController(
+    classes=settings.server.admission_classes,
+    routes=settings.server.admission_routes,
+    max_concurrency=settings.server.admission_max_concurrency,
+    queue=settings.server.admission_queue,
+)
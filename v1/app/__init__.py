@@ -1,2 +1,9 @@
-from .crud import RoleCRUD, UserCRUD
+from .crud import (
+    ApiKeyCRUD,
+    EventCRUD,
+    RoleCRUD,
+    SessionCRUD,
+    TenantCRUD,
+    UserCRUD,
+)
 from .models import User, Role
@@ -1,88 +1,170 @@
 import datetime as dt
+import hashlib
+import hmac
+import secrets
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import List
 
 import jwt
 from fastapi.security import OAuth2PasswordBearer
 import bcrypt
 
+try:
+    from argon2 import PasswordHasher, Type as Argon2Type
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:  # argon2-cffi is only needed for the argon2id scheme
+    PasswordHasher = Argon2Type = None
+
+    # Never raised, they only keep the `except` clauses below valid
+    class VerificationError(Exception):
+        pass
+
+    class InvalidHashError(Exception):
+        pass
+
+
 from v1.settings import settings
-from .role_scopes import RoleScopes
+from v1.tracing import traced
+from . import role_graph
+from .models import DEFAULT_TENANT_ID
+from .scopes import SCOPES, decode_scopes, encode_scopes
 
 SECRET_KEY, ALGORITHM = settings.security.secret_key, settings.security.algorithm
 
-# Extended scopes for equipment management system
-oauth2_scheme = OAuth2PasswordBearer(
-    tokenUrl="token",
-    scopes={
-        # User scopes
-        "users:me": "Read information about the current user",
-        "users:read": "Read users",
-        "users:create": "Create users",
-        # Equipment scopes
-        "equipment:read": "Read equipment catalog",
-        "equipment:create": "Add equipment to catalog",
-        "equipment:update": "Update equipment information",
-        "equipment:delete": "Delete equipment",
-        # Request/Borrow scopes
-        "requests:create": "Create borrow requests",
-        "requests:read": "Read borrow requests",
-        "requests:update": "Update request status",
-        "requests:approve": "Approve/deny requests",
-        # Reports scopes
-        "reports:read": "Generate and read reports",
-        "reports:export": "Export reports and borrowing history",
-        # Admin scopes
-        "admin:full": "Full administrative access",
-        "roles:manage": "Manage user roles",
-    },
-)
-
-# Initialize role hierarchy and generate role scopes
-_role_scopes = RoleScopes()
-ROLE_SCOPES: Dict[str, List[str]] = _role_scopes.build_all_role_scopes()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", scopes=SCOPES)
+
+
+_ARGON2_PREFIX = "$argon2id$"
+_argon2_hasher = None
+
 
+def _get_argon2_hasher():
+    global _argon2_hasher
 
+    if _argon2_hasher is None:
+        if PasswordHasher is None:
+            raise RuntimeError(
+                "PASSWORD_HASH_SCHEME=argon2id requires the `argon2-cffi` package"
+            )
+
+        _argon2_hasher = PasswordHasher(
+            time_cost=settings.security.argon2_time_cost,
+            memory_cost=settings.security.argon2_memory_cost,
+            parallelism=settings.security.argon2_parallelism,
+            type=Argon2Type.ID,
+        )
+
+    return _argon2_hasher
+
+
+@traced("auth.hash_password")
 def hash_password(password: str) -> str:
+    if settings.security.password_hash_scheme == "argon2id":
+        return _get_argon2_hasher().hash(password)
+
     pwd_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.security.bcrypt_rounds)
     hashed_password = bcrypt.hashpw(password=pwd_bytes, salt=salt)
     return hashed_password.decode("utf-8")
 
 
+@traced("auth.verify_password")
 def verify_password(password: str, hash: str) -> bool:
+    if hash.startswith(_ARGON2_PREFIX):
+        try:
+            return _get_argon2_hasher().verify(hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
     password_enc = password.encode("utf-8")
     hash_enc = hash.encode("utf-8")
-    return bcrypt.checkpw(password_enc, hash_enc)
+    try:
+        return bcrypt.checkpw(password_enc, hash_enc)
+    except ValueError:  # Not a bcrypt hash, e.g. a disabled password such as `!`
+        return False
 
 
-def get_scopes_for_role(role_name: str) -> List[str]:
-    """Get all scopes for a given role using the role hierarchy"""
+def password_needs_rehash(hash: str) -> bool:
+    """Whether a stored hash was produced with a scheme or cost other than the configured one"""
+    if settings.security.password_hash_scheme == "argon2id":
+        if not hash.startswith(_ARGON2_PREFIX):
+            return True
+        return _get_argon2_hasher().check_needs_rehash(hash)
+
+    if hash.startswith(_ARGON2_PREFIX):
+        return True
+
+    # bcrypt hashes look like `$2b$<cost>$<salt+digest>`
     try:
-        return _role_scopes.get_role_scopes(role_name)
-    except ValueError:
-        # Fallback for unknown roles
-        return []
+        cost = int(hash.split("$")[2])
+    except (IndexError, ValueError):
+        return True
+    return cost != settings.security.bcrypt_rounds
+
 
+def get_scopes_for_role(role_name: str) -> List[str]:
+    """Get all scopes for a given role from the current role graph snapshot"""
+    # Unknown roles resolve to no scopes
+    return sorted(role_graph.current().scopes_for(role_name))
 
+
+def get_scopes_for_role_id(role_id: int) -> List[str]:
+    """Same as `get_scopes_for_role`, for any role including tenants' custom ones"""
+    return sorted(role_graph.current().scopes_for_id(role_id))
+
+
+@traced("auth.create_access_token")
 def create_access_token(
     data: dict, expires_delta: timedelta | None = None, scopes: List[str] | None = None
 ) -> str:
     to_encode = data.copy()
-    expire = datetime.now(dt.UTC) + (
-        expires_delta if expires_delta else timedelta(minutes=60 * 60)
-    )
+    now = datetime.now(dt.UTC)
+    expire = now + (expires_delta if expires_delta else timedelta(minutes=60 * 60))
 
     # Add scopes to token if provided
     if scopes:
-        to_encode["scopes"] = scopes
+        if settings.security.compact_tokens:
+            to_encode["scp"] = encode_scopes(scopes)
+        else:
+            to_encode["scopes"] = scopes
 
-    to_encode.update({"exp": expire, "token_type": "access"})
+    # Fractional, so tokens issued right after a revocation aren't taken for older ones
+    to_encode.update({"iat": now.timestamp(), "exp": expire, "token_type": "access"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def create_refresh_token(email: str, expires_delta: timedelta | None = None) -> str:
-    to_encode: dict[str, str | datetime] = {"sub": email, "token_type": "refresh"}
+def token_scopes(payload: dict) -> list[str]:
+    """Scopes of a decoded access token, in either the compact or the legacy format"""
+    if "scp" in payload:
+        return decode_scopes(payload["scp"])
+    return payload.get("scopes", [])
+
+
+def token_role_ids(payload: dict) -> list[int]:
+    """Role IDs of a decoded access token, in either the compact or the legacy format"""
+    return payload.get("rid", payload.get("roles", []))
+
+
+def token_tenant_id(payload: dict) -> int:
+    """Tenant of a decoded token; tokens issued before tenants existed belong to the default one"""
+    return payload.get("tid", DEFAULT_TENANT_ID)
+
+
+@traced("auth.create_refresh_token")
+def create_refresh_token(
+    email: str,
+    expires_delta: timedelta | None = None,
+    token_id: str | None = None,
+    tenant_id: int | None = None,
+) -> str:
+    to_encode: dict[str, str | int | datetime] = {
+        "sub": email,
+        "token_type": "refresh",
+    }
+    if token_id:
+        to_encode["jti"] = token_id
+    if tenant_id is not None:
+        to_encode["tid"] = tenant_id
     expire = datetime.now(dt.UTC) + (
         expires_delta
         if expires_delta
@@ -93,3 +175,79 @@ def create_refresh_token(email: str, expires_delta: timedelta | None = None) ->
     return jwt.encode(
         to_encode, settings.security.refresh_secret_key, algorithm=ALGORITHM
     )
+
+
+API_KEY_PREFIX = "qsu_"
+
+
+def hash_api_key(secret: str) -> str:
+    """
+    Keyed hash of an API key secret. \n
+    Secrets are random, so a single HMAC is as good as a slow password hash
+    while costing microseconds instead of a bcrypt round.
+    """
+    key = settings.security.api_key_secret or SECRET_KEY
+    return hmac.new(key.encode(), secret.encode(), hashlib.sha256).hexdigest()
+
+
+def generate_api_key() -> tuple[str, str, str]:
+    """
+    New API key, shaped `qsu_<prefix>_<secret>`
+    :return: (key to hand out once, public prefix, hash to store)
+    """
+    prefix, secret = secrets.token_hex(6), secrets.token_urlsafe(32)
+    return f"{API_KEY_PREFIX}{prefix}_{secret}", prefix, hash_api_key(secret)
+
+
+def parse_api_key(key: str) -> tuple[str, str] | None:
+    """
+    Split an API key into its prefix and secret
+    :return: (prefix, secret), None when the value isn't shaped like an API key
+    """
+    if not key.startswith(API_KEY_PREFIX):
+        return None
+
+    prefix, _, secret = key.removeprefix(API_KEY_PREFIX).partition("_")
+    if len(prefix) != 12 or not secret:
+        return None
+    return prefix, secret
+
+
+SESSION_COOKIE = "session"
+SESSION_PREFIX = "qss_"
+
+
+def _sign_session(value: str) -> bytes:
+    return hmac.new(SECRET_KEY.encode(), value.encode(), hashlib.sha256).digest()
+
+
+def create_session_cookie(token_id: str) -> str:
+    """
+    Opaque value of the browser session cookie, shaped `qss_<token_id>.<issued>.<mac>`. \n
+    It names the login session (see `SessionCRUD`) instead of carrying a JWT, so
+    requests stay small and the claims are resolved from a cache, not decoded.
+    :param token_id: `token_id` of the session
+    """
+    value = f"{token_id}.{int(datetime.now(dt.UTC).timestamp())}"
+    return f"{SESSION_PREFIX}{value}.{_sign_session(value).hex()}"
+
+
+def parse_session_cookie(cookie: str) -> str | None:
+    """
+    Check a session cookie's signature and age
+    :return: `token_id` of the session, None for forged or expired cookies
+    """
+    value, _, mac = cookie.removeprefix(SESSION_PREFIX).rpartition(".")
+    try:
+        mac = bytes.fromhex(mac)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(mac, _sign_session(value)):
+        return None
+
+    token_id, _, issued = value.partition(".")
+    # Cookies live as long as the access tokens they replace
+    lifetime = settings.security.access_token_expire_minutes * 60
+    if int(issued) + lifetime < datetime.now(dt.UTC).timestamp():
+        return None
+    return token_id
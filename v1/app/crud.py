@@ -1,67 +1,446 @@
-from . import schemas, models, auth
+import asyncio
+import datetime as dt
+import json
+import secrets
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+
+from v1.settings import settings
+from . import schemas, models, auth, role_graph, serialization
+from .cache import TTLCache
+from .models import DEFAULT_TENANT_ID
+from .role_scopes import RoleScopes
+
+# slug -> tenant id, see `TenantCRUD.resolve`
+_tenant_cache: TTLCache[str, int | None] = TTLCache(ttl=60)
+
+
+@dataclass(frozen=True, slots=True)
+class ApiKeyIdentity:
+    """Service account an API key authenticates as, see `ApiKeyCRUD.authenticate`"""
+
+    api_key_id: int
+    email: str
+    tenant_id: int
+    scopes: tuple[str, ...] | None
+    expires_at: datetime | None
+
+
+# API key hash -> identity
+_api_key_cache: TTLCache[str, ApiKeyIdentity] = TTLCache(
+    ttl=settings.security.api_key_cache_seconds
+)
+
+
+@dataclass(frozen=True, slots=True)
+class SessionIdentity:
+    """User a browser session cookie authenticates as, see `SessionCRUD.authenticate`"""
+
+    session_id: int
+    email: str
+    tenant_id: int
+    scopes: tuple[str, ...] | None
+    issued_at: datetime
+    expires_at: datetime
+
+
+# Session token_id -> identity
+_session_cache: TTLCache[str, SessionIdentity] = TTLCache(
+    ttl=settings.security.session_cache_seconds
+)
+
+
+def _visible_roles(tenant_id: int | None) -> Q:
+    """Built-in roles plus the custom roles of the tenant"""
+    if tenant_id is None:
+        return Q(tenant_id__isnull=True)
+    return Q(tenant_id__isnull=True) | Q(tenant_id=tenant_id)
 
 
 class UserCRUD:
     user = models.User
 
     @classmethod
-    async def get_all(cls):
-        return await cls.user.all().prefetch_related("roles")
+    async def get_all(cls, tenant_id: int = DEFAULT_TENANT_ID):
+        return await cls.user.filter(
+            tenant_id=tenant_id, deleted_at__isnull=True
+        ).prefetch_related("roles")
+
+    @classmethod
+    async def get_all_rows(cls, tenant_id: int = DEFAULT_TENANT_ID) -> list[dict]:
+        """UserOut-shaped dicts read with `.values()`, skipping model instantiation"""
+        users = (
+            await cls.user.filter(tenant_id=tenant_id, deleted_at__isnull=True)
+            .order_by("id")
+            .values(*serialization.USER_FIELDS)
+        )
+        links = await cls.user.filter(
+            tenant_id=tenant_id, deleted_at__isnull=True, roles__id__isnull=False
+        ).values_list("id", "roles__id", "roles__name")
+
+        roles: dict[int, list[dict]] = defaultdict(list)
+        for user_id, role_id, role_name in links:
+            roles[user_id].append({"id": role_id, "name": role_name})
+        for user in users:
+            user["roles"] = roles[user["id"]]
+
+        return users
+
+    @classmethod
+    async def get_list_version(cls, tenant_id: int = DEFAULT_TENANT_ID) -> tuple:
+        """
+        Cheap fingerprint of the users listing: row count and latest `updated_at`. \n
+        Role membership changes touch `updated_at` through the materialized scopes.
+        """
+        rows = await cls.user._meta.db.execute_query_dict(
+            'SELECT count(*) AS "count", max("updated_at") AS "last" FROM "users" '
+            'WHERE "tenant_id" = $1 AND "deleted_at" IS NULL',
+            [tenant_id],
+        )
+        return rows[0]["count"], rows[0]["last"]
+
+    @classmethod
+    async def get_by_email(cls, email: str, tenant_id: int = DEFAULT_TENANT_ID):
+        return await cls.user.get_or_none(
+            tenant_id=tenant_id, email=email
+        ).prefetch_related("roles")
+
+    @classmethod
+    async def get_active_by_email(cls, email: str, tenant_id: int = DEFAULT_TENANT_ID):
+        """User allowed to authenticate, looked up through the partial index of live rows"""
+        return await cls.user.get_or_none(
+            tenant_id=tenant_id, email=email, is_active=True, deleted_at__isnull=True
+        ).prefetch_related("roles")
+
+    @classmethod
+    async def set_active(
+        cls, user_id: int, active: bool, tenant_id: int = DEFAULT_TENANT_ID
+    ) -> models.User | None:
+        """
+        Activate or deactivate a user. Deactivation also revokes all of its sessions.
+        :return: Updated user, None when it doesn't exist, was deleted or is in another tenant
+        """
+        async with in_transaction():
+            user = await cls.user.get_or_none(
+                id=user_id, tenant_id=tenant_id, deleted_at__isnull=True
+            ).prefetch_related("roles")
+            if not user:
+                return None
+
+            if user.is_active != active:
+                user.is_active = active
+                await user.save(update_fields=["is_active", "updated_at"])
+                if not active:
+                    await SessionCRUD.revoke_all(user.id)
+                await EventCRUD.record(
+                    "user.activated" if active else "user.deactivated",
+                    user.id,
+                    user.tenant_id,
+                    email=user.email,
+                )
+
+        return user
 
     @classmethod
-    async def get_by_email(cls, email: str):
-        return await cls.user.get_or_none(email=email).prefetch_related("roles")
+    async def soft_delete(
+        cls, user_id: int, tenant_id: int = DEFAULT_TENANT_ID
+    ) -> bool:
+        """
+        Hide the user from listings and auth and revoke its sessions. \n
+        The row is kept, so the email stays taken.
+        :return: False when the user doesn't exist, was already deleted or is in another tenant
+        """
+        async with in_transaction():
+            user = await cls.user.get_or_none(
+                id=user_id, tenant_id=tenant_id, deleted_at__isnull=True
+            )
+            if not user:
+                return False
+
+            user.is_active = False
+            user.deleted_at = datetime.now(dt.UTC)
+            await user.save(update_fields=["is_active", "deleted_at", "updated_at"])
+            await SessionCRUD.revoke_all(user.id)
+            await EventCRUD.record(
+                "user.deleted", user.id, user.tenant_id, email=user.email
+            )
+
+        return True
+
+    @classmethod
+    async def get_by_id(cls, user_id: int, tenant_id: int = DEFAULT_TENANT_ID):
+        return await cls.user.get_or_none(
+            id=user_id, tenant_id=tenant_id
+        ).prefetch_related("roles")
 
     @classmethod
-    async def get_by_id(cls, user_id: int):
-        return await cls.user.get_or_none(id=user_id).prefetch_related("roles")
+    async def exists(cls, email: str, tenant_id: int = DEFAULT_TENANT_ID) -> bool:
+        return await cls.user.filter(tenant_id=tenant_id, email=email).exists()
 
     @classmethod
     async def create(
-        cls, payload: schemas.UserPayload, is_admin: bool = False
+        cls,
+        payload: schemas.UserPayload,
+        is_admin: bool = False,
+        tenant_id: int = DEFAULT_TENANT_ID,
     ) -> tuple[models.User, bool]:
         """
+        Insert the user, link its role and record the change event in a single statement. \n
+        An existing user with the same email in the tenant is returned as is.
         :param payload: Sign up payload
         :param is_admin: Whether to assign admin role
+        :param tenant_id: Tenant the user signs up to
         :return: (User instance, created boolean)
         """
         # Determine role to assign
-        if is_admin:
-            if not (role := await RoleCRUD.get_by_name("superadmin")):
-                raise Exception("Unable to find role with name `superadmin`")
-        else:
-            if not (role := await RoleCRUD.get_by_name("user")):
-                raise Exception("Unable to find role with name `user`")
+        role_name = "superadmin" if is_admin else "user"
+        if (role_id := role_graph.current().role_ids.get(role_name)) is None:
+            raise Exception(f"Unable to find role with name `{role_name}`")
 
-        dump = payload.model_dump()
-        dump["password_hash"] = auth.hash_password(dump.pop("password"))
-        dump["is_active"] = True
+        # Tens of milliseconds of CPU; bcrypt and argon2 release the GIL meanwhile
+        password_hash = await asyncio.to_thread(auth.hash_password, payload.password)
+        scopes = auth.get_scopes_for_role(role_name)
+
+        db = cls.user._meta.db
+        rows = await db.execute_query_dict(
+            """
+            WITH inserted AS (
+                INSERT INTO "users" (
+                    "tenant_id", "username", "email", "password_hash", "is_active",
+                    "effective_scopes", "created_at", "updated_at"
+                )
+                VALUES ($7, $1, $2, $3, TRUE, $4::jsonb, now(), now())
+                ON CONFLICT ("tenant_id", "email") DO NOTHING
+                RETURNING *
+            ), linked AS (
+                INSERT INTO "user_roles" ("users_id", "role_id")
+                SELECT "id", $5 FROM inserted
+            ), event AS (
+                INSERT INTO "change_events" (
+                    "kind", "entity_id", "tenant_id", "payload", "created_at"
+                )
+                SELECT 'user.created', "id", "tenant_id",
+                    jsonb_build_object('email', "email", 'role', $6::text), now()
+                FROM inserted
+            )
+            SELECT *, TRUE AS "created" FROM inserted
+            UNION ALL
+            SELECT *, FALSE FROM "users"
+            WHERE "tenant_id" = $7 AND "email" = $2
+                AND NOT EXISTS (SELECT 1 FROM inserted)
+            """,
+            [
+                payload.username,
+                payload.email,
+                password_hash,
+                json.dumps(scopes),
+                role_id,
+                role_name,
+                tenant_id,
+            ],
+        )
+
+        if not rows:
+            # A concurrent signup committed after this statement's snapshot was taken
+            return await cls.user.get(tenant_id=tenant_id, email=payload.email), False
+
+        row = rows[0]
+        created = row.pop("created")
+        return cls.user._init_from_db(**row), created
+
+    @classmethod
+    async def create_service_account(
+        cls, name: str, role_names: list[str], tenant_id: int = DEFAULT_TENANT_ID
+    ) -> models.User:
+        """
+        Create a machine client authenticating with API keys. \n
+        It has no usable password, so it can't log in through `/token`.
+        :param name: Username, also used to derive its placeholder email
+        :param role_names: Roles granting its scopes
+        :param tenant_id: Tenant the account belongs to
+        :return: User with prefetched roles
+        :raises ValueError: The account already exists or a role is unknown
+        """
+        email = f"{name}@service.invalid"
+        if await cls.exists(email, tenant_id):
+            raise ValueError(f"Service account `{name}` already exists")
+
+        roles = await RoleCRUD.get_by_names(role_names, tenant_id)
+        scopes = set()
+        for role in roles:
+            scopes.update(auth.get_scopes_for_role_id(role.id))
+
+        async with in_transaction():
+            user = await cls.user.create(
+                tenant_id=tenant_id,
+                username=name,
+                email=email,
+                password_hash="!",
+                is_active=True,
+                is_service=True,
+                effective_scopes=sorted(scopes),
+            )
+            await user.roles.add(*roles)
+            await EventCRUD.record(
+                "user.created",
+                user.id,
+                tenant_id,
+                email=email,
+                roles=[role.name for role in roles],
+                service=True,
+            )
+
+        await user.fetch_related("roles")
+        return user
+
+    @classmethod
+    async def sync_effective_scopes(
+        cls, *user_ids: int, snapshot: role_graph.RoleGraphSnapshot | None = None
+    ) -> None:
+        """
+        Recompute the materialized scopes of the given users from their current roles
+        :param user_ids: IDs of the users whose roles changed
+        :param snapshot: Role graph to resolve scopes with, this worker's by default
+        """
+        if not user_ids:
+            return
+
+        # By ID: custom roles of different tenants may share a name
+        rows = await cls.user.filter(id__in=user_ids).values_list("id", "roles__id")
+        role_ids: dict[int, set[int]] = {user_id: set() for user_id in user_ids}
+        for user_id, role_id in rows:
+            if role_id:
+                role_ids[user_id].add(role_id)
+
+        # Users sharing a role set share a scope set, so update them together
+        snapshot = snapshot or role_graph.current()
+        by_scopes: dict[tuple[str, ...], list[int]] = defaultdict(list)
+        for user_id, ids in role_ids.items():
+            scopes = set()
+            for role_id in ids:
+                scopes.update(snapshot.scopes_for_id(role_id))
+            by_scopes[tuple(sorted(scopes))].append(user_id)
 
-        # Remove role-related fields from dump since we'll handle roles separately
-        email = dump["email"]
+        now = datetime.now(dt.UTC)
+        for scopes, ids in by_scopes.items():
+            await cls.user.filter(id__in=ids).update(
+                effective_scopes=list(scopes), updated_at=now
+            )
 
-        # Create or get user
-        user, created = await cls.user.get_or_create(defaults=dump, email=email)
+    @classmethod
+    async def ensure_effective_scopes(cls, user: models.User) -> None:
+        """
+        Materialize the scopes of a user marked for a resync (see `RoleCRUD.delete_role`)
+        or created before the column existed
+        """
+        if user.effective_scopes is None:
+            # The mark may come from a role graph change this worker hasn't seen yet
+            await role_graph.refresh()
+            await cls.sync_effective_scopes(user.id)
+            await user.refresh_from_db(fields=["effective_scopes", "updated_at"])
+
+    @classmethod
+    async def has_pending_scopes(cls) -> bool:
+        """Whether some users are marked for a scope resync"""
+        return await cls.user.filter(effective_scopes__isnull=True).exists()
+
+    @classmethod
+    async def resync_scopes(
+        cls,
+        progress: Callable[[int, int], Awaitable[None]] | None = None,
+        batch_size: int = 500,
+    ) -> int:
+        """
+        Recompute the scopes of all users marked for a resync, in batches each in its
+        own transaction. Idempotent, so interrupted or concurrent runs are harmless.
+        :param progress: Called with (synced users, total users) after each batch
+        :param batch_size: Users recomputed per transaction
+        :return: Number of users synced
+        """
+        await role_graph.refresh()
+        pending = cls.user.filter(effective_scopes__isnull=True).order_by("id")
+        total, synced = await pending.count(), 0
+        while user_ids := await pending.limit(batch_size).values_list("id", flat=True):
+            async with in_transaction():
+                await cls.sync_effective_scopes(*user_ids)
+            synced += len(user_ids)
+            if progress:
+                await progress(synced, max(total, synced))
+
+        return synced
+
+    @classmethod
+    async def grant_role_scopes(cls, user: models.User, role_id: int) -> None:
+        """
+        Incrementally add a newly assigned role's scopes to the user's materialized scopes
+        :param user: User the role was added to
+        :param role_id: ID of the added role
+        """
+        if user.effective_scopes is None:
+            await cls.sync_effective_scopes(user.id)
+            return
+
+        scopes = set(user.effective_scopes)
+        scopes.update(auth.get_scopes_for_role_id(role_id))
+        user.effective_scopes = sorted(scopes)
+        user.updated_at = datetime.now(dt.UTC)
+        await cls.user.filter(id=user.id).update(
+            effective_scopes=user.effective_scopes, updated_at=user.updated_at
+        )
 
-        # Assign role if user was created or doesn't have this role
-        if created or not await user.roles.filter(id=role.id).exists():
+    @classmethod
+    async def link_role(cls, user: models.User, role: models.Role) -> None:
+        """Add the role, extend materialized scopes and record the change atomically"""
+        async with in_transaction():
             await user.roles.add(role)
+            await cls.grant_role_scopes(user, role.id)
+            await EventCRUD.record(
+                "user.role_added",
+                user.id,
+                user.tenant_id,
+                email=user.email,
+                role=role.name,
+            )
+
+    @classmethod
+    async def unlink_role(cls, user: models.User, role: models.Role) -> None:
+        """Remove the role, recompute materialized scopes and record the change atomically"""
+        async with in_transaction():
+            await user.roles.remove(role)
+            await cls.sync_effective_scopes(user.id)
+            await EventCRUD.record(
+                "user.role_removed",
+                user.id,
+                user.tenant_id,
+                email=user.email,
+                role=role.name,
+            )
 
-        return user, created
+    @classmethod
+    async def update_password_hash(cls, user_id: int, password_hash: str) -> None:
+        await cls.user.filter(id=user_id).update(password_hash=password_hash)
 
     @classmethod
-    async def add_role(cls, user_id: int, role_name: str) -> bool:
+    async def add_role(
+        cls, user_id: int, role_name: str, tenant_id: int = DEFAULT_TENANT_ID
+    ) -> bool:
         """
         Add a role to a user
         :param user_id: User ID
         :param role_name: Role name to add
+        :param tenant_id: Tenant of the user, whose custom roles are visible
         :return: Success boolean
         """
-        user = await cls.get_by_id(user_id)
+        user = await cls.get_by_id(user_id, tenant_id)
         if not user:
             return False
 
-        role = await RoleCRUD.get_by_name(role_name)
+        role = await RoleCRUD.get_by_name(role_name, tenant_id)
         if not role:
             return False
 
@@ -69,90 +448,420 @@ class UserCRUD:
         if await user.roles.filter(id=role.id).exists():
             return True  # Already has role
 
-        await user.roles.add(role)
+        await cls.link_role(user, role)
         return True
 
     @classmethod
-    async def remove_role(cls, user_id: int, role_name: str) -> bool:
+    async def remove_role(
+        cls, user_id: int, role_name: str, tenant_id: int = DEFAULT_TENANT_ID
+    ) -> bool:
         """
         Remove a role from a user
         :param user_id: User ID
         :param role_name: Role name to remove
+        :param tenant_id: Tenant of the user, whose custom roles are visible
         :return: Success boolean
         """
-        user = await cls.get_by_id(user_id)
+        user = await cls.get_by_id(user_id, tenant_id)
         if not user:
             return False
 
-        role = await RoleCRUD.get_by_name(role_name)
+        role = await RoleCRUD.get_by_name(role_name, tenant_id)
         if not role:
             return False
 
-        await user.roles.remove(role)
+        await cls.unlink_role(user, role)
         return True
 
     @classmethod
-    async def has_role(cls, user_id: int, role_name: str) -> bool:
+    async def has_role(
+        cls, user_id: int, role_name: str, tenant_id: int = DEFAULT_TENANT_ID
+    ) -> bool:
         """
         Check if user has a specific role
         :param user_id: User ID
         :param role_name: Role name to check
+        :param tenant_id: Tenant of the user, whose custom roles are visible
         :return: Boolean indicating if user has role
         """
-        user = await cls.get_by_id(user_id)
+        user = await cls.get_by_id(user_id, tenant_id)
         if not user:
             return False
 
-        return await user.roles.filter(name=role_name).exists()
+        role = await RoleCRUD.get_by_name(role_name, tenant_id)
+        return bool(role) and await user.roles.filter(id=role.id).exists()
 
     @classmethod
-    async def get_user_roles(cls, user_id: int) -> list[models.Role]:
+    async def get_user_roles(
+        cls, user_id: int, tenant_id: int = DEFAULT_TENANT_ID
+    ) -> list[models.Role]:
         """
         Get all roles for a user
         :param user_id: User ID
+        :param tenant_id: Tenant of the user
         :return: List of roles
         """
-        user = await cls.get_by_id(user_id)
+        user = await cls.get_by_id(user_id, tenant_id)
         if not user:
             return []
 
-        return await user.roles.all()
+        return await user.roles.filter(_visible_roles(tenant_id))
+
+    @classmethod
+    async def search(
+        cls,
+        query: str,
+        fuzzy: bool = False,
+        limit: int = 50,
+        after: str | None = None,
+        tenant_id: int = DEFAULT_TENANT_ID,
+    ) -> tuple[list[dict], str | None]:
+        """
+        Search users by username or email, case-insensitively. \n
+        Prefix matches are ordered by id, fuzzy (trigram similarity) matches by score.
+        Both are paged with a keyset cursor, so deep pages cost as much as the first one.
+        :param query: Text to look for
+        :param fuzzy: Match similar text instead of prefixes
+        :param limit: Page size
+        :param after: Cursor returned with the previous page
+        :param tenant_id: Tenant to search in
+        :return: (UserSummary-shaped rows, cursor of the next page or None)
+        :raises ValueError: Malformed cursor
+        """
+        query = query.lower()
+        columns = ", ".join(f'"{field}"' for field in serialization.USER_FIELDS)
+
+        try:
+            if not fuzzy:
+                cursor = [int(after or 0)]
+            elif after:
+                score, _, last_id = after.partition(":")
+                cursor = [float(score), int(last_id)]
+            else:
+                cursor = [None, 0]
+        except ValueError:
+            raise ValueError("Invalid cursor") from None
+
+        db = cls.user._meta.db
+        if fuzzy:
+            # `%` is served by the trigram GIN indexes, scoring only touches the matches
+            rows = await db.execute_query_dict(
+                f"""
+                SELECT * FROM (
+                    SELECT {columns}, greatest(
+                        similarity(lower("username"), $1), similarity(lower("email"), $1)
+                    ) AS "score"
+                    FROM "users"
+                    WHERE (lower("username") % $1 OR lower("email") % $1)
+                        AND "tenant_id" = $5 AND "deleted_at" IS NULL
+                ) AS "matches"
+                WHERE $2::real IS NULL
+                    OR "score" < $2::real OR ("score" = $2::real AND "id" > $3)
+                ORDER BY "score" DESC, "id"
+                LIMIT $4
+                """,
+                [query, *cursor, limit + 1, tenant_id],
+            )
+        else:
+            # Wildcards typed by the client match literally
+            pattern = (
+                query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            )
+            rows = await db.execute_query_dict(
+                f"""
+                SELECT {columns} FROM "users"
+                WHERE (lower("username") LIKE $1 OR lower("email") LIKE $1)
+                    AND "tenant_id" = $4 AND "deleted_at" IS NULL AND "id" > $2
+                ORDER BY "id"
+                LIMIT $3
+                """,
+                [pattern + "%", *cursor, limit + 1, tenant_id],
+            )
+
+        if len(rows) <= limit:
+            next_cursor = None
+        else:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = (
+                f"{last['score']!r}:{last['id']}" if fuzzy else str(last["id"])
+            )
+
+        for row in rows:
+            row.pop("score", None)
+        return rows, next_cursor
 
 
 class RoleCRUD:
     role = models.Role
 
     @classmethod
-    async def get_all(cls):
-        return await cls.role.all().prefetch_related("users")
+    async def get_all(cls, tenant_id: int = DEFAULT_TENANT_ID):
+        return await cls.role.filter(_visible_roles(tenant_id)).prefetch_related(
+            "users"
+        )
 
     @classmethod
-    async def get_by_name(cls, name: str) -> models.Role | None:
-        return await cls.role.get_or_none(name=name)
+    async def get_all_rows(cls, tenant_id: int = DEFAULT_TENANT_ID) -> list[dict]:
+        """
+        RoleOut-shaped dicts read with `.values()`, skipping model instantiation. \n
+        Built-in roles are listed with the tenant's own live members only.
+        """
+        roles = (
+            await cls.role.filter(_visible_roles(tenant_id))
+            .order_by("id")
+            .values(*serialization.ROLE_FIELDS)
+        )
+        members = await models.User.filter(
+            tenant_id=tenant_id, deleted_at__isnull=True, roles__id__isnull=False
+        ).values("roles__id", *serialization.USER_FIELDS)
+
+        users: dict[int, list[dict]] = defaultdict(list)
+        for member in members:
+            users[member.pop("roles__id")].append(member)
+        for role in roles:
+            role["users"] = users[role["id"]]
+
+        return roles
 
     @classmethod
-    async def get_by_id(cls, role_id: int) -> models.Role | None:
-        return await cls.role.get_or_none(id=role_id)
+    async def get_list_version(cls, tenant_id: int = DEFAULT_TENANT_ID) -> tuple:
+        """Cheap fingerprint of the tenant's roles listing, including the embedded users"""
+        rows = await cls.role._meta.db.execute_query_dict(
+            """
+            SELECT
+                (SELECT count(*) FROM "roles"
+                    WHERE "tenant_id" IS NULL OR "tenant_id" = $1) AS "roles",
+                (SELECT max("updated_at") FROM "roles"
+                    WHERE "tenant_id" IS NULL OR "tenant_id" = $1) AS "roles_updated",
+                (SELECT count(*) FROM "users"
+                    WHERE "tenant_id" = $1 AND "deleted_at" IS NULL) AS "users",
+                (SELECT max("updated_at") FROM "users"
+                    WHERE "tenant_id" = $1 AND "deleted_at" IS NULL) AS "users_updated"
+            """,
+            [tenant_id],
+        )
+        return tuple(rows[0].values())
+
+    @classmethod
+    async def get_by_name(
+        cls, name: str, tenant_id: int | None = DEFAULT_TENANT_ID
+    ) -> models.Role | None:
+        """
+        Role visible to the tenant: its own role of that name, otherwise the built-in one
+        :param name: Role name
+        :param tenant_id: Tenant looking the role up, None for built-in roles only
+        """
+        # NULLs sort last, so the tenant's role comes before a built-in one
+        return (
+            await cls.role.filter(_visible_roles(tenant_id), name=name)
+            .order_by("tenant_id")
+            .first()
+        )
 
     @classmethod
-    async def create(cls, payload: schemas.RolePayload) -> tuple[models.Role, bool]:
+    async def get_by_id(
+        cls, role_id: int, tenant_id: int | None = DEFAULT_TENANT_ID
+    ) -> models.Role | None:
+        """Role visible to the tenant, None for other tenants' custom roles"""
+        return await cls.role.filter(_visible_roles(tenant_id), id=role_id).first()
+
+    @classmethod
+    async def _get_parents(
+        cls, names: list[str], tenant_id: int | None
+    ) -> list[models.Role]:
+        parents = await cls.role.filter(_visible_roles(tenant_id), name__in=names)
+        if missing := set(names) - {parent.name for parent in parents}:
+            raise ValueError(f"Unknown parent roles: {sorted(missing)}")
+
+        return parents
+
+    @classmethod
+    async def get_by_names(
+        cls, names: list[str], tenant_id: int = DEFAULT_TENANT_ID
+    ) -> list[models.Role]:
+        """
+        Roles visible to the tenant
+        :raises ValueError: A role does not exist
+        """
+        roles = await cls.role.filter(_visible_roles(tenant_id), name__in=names)
+        if missing := set(names) - {role.name for role in roles}:
+            raise ValueError(f"Unknown roles: {sorted(missing)}")
+
+        return roles
+
+    @staticmethod
+    def _check_owner(role: models.Role, tenant_id: int) -> None:
+        """
+        Built-in roles are shared by every tenant, so only the default tenant changes them
+        :raises PermissionError: Another tenant tries to change a built-in role
+        """
+        if role.tenant_id is None and tenant_id != DEFAULT_TENANT_ID:
+            raise PermissionError(f"Role `{role.name}` is built-in")
+
+    @classmethod
+    async def _sync_members(
+        cls, *role_ids: int, snapshot: role_graph.RoleGraphSnapshot | None = None
+    ) -> list[int]:
+        """
+        Recompute materialized scopes of every user holding one of the roles
+        :param snapshot: Role graph to resolve scopes with, this worker's by default
+        :return: IDs of the affected users
+        """
+        user_ids = (
+            await models.User.filter(roles__id__in=role_ids)
+            .distinct()
+            .values_list("id", flat=True)
+        )
+        await UserCRUD.sync_effective_scopes(*user_ids, snapshot=snapshot)
+        return user_ids
+
+    @classmethod
+    async def create(
+        cls, payload: schemas.RolePayload, tenant_id: int = DEFAULT_TENANT_ID
+    ) -> tuple[models.Role, bool]:
+        """
+        Create a custom role of the tenant and attach it to the role hierarchy. \n
+        A role visible to the tenant under the same name (built-in included) is returned as is.
+        :param payload: Role name, parent role names and scope adjustments
+        :param tenant_id: Tenant owning the role
+        :return: (Role instance, created boolean)
+        :raises ValueError: If a parent role does not exist
+        """
         dump = payload.model_dump()
-        name = dump["name"]
+        parents = await cls._get_parents(dump.pop("inherits_from"), tenant_id)
+
+        async with in_transaction():
+            if role := await cls.get_by_name(dump["name"], tenant_id):
+                return role, False
 
-        return await cls.role.get_or_create(defaults=dump, name=name)
+            role = await cls.role.create(tenant_id=tenant_id, **dump)
+            await role.parents.add(*parents)
+            await role_graph.bump_version()
+            await EventCRUD.record("role.created", role.id, tenant_id, name=role.name)
+
+        await role_graph.refresh()
+        return role, True
 
     @classmethod
-    async def elevate_role(cls, email: str) -> bool:
+    async def update_hierarchy(
+        cls,
+        name: str,
+        payload: schemas.RoleHierarchyPayload,
+        tenant_id: int = DEFAULT_TENANT_ID,
+    ) -> models.Role | None:
+        """
+        Replace a role's parents and scope adjustments
+        :param name: Role name
+        :param payload: New parent role names and scope adjustments
+        :param tenant_id: Tenant changing the role
+        :return: Updated role or None if it doesn't exist
+        :raises ValueError: If a parent role does not exist or the change creates a cycle
+        :raises PermissionError: Another tenant than the default one changes a built-in role
+        """
+        role = await cls.get_by_name(name, tenant_id)
+        if not role:
+            return None
+        cls._check_owner(role, tenant_id)
+
+        # Built-in roles are visible to every tenant, so they can't inherit custom ones
+        parents = await cls._get_parents(payload.inherits_from, role.tenant_id)
+        descendants = role_graph.current().descendants(role.id)
+        if {parent.id for parent in parents} & (descendants | {role.id}):
+            raise ValueError(f"Role `{name}` can't inherit from itself")
+
+        async with in_transaction():
+            role.additional_scopes = payload.additional_scopes
+            role.excluded_scopes = payload.excluded_scopes
+            await role.save(
+                update_fields=["additional_scopes", "excluded_scopes", "updated_at"]
+            )
+            await role.parents.clear()
+            await role.parents.add(*parents)
+            await role_graph.bump_version()
+            # Compiled from this transaction's view, so members get the new scopes
+            # atomically; the worker only switches to it once committed
+            snapshot = await role_graph.load()
+            user_ids = await cls._sync_members(role.id, *descendants, snapshot=snapshot)
+            await EventCRUD.record(
+                "role.updated",
+                role.id,
+                role.tenant_id,
+                name=role.name,
+                user_ids=user_ids,
+            )
+
+        await role_graph.refresh()
+        return role
+
+    @classmethod
+    async def seed_defaults(cls) -> list[str]:
+        """
+        Create the built-in (tenant-less) roles of RoleScopes that don't exist yet. \n
+        A single INSERT ... ON CONFLICT covers all roles, so an already seeded
+        database costs one statement.
+        :return: Names of the created roles
+        """
+        defaults = {
+            name: {"inherits_from": [], "additional_scopes": scopes}
+            for name, scopes in RoleScopes.BASE_ROLES.items()
+        }
+        defaults.update(RoleScopes.ROLE_INHERITANCE)
+        names = list(defaults)
+
+        async with in_transaction() as conn:
+            rows = await conn.execute_query_dict(
+                """
+                INSERT INTO "roles" ("name", "additional_scopes", "excluded_scopes")
+                SELECT n, a::jsonb, e::jsonb FROM unnest($1::text[], $2::text[], $3::text[]) AS t(n, a, e)
+                ON CONFLICT ("name") WHERE "tenant_id" IS NULL DO NOTHING
+                RETURNING "name"
+                """,
+                [
+                    names,
+                    [
+                        json.dumps(defaults[n].get("additional_scopes", []))
+                        for n in names
+                    ],
+                    [json.dumps(defaults[n].get("excluded_scopes", [])) for n in names],
+                ],
+            )
+            seeded = [row["name"] for row in rows]
+            if not seeded:
+                return []
+
+            links = [(n, p) for n in seeded for p in defaults[n]["inherits_from"]]
+            if links:
+                await conn.execute_query(
+                    """
+                    INSERT INTO "role_parents" ("role_id", "parent_id")
+                    SELECT r."id", p."id" FROM unnest($1::text[], $2::text[]) AS l(role, parent)
+                    JOIN "roles" r ON r."name" = l.role AND r."tenant_id" IS NULL
+                    JOIN "roles" p ON p."name" = l.parent AND p."tenant_id" IS NULL
+                    """,
+                    [[n for n, _ in links], [p for _, p in links]],
+                )
+
+            await conn.execute_query("""
+                INSERT INTO "role_graph" ("id", "version") VALUES (1, 1)
+                ON CONFLICT ("id") DO UPDATE SET "version" = "role_graph"."version" + 1
+                """)
+
+        return seeded
+
+    @classmethod
+    async def elevate_role(cls, email: str, tenant_id: int = DEFAULT_TENANT_ID) -> bool:
         """
         Add admin role to user (keeping existing roles)
         :param email: User email
+        :param tenant_id: Tenant of the user
         :return: Success boolean
         """
-        user = await UserCRUD.get_by_email(email)
+        user = await UserCRUD.get_by_email(email, tenant_id)
         if not user:
             return False
 
-        admin_role = await cls.get_by_name("admin")
+        admin_role = await cls.get_by_name("admin", tenant_id)
         if not admin_role:
             return False
 
@@ -160,50 +869,531 @@ class RoleCRUD:
         if await user.roles.filter(id=admin_role.id).exists():
             return True  # Already an admin
 
-        await user.roles.add(admin_role)
+        await UserCRUD.link_role(user, admin_role)
         return True
 
     @classmethod
-    async def demote_admin(cls, email: str) -> bool:
+    async def demote_admin(cls, email: str, tenant_id: int = DEFAULT_TENANT_ID) -> bool:
         """
         Remove admin role from user
         :param email: User email
+        :param tenant_id: Tenant of the user
         :return: Success boolean
         """
-        user = await UserCRUD.get_by_email(email)
+        user = await UserCRUD.get_by_email(email, tenant_id)
         if not user:
             return False
 
-        admin_role = await cls.get_by_name("admin")
+        admin_role = await cls.get_by_name("admin", tenant_id)
         if not admin_role:
             return False
 
-        await user.roles.remove(admin_role)
+        await UserCRUD.unlink_role(user, admin_role)
         return True
 
     @classmethod
-    async def get_users_with_role(cls, role_name: str) -> list[models.User]:
+    async def get_users_with_role(
+        cls, role_name: str, tenant_id: int = DEFAULT_TENANT_ID
+    ) -> list[models.User]:
         """
-        Get all users with a specific role
+        Get the tenant's users with a specific role
         :param role_name: Role name
+        :param tenant_id: Tenant of the users
         :return: List of users
         """
-        role = await cls.get_by_name(role_name)
+        role = await cls.get_by_name(role_name, tenant_id)
         if not role:
             return []
 
-        return await role.users.all()
+        return await role.users.filter(tenant_id=tenant_id)
+
+    @classmethod
+    async def get_users_with_scope(
+        cls,
+        scope: str,
+        limit: int = 50,
+        after: int = 0,
+        tenant_id: int = DEFAULT_TENANT_ID,
+    ) -> tuple[list[dict], int | None]:
+        """
+        Page of the tenant's users holding a scope through any of their roles. \n
+        The role graph snapshot names the roles granting the scope; each role's members
+        are then read in ID order from `idx_user_roles_tenant_role`, at most a page per
+        role, so a page costs the same on any number of users.
+        :param scope: Scope to look for, e.g. `equipment:delete`
+        :param limit: Maximum number of users
+        :param after: Cursor: ID of the last user of the previous page
+        :param tenant_id: Tenant of the users
+        :return: (users ordered by ID, cursor of the next page or None after the last one)
+        """
+        role_ids = list(role_graph.current().roles_granting(scope, tenant_id))
+        if not role_ids:
+            return [], None
+
+        columns = ", ".join(f'"{field}"' for field in serialization.USER_FIELDS)
+        # Every user of the global page is within the first page of one of its roles
+        rows = await cls.role._meta.db.execute_query_dict(
+            f"""
+            SELECT {columns} FROM "users"
+            WHERE "id" IN (
+                SELECT DISTINCT "member"."users_id"
+                FROM unnest($2::int[]) AS "granting"("role_id")
+                CROSS JOIN LATERAL (
+                    SELECT ur."users_id" FROM "user_roles" ur
+                    JOIN "users" u ON u."id" = ur."users_id" AND u."deleted_at" IS NULL
+                    WHERE ur."tenant_id" = $1 AND ur."role_id" = "granting"."role_id"
+                        AND ur."users_id" > $3
+                    ORDER BY ur."users_id"
+                    LIMIT $4
+                ) AS "member"
+                ORDER BY 1
+                LIMIT $4
+            )
+            ORDER BY "id"
+            """,
+            [tenant_id, role_ids, after, limit + 1],
+        )
+
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, rows[-1]["id"]
 
     @classmethod
-    async def delete_role(cls, role_name: str) -> bool:
+    async def delete_role(
+        cls,
+        role_name: str,
+        progress: Callable[[int, int], Awaitable[None]] | None = None,
+        batch_size: int = 500,
+        tenant_id: int = DEFAULT_TENANT_ID,
+    ) -> bool:
         """
-        Delete a role (this will remove it from all users)
+        Delete a role (this will remove it from all users). \n
+        Its members are marked for a scope resync in the delete's transaction, together
+        with the change event, then resynced in batches by `UserCRUD.resync_scopes`;
+        an interrupted resync is picked up again from the marks.
         :param role_name: Role name to delete
+        :param progress: Called with (synced users, total users) after each batch
+        :param batch_size: Users recomputed per transaction
+        :param tenant_id: Tenant deleting the role
         :return: Success boolean
+        :raises PermissionError: Another tenant than the default one deletes a built-in role
         """
-        role = await cls.get_by_name(role_name)
+        role = await cls.get_by_name(role_name, tenant_id)
         if not role:
             return False
+        cls._check_owner(role, tenant_id)
+
+        descendants = (await role_graph.refresh()).descendants(role.id)
+        async with in_transaction():
+            # Blocks new grants of the role until it's gone
+            if not await cls.role.filter(id=role.id).select_for_update().first():
+                return False
+
+            # Members of the role and of roles inheriting from it lose scopes
+            rows = await cls.role._meta.db.execute_query_dict(
+                "WITH marked AS ("
+                'UPDATE "users" SET "effective_scopes" = NULL, "updated_at" = $2 '
+                'WHERE "id" IN (SELECT "users_id" FROM "user_roles" '
+                'WHERE "role_id" = ANY($1::int[])) RETURNING 1'
+                ') SELECT count(*) AS "count" FROM marked',
+                [[role.id, *descendants], datetime.now(dt.UTC)],
+            )
+            await role.delete()
+            await role_graph.bump_version()
+            await EventCRUD.record(
+                "role.deleted",
+                role.id,
+                role.tenant_id,
+                name=role.name,
+                users=rows[0]["count"],
+            )
+
+        await UserCRUD.resync_scopes(progress, batch_size)
+        return True
+
+
+class EventCRUD:
+    """Transactional outbox of user/role changes consumed by downstream caches"""
+
+    event = models.ChangeEvent
+
+    @classmethod
+    async def record(
+        cls, kind: str, entity_id: int, tenant_id: int | None, **payload
+    ) -> None:
+        """
+        Append a change event. Call inside the transaction making the change.
+        :param kind: Event kind, e.g. `user.role_added`
+        :param entity_id: ID of the changed user or role
+        :param tenant_id: Tenant of the entity, None for built-in roles
+        :param payload: JSON-serializable details
+        """
+        await cls.event.create(
+            kind=kind, entity_id=entity_id, tenant_id=tenant_id, payload=payload
+        )
+
+    @classmethod
+    async def get_after(
+        cls, cursor: int, limit: int, tenant_id: int = DEFAULT_TENANT_ID
+    ) -> list[dict]:
+        """
+        Events of the tenant (and of built-in roles) following the cursor, in commit-safe
+        order: by the id of the transaction recording them (`position`), and only from
+        transactions older than every one still running, so a slow transaction can't
+        commit an event behind the cursor. A transaction's events are never split
+        across pages, the last page may exceed `limit` for that.
+        :param cursor: Last `position` the consumer has seen
+        :param limit: Maximum number of events
+        :param tenant_id: Tenant of the consumer
+        """
+        sql = (
+            'SELECT "id", "kind", "entity_id", "payload", "created_at", '
+            '"xid"::text::bigint AS "position" FROM "change_events" '
+            'WHERE ("tenant_id" = $1 OR "tenant_id" IS NULL) AND {} '
+            'ORDER BY "xid", "id" {}'
+        )
+        db = cls.event._meta.db
+        events = await db.execute_query_dict(
+            sql.format(
+                '"xid" > $2::text::xid8 '
+                'AND "xid" < pg_snapshot_xmin(pg_current_snapshot())',
+                "LIMIT $3",
+            ),
+            [tenant_id, str(cursor), limit + 1],
+        )
+        if len(events) <= limit:
+            return events
+
+        last = events[limit]["position"]
+        if events[0]["position"] == last:
+            # One transaction recorded more than a page
+            return await db.execute_query_dict(
+                sql.format('"xid" = $2::text::xid8', ""), [tenant_id, str(last)]
+            )
+        return [event for event in events[:limit] if event["position"] != last]
+
+
+class SessionCRUD:
+    """Refresh token inventory; active sessions are served by a partial index on user_id"""
+
+    session = models.Session
+
+    @classmethod
+    async def create(
+        cls,
+        user_id: int,
+        device: str | None,
+        expires_at: datetime,
+        scopes: list[str] | None = None,
+    ) -> models.Session:
+        """
+        :param scopes: Scopes the login was limited to, None for all the user holds
+        """
+        return await cls.session.create(
+            user_id=user_id,
+            token_id=secrets.token_hex(16),
+            device=device[:255] if device else None,
+            expires_at=expires_at,
+            scopes=scopes,
+        )
+
+    @classmethod
+    async def use(cls, token_id: str) -> bool:
+        """
+        Record use of an active session
+        :param token_id: `jti` of the refresh token
+        :return: Whether the session exists, isn't revoked and hasn't expired
+        """
+        now = datetime.now(dt.UTC)
+        updated = await cls.session.filter(
+            token_id=token_id, revoked_at__isnull=True, expires_at__gt=now
+        ).update(last_used_at=now)
+        return bool(updated)
+
+    @classmethod
+    async def authenticate(cls, token_id: str) -> SessionIdentity | None:
+        """
+        Resolve a session cookie's session to its user. \n
+        The database is only read when the session isn't cached, i.e. at most once
+        per `SESSION_CACHE_SECONDS` per worker.
+        :param token_id: `token_id` of a session cookie, see `auth.parse_session_cookie`
+        :return: None for unknown, revoked or expired sessions and deactivated users
+        """
+        now = datetime.now(dt.UTC)
+        if (identity := _session_cache.get(token_id)) is None:
+            row = (
+                await cls.session.filter(
+                    token_id=token_id,
+                    revoked_at__isnull=True,
+                    expires_at__gt=now,
+                    user__is_active=True,
+                    user__deleted_at__isnull=True,
+                )
+                .first()
+                .values(
+                    "id",
+                    "scopes",
+                    "created_at",
+                    "expires_at",
+                    "user__email",
+                    "user__tenant_id",
+                )
+            )
+            if not row:
+                return None
+
+            identity = SessionIdentity(
+                session_id=row["id"],
+                email=row["user__email"],
+                tenant_id=row["user__tenant_id"],
+                scopes=tuple(row["scopes"]) if row["scopes"] is not None else None,
+                issued_at=row["created_at"],
+                expires_at=row["expires_at"],
+            )
+            _session_cache.set(token_id, identity)
+            # Tracked at cache granularity, so use doesn't cost a write per request
+            await cls.session.filter(id=identity.session_id).update(last_used_at=now)
+
+        if identity.expires_at <= now:
+            return None
+        return identity
+
+    @classmethod
+    async def revoke_token(cls, token_id: str) -> bool:
+        """
+        Revoke the session a cookie names, e.g. on logout.
+        Other workers stop accepting the cookie within `SESSION_CACHE_SECONDS`.
+        """
+        _session_cache.pop(token_id)
+        updated = await cls.session.filter(
+            token_id=token_id, revoked_at__isnull=True
+        ).update(revoked_at=datetime.now(dt.UTC))
+        return bool(updated)
+
+    @classmethod
+    async def get_active(cls, user_id: int) -> list[models.Session]:
+        return await cls.session.filter(
+            user_id=user_id,
+            revoked_at__isnull=True,
+            expires_at__gt=datetime.now(dt.UTC),
+        ).order_by("-created_at")
+
+    @classmethod
+    async def _revoke(cls, now: datetime, condition: str, *args) -> int:
+        """
+        Revoke the active sessions matching `condition` and drop them from this
+        worker's cache, so their cookies stop working here right away
+        :return: Number of revoked sessions
+        """
+        rows = await cls.session._meta.db.execute_query_dict(
+            f'UPDATE "sessions" SET "revoked_at" = $1 '
+            f'WHERE {condition} AND "revoked_at" IS NULL RETURNING "token_id"',
+            [now, *args],
+        )
+        for row in rows:
+            _session_cache.pop(row["token_id"])
+        return len(rows)
+
+    @classmethod
+    async def revoke(cls, user_id: int, session_id: int) -> bool:
+        return bool(
+            await cls._revoke(
+                datetime.now(dt.UTC),
+                '"id" = $2 AND "user_id" = $3',
+                session_id,
+                user_id,
+            )
+        )
+
+    @classmethod
+    async def revoke_all(cls, user_id: int) -> int:
+        """
+        Log the user out everywhere: revoke its sessions and the access tokens and
+        session cookies issued so far (see `User.tokens_revoked_at`)
+        :return: Number of revoked sessions
+        """
+        now = datetime.now(dt.UTC)
+        async with in_transaction():
+            await models.User.filter(id=user_id).update(tokens_revoked_at=now)
+            return await cls._revoke(now, '"user_id" = $2', user_id)
+
+
+class ApiKeyCRUD:
+    """API keys of service accounts, looked up by their public prefix"""
+
+    api_key = models.ApiKey
+
+    @classmethod
+    async def create(
+        cls,
+        user: models.User,
+        name: str,
+        scopes: list[str] | None = None,
+        expires_at: datetime | None = None,
+    ) -> tuple[models.ApiKey, str]:
+        """
+        Issue an API key for a service account
+        :param user: Service account
+        :param name: Label telling the keys of an account apart
+        :param scopes: Scopes granted to exchanged tokens, None for all of the account's
+        :param expires_at: Expiry, None for a key valid until revoked
+        :return: (ApiKey instance, key to hand out; only its hash is stored)
+        :raises ValueError: The account doesn't have some of the scopes
+        """
+        if scopes is not None:
+            if extra := set(scopes) - set(user.effective_scopes or []):
+                raise ValueError(f"Scopes not granted to the account: {sorted(extra)}")
+
+        key, prefix, key_hash = auth.generate_api_key()
+        api_key = await cls.api_key.create(
+            user_id=user.id,
+            prefix=prefix,
+            key_hash=key_hash,
+            name=name,
+            scopes=scopes,
+            expires_at=expires_at,
+        )
+        return api_key, key
+
+    @classmethod
+    async def authenticate(cls, key: str) -> ApiKeyIdentity | None:
+        """
+        Resolve an API key to its service account. \n
+        Checking a key costs one HMAC; the database is only read when the key isn't
+        cached, i.e. at most once per `API_KEY_CACHE_SECONDS` per worker.
+        :return: None for malformed, unknown, revoked or expired keys
+        """
+        if not (parsed := auth.parse_api_key(key)):
+            return None
+
+        prefix, secret = parsed
+        key_hash = auth.hash_api_key(secret)
+        if (identity := _api_key_cache.get(key_hash)) is None:
+            row = (
+                await cls.api_key.filter(
+                    prefix=prefix,
+                    revoked_at__isnull=True,
+                    user__is_active=True,
+                    user__deleted_at__isnull=True,
+                )
+                .first()
+                .values(
+                    "id",
+                    "key_hash",
+                    "scopes",
+                    "expires_at",
+                    "user__email",
+                    "user__tenant_id",
+                )
+            )
+            if not row or not secrets.compare_digest(row["key_hash"], key_hash):
+                return None
+
+            identity = ApiKeyIdentity(
+                api_key_id=row["id"],
+                email=row["user__email"],
+                tenant_id=row["user__tenant_id"],
+                scopes=tuple(row["scopes"]) if row["scopes"] is not None else None,
+                expires_at=row["expires_at"],
+            )
+            _api_key_cache.set(key_hash, identity)
+            # Tracked at cache granularity, so use doesn't cost a write per request
+            await cls.api_key.filter(id=identity.api_key_id).update(
+                last_used_at=datetime.now(dt.UTC)
+            )
+
+        if identity.expires_at and identity.expires_at <= datetime.now(dt.UTC):
+            return None
+        return identity
+
+    @classmethod
+    async def get_active(cls, user_id: int) -> list[models.ApiKey]:
+        return await cls.api_key.filter(
+            user_id=user_id, revoked_at__isnull=True
+        ).order_by("-created_at")
+
+    @classmethod
+    async def revoke(cls, user_id: int, api_key_id: int) -> bool:
+        """
+        Revoke a key. Other workers stop accepting it within `API_KEY_CACHE_SECONDS`.
+        :return: False when the key doesn't exist or was already revoked
+        """
+        api_key = await cls.api_key.get_or_none(
+            id=api_key_id, user_id=user_id, revoked_at__isnull=True
+        )
+        if not api_key:
+            return False
 
-        await role.delete()
+        api_key.revoked_at = datetime.now(dt.UTC)
+        await api_key.save(update_fields=["revoked_at", "updated_at"])
+        _api_key_cache.pop(api_key.key_hash)
         return True
+
+
+class TenantCRUD:
+    tenant = models.Tenant
+
+    @classmethod
+    async def resolve(cls, slug: str) -> int | None:
+        """
+        Tenant ID of a slug, cached since it's looked up on every tenant-scoped request
+        :return: None when there's no such tenant
+        """
+        if (tenant_id := _tenant_cache.get(slug)) is None:
+            tenant_id = (
+                await cls.tenant.filter(slug=slug).first().values_list("id", flat=True)
+            )
+            if tenant_id is not None:
+                _tenant_cache.set(slug, tenant_id)
+
+        return tenant_id
+
+    @classmethod
+    async def get_all(cls) -> list[models.Tenant]:
+        return await cls.tenant.all().order_by("id")
+
+    @classmethod
+    async def seed_default(cls) -> bool:
+        """
+        Create the default tenant when the schema was generated rather than migrated
+        :return: Whether it was created
+        """
+        async with in_transaction() as conn:
+            rows = await conn.execute_query_dict(
+                """
+                INSERT INTO "tenants" ("id", "slug", "name", "created_at", "updated_at")
+                VALUES ($1, 'default', 'Default', now(), now())
+                ON CONFLICT DO NOTHING
+                RETURNING "id"
+                """,
+                [DEFAULT_TENANT_ID],
+            )
+            if rows:
+                # The ID was set explicitly, move the sequence past it
+                await conn.execute_query(
+                    "SELECT setval(pg_get_serial_sequence('tenants', 'id'), "
+                    '(SELECT max("id") FROM "tenants"))'
+                )
+
+        return bool(rows)
+
+    @classmethod
+    async def create(
+        cls, slug: str, name: str, admin: schemas.UserPayload
+    ) -> tuple[models.Tenant, bool]:
+        """
+        Create a tenant together with its first admin
+        :param slug: Unique identifier clients pass in the `X-Tenant` header
+        :param name: Display name
+        :param admin: Sign up payload of the tenant's admin
+        :return: (Tenant instance, created boolean)
+        """
+        async with in_transaction():
+            tenant, created = await cls.tenant.get_or_create(
+                defaults={"name": name}, slug=slug
+            )
+            if created:
+                await UserCRUD.create(admin, is_admin=True, tenant_id=tenant.id)
+
+        return tenant, created
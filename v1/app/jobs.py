@@ -0,0 +1,182 @@
+import asyncio
+import datetime as dt
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from tortoise.transactions import in_transaction
+
+from v1.settings import settings, logger
+from . import models
+from .crud import RoleCRUD, UserCRUD
+
+__all__ = ["JobRunner", "runner"]
+
+ProgressReporter = Callable[[int, int], Awaitable[None]]
+JobHandler = Callable[[models.Job, ProgressReporter], Awaitable[dict | None]]
+
+
+class JobRunner:
+    """
+    In-process async job queue backed by the `jobs` table. \n
+    Jobs run as event loop tasks, at most `concurrency` at a time; handlers are
+    expected to yield regularly (e.g. work in batches) to keep requests responsive.
+    """
+
+    def __init__(self, concurrency: int):
+        self._handlers: dict[str, JobHandler] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+
+    def handler(self, kind: str):
+        """Register the coroutine executing jobs of the given kind"""
+
+        def decorator(fn: JobHandler) -> JobHandler:
+            self._handlers[kind] = fn
+            return fn
+
+        return decorator
+
+    async def submit(
+        self, kind: str, tenant_id: int | None = None, **params
+    ) -> models.Job:
+        """
+        Persist a job and schedule it
+        :param kind: Registered job kind
+        :param tenant_id: Tenant the job works for, its status is only visible to it
+        :param params: JSON-serializable handler parameters
+        :return: Queued job
+        :raises RuntimeError: The runner is shutting down
+        """
+        self._check(kind)
+        job = await models.Job.create(kind=kind, tenant_id=tenant_id, params=params)
+        self._schedule(job)
+        return job
+
+    async def submit_once(
+        self, kind: str, tenant_id: int | None = None, **params
+    ) -> models.Job | None:
+        """
+        `submit`, unless a job of the kind is already queued or running. \n
+        Meant for maintenance every worker would otherwise start at boot: workers
+        checking at the same time are serialized by an advisory lock.
+        :return: Queued job, None when one was pending already
+        """
+        self._check(kind)
+        async with in_transaction() as connection:
+            await connection.execute_query(
+                "SELECT pg_advisory_xact_lock(hashtext($1))", [f"job:{kind}"]
+            )
+            pending = models.Job.filter(
+                kind=kind,
+                status__in=[models.JobStatus.QUEUED, models.JobStatus.RUNNING],
+            )
+            if await pending.using_db(connection).exists():
+                return None
+            job = await models.Job.create(
+                kind=kind, tenant_id=tenant_id, params=params, using_db=connection
+            )
+
+        # Only once committed, so the job's row is visible to the task
+        self._schedule(job)
+        return job
+
+    def _check(self, kind: str) -> None:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self._closed:
+            raise RuntimeError("Shutting down, no new jobs are accepted")
+
+    def _schedule(self, job: models.Job) -> None:
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: models.Job) -> None:
+        try:
+            async with self._semaphore:
+                await self._execute(job)
+        except asyncio.CancelledError:
+            # Cut off by shutdown; recorded now instead of after JOBS_STALE_SECONDS
+            job.status = models.JobStatus.FAILED
+            job.error = "Interrupted by shutdown"
+            job.finished_at = datetime.now(dt.UTC)
+            await job.save(
+                update_fields=["status", "error", "finished_at", "updated_at"]
+            )
+            raise
+
+    async def _execute(self, job: models.Job) -> None:
+        job.status = models.JobStatus.RUNNING
+        job.started_at = datetime.now(dt.UTC)
+        await job.save(update_fields=["status", "started_at", "updated_at"])
+
+        async def report(progress: int, total: int) -> None:
+            job.progress, job.total = progress, total
+            await job.save(update_fields=["progress", "total", "updated_at"])
+
+        try:
+            job.result = await self._handlers[job.kind](job, report)
+            job.status = models.JobStatus.SUCCEEDED
+        except Exception as e:
+            logger.exception(f"Job {job.id} ({job.kind}) failed")
+            job.status = models.JobStatus.FAILED
+            job.error = str(e)
+
+        job.finished_at = datetime.now(dt.UTC)
+        await job.save(
+            update_fields=["status", "result", "error", "finished_at", "updated_at"]
+        )
+
+    @property
+    def active(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Stop accepting jobs and wait for the running and queued ones. \n
+        Jobs still unfinished after `timeout` seconds are cancelled and marked as failed.
+        :return: Number of cancelled jobs
+        """
+        self._closed = True
+        if not self._tasks:
+            return 0
+
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+    async def fail_interrupted(self, stale_after: float) -> int:
+        """
+        Mark jobs abandoned by a dead process as failed. \n
+        Other workers may still be running jobs, so only jobs without progress
+        for `stale_after` seconds are considered abandoned.
+        :return: Number of affected jobs
+        """
+        stale = datetime.now(dt.UTC) - timedelta(seconds=stale_after)
+        return await models.Job.filter(
+            status__in=[models.JobStatus.QUEUED, models.JobStatus.RUNNING],
+            updated_at__lt=stale,
+        ).update(
+            status=models.JobStatus.FAILED,
+            error="Interrupted by a restart",
+            finished_at=datetime.now(dt.UTC),
+        )
+
+
+runner = JobRunner(concurrency=settings.jobs_concurrency)
+
+
+@runner.handler("role.delete")
+async def _delete_role(job: models.Job, report: ProgressReporter) -> dict:
+    deleted = await RoleCRUD.delete_role(
+        job.params["role_name"], progress=report, tenant_id=job.tenant_id
+    )
+    return {"deleted": deleted}
+
+
+@runner.handler("scopes.resync")
+async def _resync_scopes(job: models.Job, report: ProgressReporter) -> dict:
+    return {"synced": await UserCRUD.resync_scopes(progress=report)}
@@ -1,5 +1,8 @@
+from enum import Enum
+
 from ms_core import AbstractModel
 from tortoise import fields
+from tortoise.models import Model
 
 
 class ExtendedAbstractModel(AbstractModel):
@@ -9,11 +12,41 @@ class ExtendedAbstractModel(AbstractModel):
         abstract = True
 
 
+# Tenant of single-tenant deployments and of requests that don't name one
+DEFAULT_TENANT_ID = 1
+
+
+class Tenant(ExtendedAbstractModel):
+    """Institution served by this deployment; users and custom roles belong to one"""
+
+    slug = fields.CharField(64, unique=True)
+    name = fields.TextField()
+
+    class Meta:  # type: ignore
+        table = "tenants"
+
+
 class User(ExtendedAbstractModel):
+    tenant: fields.ForeignKeyRelation[Tenant] = fields.ForeignKeyField(
+        "models.Tenant",
+        related_name="users",
+        on_delete=fields.RESTRICT,
+        default=DEFAULT_TENANT_ID,
+    )
     username = fields.TextField()
-    email = fields.CharField(max_length=255, unique=True)
+    # Unique per tenant
+    email = fields.CharField(max_length=255)
     password_hash = fields.TextField()
     is_active = fields.BooleanField()
+    # Union of the scopes granted by the user's roles, kept in sync by UserCRUD/RoleCRUD.
+    # NULL means it has not been materialized yet.
+    effective_scopes = fields.JSONField(null=True)
+    # Soft-deleted users are kept for references but hidden from listings and auth
+    deleted_at = fields.DatetimeField(null=True)
+    # Machine client authenticating with API keys only, it has no usable password
+    is_service = fields.BooleanField(default=False)
+    # Access tokens issued before this point are rejected (logged out everywhere)
+    tokens_revoked_at = fields.DatetimeField(null=True)
 
     roles: fields.ManyToManyRelation["Role"] = fields.ManyToManyField(
         "models.Role", related_name="users", through="user_roles"
@@ -21,12 +54,120 @@ class User(ExtendedAbstractModel):
 
     class Meta:  # type: ignore
         table = "users"
+        unique_together = (("tenant", "email"),)
 
 
 class Role(ExtendedAbstractModel):
+    # NULL for the built-in roles shared by all tenants
+    tenant: fields.ForeignKeyNullableRelation[Tenant] = fields.ForeignKeyField(
+        "models.Tenant", related_name="roles", on_delete=fields.CASCADE, null=True
+    )
+    # Unique among the built-in roles and the roles of one tenant
     name = fields.CharField(24)
+    # Scopes granted by this role itself and scopes removed from what it inherits
+    additional_scopes = fields.JSONField(default=list)
+    excluded_scopes = fields.JSONField(default=list)
+
+    parents: fields.ManyToManyRelation["Role"] = fields.ManyToManyField(
+        "models.Role",
+        related_name="children",
+        through="role_parents",
+        forward_key="parent_id",
+        backward_key="role_id",
+    )
 
     users: fields.ManyToManyRelation[User]
+    children: fields.ManyToManyRelation["Role"]
 
     class Meta:  # type: ignore
         table = "roles"
+        unique_together = (("tenant", "name"),)
+
+
+class RoleGraph(ExtendedAbstractModel):
+    """Single-row table whose version is bumped on every change of the role hierarchy"""
+
+    version = fields.BigIntField(default=1)
+
+    class Meta:  # type: ignore
+        table = "role_graph"
+
+
+class ChangeEvent(Model):
+    """Outbox row written in the same transaction as the user/role change it describes"""
+
+    id = fields.BigIntField(pk=True)
+    kind = fields.CharField(32)
+    entity_id = fields.IntField()
+    # NULL for changes of built-in roles, which concern every tenant
+    tenant_id = fields.IntField(null=True)
+    payload = fields.JSONField(default=dict)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:  # type: ignore
+        table = "change_events"
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class Job(ExtendedAbstractModel):
+    """Deferred operation executed by the in-process job runner"""
+
+    kind = fields.CharField(32)
+    tenant_id = fields.IntField(null=True)
+    status = fields.CharEnumField(JobStatus, default=JobStatus.QUEUED)
+    params = fields.JSONField(default=dict)
+    progress = fields.IntField(default=0)
+    total = fields.IntField(null=True)
+    result = fields.JSONField(null=True)
+    error = fields.TextField(null=True)
+    started_at = fields.DatetimeField(null=True)
+    finished_at = fields.DatetimeField(null=True)
+
+    class Meta:  # type: ignore
+        table = "jobs"
+
+
+class Session(ExtendedAbstractModel):
+    """Refresh token issued to a device; `created_at` is the issue time"""
+
+    user: fields.ForeignKeyRelation[User] = fields.ForeignKeyField(
+        "models.User", related_name="sessions", on_delete=fields.CASCADE
+    )
+    token_id = fields.CharField(32, unique=True)
+    device = fields.CharField(255, null=True)
+    last_used_at = fields.DatetimeField(null=True)
+    expires_at = fields.DatetimeField()
+    revoked_at = fields.DatetimeField(null=True)
+    # Scopes the login was limited to, NULL for every scope the user holds
+    scopes = fields.JSONField(null=True)
+
+    class Meta:  # type: ignore
+        table = "sessions"
+
+
+class ApiKey(ExtendedAbstractModel):
+    """
+    Credential of a service account. \n
+    Only an HMAC of the secret is stored; the public prefix locates the row.
+    """
+
+    user: fields.ForeignKeyRelation[User] = fields.ForeignKeyField(
+        "models.User", related_name="api_keys", on_delete=fields.CASCADE
+    )
+    prefix = fields.CharField(12, unique=True)
+    key_hash = fields.CharField(64)
+    name = fields.CharField(64)
+    # Subset of the account's scopes granted to exchanged tokens, NULL for all of them
+    scopes = fields.JSONField(null=True)
+    last_used_at = fields.DatetimeField(null=True)
+    expires_at = fields.DatetimeField(null=True)
+    revoked_at = fields.DatetimeField(null=True)
+
+    class Meta:  # type: ignore
+        table = "api_keys"
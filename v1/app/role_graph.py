@@ -0,0 +1,217 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterable, Mapping
+
+from tortoise.expressions import F
+
+from v1.settings import logger
+from . import models
+
+__all__ = [
+    "RoleGraphSnapshot",
+    "current",
+    "load",
+    "refresh",
+    "bump_version",
+    "watch",
+]
+
+
+@dataclass(frozen=True, slots=True)
+class RoleGraphSnapshot:
+    """Immutable, compiled view of the role hierarchy at a given version"""
+
+    version: int
+    # Built-in roles shared by all tenants, name -> id
+    role_ids: Mapping[str, int]
+    # Custom roles, tenant id -> name -> id
+    tenant_role_ids: Mapping[int, Mapping[str, int]]
+    role_parents: Mapping[int, tuple[int, ...]]
+    role_scopes: Mapping[int, frozenset[str]]
+    # Reverse of `role_scopes`: scope -> IDs of the roles granting it
+    scope_roles: Mapping[str, frozenset[int]]
+
+    def role_id(self, role_name: str, tenant_id: int | None = None) -> int | None:
+        """ID of the role visible to the tenant under that name, its own roles first"""
+        own = self.tenant_role_ids.get(tenant_id, {}) if tenant_id is not None else {}
+        if (role_id := own.get(role_name)) is not None:
+            return role_id
+        return self.role_ids.get(role_name)
+
+    def scopes_for(
+        self, role_name: str, tenant_id: int | None = None
+    ) -> frozenset[str]:
+        if (role_id := self.role_id(role_name, tenant_id)) is None:
+            return frozenset()
+        return self.role_scopes[role_id]
+
+    def scopes_for_id(self, role_id: int) -> frozenset[str]:
+        return self.role_scopes.get(role_id, frozenset())
+
+    def roles_granting(
+        self, scope: str, tenant_id: int | None = None
+    ) -> dict[int, str]:
+        """Roles visible to the tenant that grant the scope, inherited or not, id -> name"""
+        granting = self.scope_roles.get(scope, frozenset())
+        own = self.tenant_role_ids.get(tenant_id, {}) if tenant_id is not None else {}
+        return {
+            role_id: name
+            for ids in (self.role_ids, own)
+            for name, role_id in ids.items()
+            if role_id in granting
+        }
+
+    def descendants(self, role_id: int) -> set[int]:
+        """IDs of the roles inheriting (directly or not) from the given role"""
+        found: set[int] = set()
+        frontier = {role_id}
+        while frontier:
+            frontier = {
+                child
+                for child, parents in self.role_parents.items()
+                if child not in found and frontier.intersection(parents)
+            }
+            found |= frontier
+        return found
+
+
+def compile_snapshot(
+    version: int, roles: list[dict], links: Iterable[tuple[int, int]]
+) -> RoleGraphSnapshot:
+    """
+    Resolve inherited and excluded scopes of every role.
+    :param version: Version of the role graph the rows were read at
+    :param roles: Rows with `id`, `name`, `tenant_id` (absent or None for built-in roles),
+        `additional_scopes` and `excluded_scopes`
+    :param links: (role_id, parent_id) pairs
+    :return: RoleGraphSnapshot
+    """
+    by_id = {role["id"]: role for role in roles}
+    parents: dict[int, list[int]] = {role_id: [] for role_id in by_id}
+    for role_id, parent_id in links:
+        if role_id in by_id and parent_id in by_id:
+            parents[role_id].append(parent_id)
+
+    resolved: dict[int, frozenset[str]] = {}
+
+    def resolve(role_id: int, path: tuple[int, ...] = ()) -> frozenset[str]:
+        if role_id in resolved:
+            return resolved[role_id]
+        if role_id in path:
+            raise ValueError(f"Role hierarchy cycle through `{by_id[role_id]['name']}`")
+
+        role = by_id[role_id]
+        scopes = set()
+        for parent_id in parents[role_id]:
+            scopes.update(resolve(parent_id, path + (role_id,)))
+        scopes.update(role["additional_scopes"])
+        scopes -= set(role["excluded_scopes"])
+
+        resolved[role_id] = frozenset(scopes)
+        return resolved[role_id]
+
+    for role_id in by_id:
+        resolve(role_id)
+
+    scope_roles: dict[str, set[int]] = defaultdict(set)
+    for role_id, scopes in resolved.items():
+        for scope in scopes:
+            scope_roles[scope].add(role_id)
+
+    builtin_ids: dict[str, int] = {}
+    tenant_role_ids: dict[int, dict[str, int]] = defaultdict(dict)
+    for role in roles:
+        if (tenant_id := role.get("tenant_id")) is None:
+            builtin_ids[role["name"]] = role["id"]
+        else:
+            tenant_role_ids[tenant_id][role["name"]] = role["id"]
+
+    return RoleGraphSnapshot(
+        version=version,
+        role_ids=MappingProxyType(builtin_ids),
+        tenant_role_ids=MappingProxyType(
+            {
+                tenant_id: MappingProxyType(ids)
+                for tenant_id, ids in tenant_role_ids.items()
+            }
+        ),
+        role_parents=MappingProxyType(
+            {role_id: tuple(ids) for role_id, ids in parents.items()}
+        ),
+        role_scopes=MappingProxyType(resolved),
+        scope_roles=MappingProxyType(
+            {scope: frozenset(ids) for scope, ids in scope_roles.items()}
+        ),
+    )
+
+
+_snapshot = RoleGraphSnapshot(
+    version=0,
+    role_ids=MappingProxyType({}),
+    tenant_role_ids=MappingProxyType({}),
+    role_parents=MappingProxyType({}),
+    role_scopes=MappingProxyType({}),
+    scope_roles=MappingProxyType({}),
+)
+
+
+def current() -> RoleGraphSnapshot:
+    """Snapshot in use by this worker. Readers never lock, writers swap the whole object."""
+    return _snapshot
+
+
+async def _load(version: int) -> RoleGraphSnapshot:
+    roles = await models.Role.all().values(
+        "id", "name", "tenant_id", "additional_scopes", "excluded_scopes"
+    )
+    # Read from the link table directly: Tortoise can't alias a self-referencing
+    # many-to-many join in `values_list` ("table name specified more than once")
+    rows = await models.Role._meta.db.execute_query_dict(
+        'SELECT "role_id", "parent_id" FROM "role_parents"'
+    )
+    links = [(row["role_id"], row["parent_id"]) for row in rows]
+    return compile_snapshot(version, roles, links)
+
+
+async def load() -> RoleGraphSnapshot:
+    """
+    Compile the role graph as the current transaction sees it, without installing it. \n
+    Lets a transaction changing roles resolve scopes from its own changes; other
+    readers only get them through `refresh` once it committed.
+    """
+    versions = await models.RoleGraph.filter(id=1).values_list("version", flat=True)
+    return await _load(versions[0] if versions else 0)
+
+
+async def refresh() -> RoleGraphSnapshot:
+    """Reload and swap the snapshot if the stored version differs from ours"""
+    global _snapshot
+
+    versions = await models.RoleGraph.filter(id=1).values_list("version", flat=True)
+    if not versions or versions[0] == _snapshot.version:
+        return _snapshot
+
+    version = versions[0]
+    snapshot = await _load(version)
+    _snapshot = snapshot
+    logger.info(f"Loaded role graph version {version}")
+    return snapshot
+
+
+async def bump_version() -> None:
+    """Mark the role hierarchy as changed. Call inside the transaction that changed it."""
+    await models.RoleGraph.filter(id=1).update(version=F("version") + 1)
+
+
+async def watch(interval: float) -> None:
+    """Poll for role graph changes made by other workers"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to refresh role graph")
@@ -1,5 +1,13 @@
+from .scopes import validate_role_scopes
+
+
 class RoleScopes:
-    """Alternative approach using explicit role inheritance. Holy vibecode"""
+    """
+    Alternative approach using explicit role inheritance. Holy vibecode
+
+    Only holds the built-in defaults seeded by RoleCRUD.seed_defaults;
+    the live hierarchy is stored in the database and compiled by v1.app.role_graph.
+    """
 
     BASE_ROLES = {
         "student": [
@@ -170,6 +178,15 @@ class RoleScopes:
 
         return issues
 
+    @classmethod
+    def validate_scopes(cls) -> list[str]:
+        """Validate that every scope used by the built-in roles is registered."""
+        used = {role: list(scopes) for role, scopes in cls.BASE_ROLES.items()}
+        for role, config in cls.ROLE_INHERITANCE.items():
+            used[role] = config["additional_scopes"] + config.get("excluded_scopes", [])
+
+        return validate_role_scopes(used)
+
     @classmethod
     def create_role_with_exclusions(
         cls,
@@ -1,7 +1,10 @@
-from pydantic import BaseModel, constr, EmailStr
+from datetime import datetime
+
+from pydantic import BaseModel, constr, EmailStr, Field, field_validator
 from tortoise.contrib.pydantic import pydantic_model_creator
 
-from .models import Role, User
+from .models import Job, Role, Tenant, User
+from .scopes import unknown_scopes
 
 
 class UserPayload(BaseModel):
@@ -10,14 +13,101 @@ class UserPayload(BaseModel):
     password: constr(min_length=8)
 
 
-UserSchema = pydantic_model_creator(User)
+# Full model minus credentials and internal bookkeeping; endpoints return `UserOut`
+UserSchema = pydantic_model_creator(
+    User,
+    exclude=(
+        "password_hash",
+        "effective_scopes",
+        "tokens_revoked_at",
+        "is_service",
+        "deleted_at",
+    ),
+)
+
+
+class RoleRef(BaseModel):
+    id: int
+    name: str
+
+
+class UserSummary(BaseModel):
+    """Lean user representation built from `.values()` rows"""
+
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    created_at: datetime
+    updated_at: datetime
+
+
+class UserOut(UserSummary):
+    roles: list[RoleRef] = []
+
+
+class UserSearchPage(BaseModel):
+    users: list[UserSummary]
+    # Pass back as `after` to get the next page, None when there are no more results
+    next_cursor: str | None
+
+
+class ScopeHoldersPage(BaseModel):
+    scope: str
+    # Roles granting the scope, directly or through inheritance
+    roles: list[str]
+    users: list[UserSummary]
+    # Pass back as `after` to get the next page, None when there are no more results
+    next_cursor: int | None
+
+
+class RoleHierarchyPayload(BaseModel):
+    inherits_from: list[str] = []
+    additional_scopes: list[str] = []
+    excluded_scopes: list[str] = []
+
+    @field_validator("additional_scopes", "excluded_scopes")
+    @classmethod
+    def registered_scopes(cls, value: list[str]) -> list[str]:
+        if unknown := unknown_scopes(value):
+            raise ValueError(f"Unregistered scopes: {sorted(unknown)}")
+        return value
+
+
+class RolePayload(RoleHierarchyPayload):
+    name: str
+
+
+RoleSchema = pydantic_model_creator(Role, exclude=("parents", "children"))
+
+
+class RoleOut(BaseModel):
+    """Lean role representation built from `.values()` rows"""
+
+    id: int
+    name: str
+    additional_scopes: list[str]
+    excluded_scopes: list[str]
+    created_at: datetime
+    updated_at: datetime
+    users: list[UserSummary] = []
+
+
+JobSchema = pydantic_model_creator(Job)
 
 
-class RolePayload(BaseModel):
+class TenantPayload(BaseModel):
+    slug: constr(pattern=r"^[a-z0-9][a-z0-9-]{0,63}$")
     name: str
+    admin: UserPayload
+
 
+TenantSchema = pydantic_model_creator(Tenant, exclude=("users", "roles"))
 
-RoleSchema = pydantic_model_creator(Role)
+
+class JobAccepted(BaseModel):
+    job_id: int
+    status_url: str
 
 
 class CredentialsRequest(BaseModel):
@@ -37,13 +127,75 @@ class TokenSchema(BaseModel):
     scopes: list[str] | None = None
 
 
+class SessionSchema(BaseModel):
+    id: int
+    device: str | None
+    issued_at: datetime
+    last_used_at: datetime | None
+    expires_at: datetime
+
+
 class RefreshTokenSchema(BaseModel):
     refresh_token: str
 
 
+class ServiceAccountPayload(BaseModel):
+    name: constr(pattern=r"^[a-z0-9][a-z0-9-]{0,63}$")
+    roles: list[str]
+
+
+class ApiKeyPayload(BaseModel):
+    name: constr(min_length=1, max_length=64)
+    # Restrict exchanged tokens to these scopes, all of the account's when omitted
+    scopes: list[str] | None = None
+    expires_in_days: int | None = Field(default=None, ge=1)
+
+    @field_validator("scopes")
+    @classmethod
+    def registered_scopes(cls, value: list[str] | None) -> list[str] | None:
+        if value and (unknown := unknown_scopes(value)):
+            raise ValueError(f"Unregistered scopes: {sorted(unknown)}")
+        return value
+
+
+class ApiKeySchema(BaseModel):
+    id: int
+    prefix: str
+    name: str
+    scopes: list[str] | None
+    created_at: datetime
+    last_used_at: datetime | None
+    expires_at: datetime | None
+
+
+class ApiKeyCreated(ApiKeySchema):
+    # Only returned once, store it safely
+    key: str
+
+
+class ApiKeyExchangeRequest(BaseModel):
+    api_key: str
+
+
+class AccessTokenSchema(BaseModel):
+    access_token: str
+    token_type: str
+    expires_in: int
+    scopes: list[str]
+
+
 class TokenIntrospectionRequest(BaseModel):
     token: str
 
 
 class PermissionCheckRequest(BaseModel):
     scope: str
+
+
+class PermissionDecisionRequest(BaseModel):
+    scopes: list[str]
+
+
+class PermissionDecisions(BaseModel):
+    user: str
+    decisions: dict[str, bool]
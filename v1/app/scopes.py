@@ -0,0 +1,71 @@
+import base64
+from typing import Iterable
+
+__all__ = [
+    "SCOPES",
+    "encode_scopes",
+    "decode_scopes",
+    "unknown_scopes",
+    "validate_role_scopes",
+]
+
+# Single source of truth for OAuth2 scopes.
+# Compact tokens encode scopes as a bitmap in declaration order: only ever append.
+SCOPES: dict[str, str] = {
+    # User scopes
+    "users:me": "Read information about the current user",
+    "users:read": "Read users",
+    "users:create": "Create users",
+    # Equipment scopes
+    "equipment:read": "Read equipment catalog",
+    "equipment:create": "Add equipment to catalog",
+    "equipment:update": "Update equipment information",
+    "equipment:delete": "Delete equipment",
+    # Request/Borrow scopes
+    "requests:create": "Create borrow requests",
+    "requests:read": "Read borrow requests",
+    "requests:update": "Update request status",
+    "requests:approve": "Approve/deny requests",
+    # Reports scopes
+    "reports:read": "Generate and read reports",
+    "reports:export": "Export reports and borrowing history",
+    # Admin scopes
+    "admin:full": "Full administrative access",
+    "roles:manage": "Manage user roles",
+}
+
+_BITS = {scope: 1 << i for i, scope in enumerate(SCOPES)}
+_ORDERED = tuple(SCOPES)
+
+
+def encode_scopes(scopes: Iterable[str]) -> str:
+    """Encode scopes as a base64url bitmap, unknown scopes are dropped"""
+    bitmap = 0
+    for scope in scopes:
+        bitmap |= _BITS.get(scope, 0)
+
+    raw = bitmap.to_bytes(max(1, (bitmap.bit_length() + 7) // 8), "little")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_scopes(encoded: str) -> list[str]:
+    raw = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+    bitmap = int.from_bytes(raw, "little")
+    return [scope for i, scope in enumerate(_ORDERED) if bitmap >> i & 1]
+
+
+def unknown_scopes(scopes: Iterable[str]) -> set[str]:
+    return set(scopes) - SCOPES.keys()
+
+
+def validate_role_scopes(role_scopes: dict[str, Iterable[str]]) -> list[str]:
+    """
+    Check role definitions against the registry
+    :param role_scopes: Role name -> scopes it grants or excludes
+    :return: Human-readable issues, empty when valid
+    """
+    return [
+        f"Role '{role}' uses unregistered scopes: {sorted(unknown)}"
+        for role, scopes in role_scopes.items()
+        if (unknown := unknown_scopes(scopes))
+    ]
@@ -0,0 +1,92 @@
+import datetime as dt
+import hashlib
+import json
+from typing import Any
+
+from fastapi import Request, Response, status
+
+from . import models
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional speedup
+    orjson = None
+
+__all__ = [
+    "USER_FIELDS",
+    "ROLE_FIELDS",
+    "json_dumps",
+    "json_response",
+    "user_to_dict",
+    "make_etag",
+    "not_modified",
+]
+
+# Columns exposed by the lean UserSummary/RoleOut schemas
+USER_FIELDS = ("id", "username", "email", "is_active", "created_at", "updated_at")
+ROLE_FIELDS = (
+    "id",
+    "name",
+    "additional_scopes",
+    "excluded_scopes",
+    "created_at",
+    "updated_at",
+)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+
+def json_response(
+    content: Any, status_code: int = 200, etag: str | None = None
+) -> Response:
+    """
+    Serialize already-shaped plain data, skipping FastAPI's response model validation. \n
+    Only pass dicts/lists matching the endpoint's declared response model.
+    """
+    return Response(
+        json_dumps(content),
+        status_code=status_code,
+        media_type="application/json",
+        headers={"ETag": etag} if etag else None,
+    )
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from the values a representation depends on (versions, timestamps, ids)"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+    """
+    304 response if the request's If-None-Match matches the ETag, otherwise None. \n
+    Call before loading or serializing the body.
+    """
+    if not (header := request.headers.get("If-None-Match")):
+        return None
+
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if "*" in candidates or etag in candidates:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    return None
+
+
+def user_to_dict(user: models.User) -> dict:
+    """UserOut-shaped dict from a user instance with prefetched roles"""
+    data = {field: getattr(user, field) for field in USER_FIELDS}
+    data["roles"] = [{"id": role.id, "name": role.name} for role in user.roles]
+    return data
@@ -1,72 +1,143 @@
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, Request, status
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.params import Security
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import OAuth2PasswordBearer, SecurityScopes
 import jwt
 
-from v1.app.auth import oauth2_scheme
+from v1.app import auth, ApiKeyCRUD, SessionCRUD, TenantCRUD, UserCRUD, User
+from v1.app.models import DEFAULT_TENANT_ID
+from v1.app.scopes import SCOPES
 from v1.settings import settings
-from v1.app import UserCRUD, User
 
 
 class OAuth2PasswordBearerCookies(OAuth2PasswordBearer):
-    async def __call__(self, request: Request) -> str | None:
-        exc = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    """
+    Bearer token from the `Authorization` header or, for browsers, the session cookie
+    set at login (see `auth.create_session_cookie`).
+    """
 
-        if not (authorization := request.headers.get("Authorization")):
-            if not (authorization := request.cookies.get("Authorization")):
-                raise exc
-
-        scheme, _, token = authorization.partition(" ")
+    async def __call__(self, request: Request) -> str | None:
+        if authorization := request.headers.get("Authorization"):
+            scheme, _, token = authorization.partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+        elif session := request.cookies.get(auth.SESSION_COOKIE):
+            return session
+
+        if self.auto_error:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return None
 
-        if not authorization or scheme.lower() != "bearer":
-            if self.auto_error:
-                raise exc
-            else:
-                return None
-        return token
 
+oauth2_cookie_scheme = OAuth2PasswordBearerCookies(tokenUrl="token", scopes=SCOPES)
 
 SECRET_KEY, ALGORITHM = settings.security.secret_key, settings.security.algorithm
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+async def get_current_user(
+    security_scopes: SecurityScopes,
+    token: Annotated[str, Depends(oauth2_cookie_scheme)],
+):
+    """
+    User the request authenticates as, by access token, API key or session cookie. \n
+    Scopes required by the route (`require_scopes`, `Security(..., scopes=...)`) must be
+    granted both to the user and to the credential: access tokens carry the scopes
+    they were issued with, API keys may be limited to a subset.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials.",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        print(token, SECRET_KEY, ALGORITHM)
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        if payload.get("token_type") != "access":
+    if token.startswith(auth.API_KEY_PREFIX):
+        # Service accounts may call the API with their key directly
+        if not (identity := await ApiKeyCRUD.authenticate(token)):
             raise credentials_exception
-
-        email: str = payload.get("sub")
-        if not email:
+        email, tenant_id = identity.email, identity.tenant_id
+        # None when the key isn't limited to a subset of the account's scopes
+        credential_scopes = identity.scopes
+        issued_at = None
+    elif token.startswith(auth.SESSION_PREFIX):
+        # Browser session cookie: claims come from the session cache, nothing to decode
+        token_id = auth.parse_session_cookie(token)
+        if not token_id or not (identity := await SessionCRUD.authenticate(token_id)):
             raise credentials_exception
-    except jwt.InvalidTokenError:
+        email, tenant_id = identity.email, identity.tenant_id
+        # None when the login wasn't limited to a subset of the user's scopes
+        credential_scopes = identity.scopes
+        issued_at = identity.issued_at.timestamp()
+    else:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            if payload.get("token_type") != "access":
+                raise credentials_exception
+
+            email: str = payload.get("sub")
+            if not email:
+                raise credentials_exception
+        except jwt.InvalidTokenError:
+            raise credentials_exception
+
+        # Emails are unique per tenant only, the token says which one it was issued for
+        tenant_id = auth.token_tenant_id(payload)
+        credential_scopes = auth.token_scopes(payload)
+        # Tokens issued before `iat` was added count as the oldest possible
+        issued_at = payload.get("iat", 0)
+
+    # Deactivated and deleted users aren't found, so their credentials stop working
+    if not (user := await UserCRUD.get_active_by_email(email, tenant_id)):
         raise credentials_exception
 
-    if not (user := await UserCRUD.get_by_email(email)):
+    # Logging out everywhere revokes the access tokens and sessions issued until then
+    revoked_at = user.tokens_revoked_at
+    if issued_at is not None and revoked_at and issued_at < revoked_at.timestamp():
         raise credentials_exception
 
+    if security_scopes.scopes:
+        await UserCRUD.ensure_effective_scopes(user)
+        granted = set(user.effective_scopes)
+        if credential_scopes is not None:
+            granted.intersection_update(credential_scopes)
+        if not granted.issuperset(security_scopes.scopes):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions",
+                headers={
+                    "WWW-Authenticate": f'Bearer scope="{security_scopes.scope_str}"'
+                },
+            )
+
     return user
 
 
-async def get_current_active_user(
-    current_user: Annotated[User, Security(get_current_user, scopes=["users:me"])],
-) -> User:
-    if not current_user.is_active:
+async def get_request_tenant(
+    x_tenant: Annotated[str | None, Header()] = None,
+) -> int:
+    """
+    Tenant an unauthenticated request (e.g. login) is made to, by the `X-Tenant` slug. \n
+    Requests without the header go to the default tenant. Authenticated requests
+    use the tenant of the current user instead.
+    """
+    if x_tenant is None:
+        return DEFAULT_TENANT_ID
+
+    if (tenant_id := await TenantCRUD.resolve(x_tenant)) is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user."
+            status_code=status.HTTP_404_NOT_FOUND, detail="Unknown tenant."
         )
 
+    return tenant_id
+
+
+async def get_current_active_user(
+    current_user: Annotated[User, Security(get_current_user, scopes=["users:me"])],
+) -> User:
+    """Current user, allowed to act on its own account (`users:me`)"""
     return current_user
 
 
@@ -81,6 +152,21 @@ def require_scopes(*scopes: str):
     return dependency
 
 
+async def require_platform_admin(
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+) -> User:
+    """
+    Admin of the default tenant. \n
+    Tenants' own admins hold `admin:full` too, but only within their tenant; whatever
+    spans tenants (tenant management, worker profiling) is reserved to platform admins.
+    """
+    if current_user.tenant_id != DEFAULT_TENANT_ID:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
+        )
+    return current_user
+
+
 def require_role(role: str):
     """Enhanced role dependency that also validates scopes"""
 
@@ -0,0 +1,120 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator
+
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+
+from v1 import metrics, tracing
+from v1.settings import settings, logger
+
+__all__ = ["QueryStats", "instrument_tortoise", "track_queries", "max_queries"]
+
+_STATEMENT_LIMIT = 2048
+
+query_seconds = metrics.Histogram(
+    "db_query_seconds",
+    "Duration of database queries",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    labels=("operation",),
+)
+slow_queries = metrics.Counter(
+    "db_slow_queries_total",
+    "Queries slower than SLOW_QUERY_MS",
+    labels=("operation",),
+)
+
+
+@dataclass(slots=True)
+class QueryStats:
+    """Queries run within a request (or any block, see `track_queries`)"""
+
+    count: int = 0
+    seconds: float = 0.0
+    # Enclosing stats, e.g. a test's `max_queries` around a request
+    parent: "QueryStats | None" = None
+
+
+_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def _record(operation: str, statement: str, elapsed: float) -> None:
+    stats = _stats.get()
+    while stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        stats = stats.parent
+
+    query_seconds.observe(elapsed, operation=operation)
+
+    slow_ms = settings.telemetry.slow_query_ms
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        slow_queries.inc(operation=operation)
+        trace_id = tracing.current_trace_id()
+        logger.warning(
+            f"Slow query ({elapsed * 1000:.1f} ms, trace {trace_id}): {statement[:500]}"
+        )
+
+
+def instrument_tortoise() -> None:
+    """
+    Hook every query of the asyncpg backend for tracing, counting and the slow-query log. \n
+    All client methods (including in transactions) go through `_translate_exceptions`,
+    which makes it the single place to observe them. Safe to call more than once.
+    """
+    original = AsyncpgDBClient._translate_exceptions
+    if getattr(original, "instrumented", False):
+        return
+
+    async def _translate_exceptions(self, func, *args, **kwargs):
+        if args and isinstance(args[0], str):
+            statement = args[0].lstrip()
+            operation = statement.split(None, 1)[0].upper() if statement else "QUERY"
+        else:
+            # e.g. `start` of a transaction
+            statement, operation = "", func.__name__.upper()
+
+        started = time.perf_counter()
+        try:
+            with tracing.span(
+                f"db {operation}",
+                **{
+                    "db.system": "postgresql",
+                    "db.operation": operation,
+                    "db.statement": statement[:_STATEMENT_LIMIT],
+                },
+            ):
+                return await original(self, func, *args, **kwargs)
+        finally:
+            _record(operation, statement, time.perf_counter() - started)
+
+    _translate_exceptions.instrumented = True
+    AsyncpgDBClient._translate_exceptions = _translate_exceptions
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Count the queries run by the current task (and tasks it spawns) within the block"""
+    stats = QueryStats(parent=_stats.get())
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+
+
+@contextmanager
+def max_queries(limit: int) -> Iterator[QueryStats]:
+    """
+    Fail when the block runs more than `limit` queries. \n
+    Meant for tests and benchmarks guarding against N+1 patterns, e.g.
+    `with max_queries(3): await client.get("/v1/users/me", headers=...)`
+    with an in-process (ASGI) client.
+    :raises AssertionError: Too many queries
+    """
+    with track_queries() as stats:
+        yield stats
+
+    if stats.count > limit:
+        raise AssertionError(f"Expected at most {limit} queries, {stats.count} ran")
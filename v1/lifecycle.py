@@ -0,0 +1,100 @@
+import asyncio
+import time
+from typing import Literal
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from v1 import metrics
+
+__all__ = ["Phase", "Lifecycle", "lifecycle", "Server", "serve"]
+
+# starting -> ready -> draining -> stopped
+Phase = Literal["starting", "ready", "draining", "stopped"]
+
+in_flight = metrics.Gauge("http_requests_in_flight", "Requests being served")
+
+
+class Lifecycle:
+    """
+    Phase of the worker, reported by the health endpoints, and its in-flight requests. \n
+    Once draining, new requests are turned away while the ones in flight finish.
+    Only the event loop thread may use it.
+    """
+
+    def __init__(self):
+        self.phase: Phase = "starting"
+        self.requests = 0
+        self._deadline: float | None = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def accepting(self) -> bool:
+        return self.phase != "draining"
+
+    def request_started(self) -> None:
+        self.requests += 1
+        in_flight.inc()
+        self._idle.clear()
+
+    def request_finished(self) -> None:
+        self.requests -= 1
+        in_flight.dec()
+        if not self.requests:
+            self._idle.set()
+
+    def begin_draining(self, timeout: float) -> None:
+        """
+        Stop accepting requests and start the shutdown budget, unless already draining
+        :param timeout: Seconds the whole shutdown may take from now on
+        """
+        if self._deadline is None:
+            self.phase = "draining"
+            self._deadline = time.monotonic() + timeout
+
+    @property
+    def remaining(self) -> float:
+        """Seconds left of the shutdown budget"""
+        if self._deadline is None:
+            return 0.0
+        return max(self._deadline - time.monotonic(), 0.0)
+
+    async def drain(self) -> bool:
+        """
+        Wait for the requests in flight, within what's left of the shutdown budget
+        :return: Whether they all finished in time
+        """
+        if self._idle.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.remaining)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+lifecycle = Lifecycle()
+
+
+class Server(uvicorn.Server):
+    """
+    Starts draining as soon as the exit signal arrives. \n
+    Uvicorn closes its listeners and waits for open connections before running the
+    lifespan shutdown, so readiness has to fail (and late requests be turned away)
+    from the signal on, and the job drain has to share the same budget.
+    """
+
+    def handle_exit(self, sig, frame) -> None:
+        lifecycle.begin_draining(self.config.timeout_graceful_shutdown or 0)
+        super().handle_exit(sig, frame)
+
+
+def serve(app: str, **options) -> None:
+    """`uvicorn.run` with `Server`, for one or several worker processes"""
+    config = uvicorn.Config(app, **options)
+    server = Server(config)
+    if config.workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
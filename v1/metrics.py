@@ -0,0 +1,117 @@
+import bisect
+from collections import defaultdict
+from typing import Iterable
+
+__all__ = ["Counter", "Gauge", "Histogram", "render", "CONTENT_TYPE"]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry: list["Counter | Gauge | Histogram"] = []
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], **extra: str) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonic per-process counter, exposed in the Prometheus text format"""
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        self._values[tuple(labels[name] for name in self.label_names)] += amount
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Per-process value that goes up and down, exposed in the Prometheus text format"""
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+        _registry.append(self)
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[tuple(labels[name] for name in self.label_names)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        self._values[tuple(labels[name] for name in self.label_names)] += amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} gauge",
+        ]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Per-process histogram with fixed buckets, exposed in the Prometheus text format"""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: Iterable[float],
+        labels: Iterable[str] = (),
+    ):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.label_names = tuple(labels)
+        # Per label set: non-cumulative bucket counts (+Inf last), sum
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.label_names)
+        if (series := self._values.get(key)) is None:
+            series = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _labels(self.label_names, key, le=str(bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total[0]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """All metrics of this worker process in the Prometheus text exposition format"""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
@@ -0,0 +1,242 @@
+import random
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from v1 import admission, metrics, tracing
+from v1.lifecycle import lifecycle
+from v1.instrumentation import track_queries
+from v1.settings import settings, logger
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli-asgi is optional, gzip is used without it
+    BrotliMiddleware = None
+
+__all__ = [
+    "CompressionMiddleware",
+    "TracingMiddleware",
+    "QueryStatsMiddleware",
+    "AdmissionMiddleware",
+    "LifecycleMiddleware",
+]
+
+queries_per_request = metrics.Histogram(
+    "http_request_db_queries",
+    "Database queries run per request",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+    labels=("route",),
+)
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses above `COMPRESSION_MIN_SIZE` with gzip, or brotli when
+    `brotli-asgi` is installed (falling back to gzip for clients without `br`). \n
+    Paths ending with one of `excluded_suffixes` bypass compression, since the
+    compressors buffer output and would hold back Server-Sent Events.
+    """
+
+    def __init__(
+        self, app: ASGIApp, excluded_suffixes: tuple[str, ...] = ("/events/stream",)
+    ) -> None:
+        self.app = app
+        self.excluded_suffixes = excluded_suffixes
+
+        server = settings.server
+        if server.compression == "brotli" and BrotliMiddleware is None:
+            logger.warning("COMPRESSION=brotli needs the `brotli` extra, using gzip")
+
+        if server.compression == "off":
+            self.compressed = app
+        elif server.compression == "brotli" and BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(
+                app,
+                quality=server.compression_level,
+                minimum_size=server.compression_min_size,
+                gzip_fallback=True,
+            )
+        else:
+            self.compressed = GZipMiddleware(
+                app,
+                minimum_size=server.compression_min_size,
+                compresslevel=server.compression_level,
+            )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and not scope["path"].endswith(
+            self.excluded_suffixes
+        ):
+            await self.compressed(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+class TracingMiddleware:
+    """
+    Starts a trace per HTTP request, recorded as a server span named after the route. \n
+    The trace id is returned in `traceparent` and `X-Trace-Id` response headers,
+    whether or not the request was sampled, so it can be quoted in bug reports.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace, _ = tracing.start_trace(Headers(scope=scope).get("traceparent"))
+        try:
+            with tracing.span(
+                f"{scope['method']} {scope['path']}",
+                **{"http.method": scope["method"], "http.target": scope["path"]},
+            ) as root:
+                await self._call_traced(scope, receive, send, trace, root)
+        finally:
+            tracing.finish_trace(trace)
+
+    async def _call_traced(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        trace: tracing.Trace,
+        root: tracing.Span | None,
+    ) -> None:
+        # Unsampled requests have no span, but W3C requires a non-zero parent id
+        span_id = root.span_id if root else f"{random.getrandbits(64) or 1:016x}"
+        flags = "01" if trace.sampled else "00"
+
+        async def send_with_trace(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["traceparent"] = f"00-{trace.trace_id}-{span_id}-{flags}"
+                headers["X-Trace-Id"] = trace.trace_id
+                if root:
+                    root.attributes["http.status_code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            if root:
+                root.kind = 2
+                # Routing fills in the matched route, giving a low-cardinality name
+                if route := getattr(scope.get("route"), "path", None):
+                    root.name = f"{scope['method']} {route}"
+                    root.attributes["http.route"] = route
+
+
+class QueryStatsMiddleware:
+    """
+    Counts the database queries of each request. \n
+    Outside production the count and time spent are returned in `X-DB-Queries` and
+    `X-DB-Time-Ms` headers; in every environment they feed `http_request_db_queries`.
+    Queries made after the response started (e.g. while streaming) only reach the metric.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.headers = not settings.is_prod
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+
+            async def send_with_stats(message: Message) -> None:
+                if self.headers and message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers["X-DB-Queries"] = str(stats.count)
+                    headers["X-DB-Time-Ms"] = f"{stats.seconds * 1000:.1f}"
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_stats)
+            finally:
+                route = getattr(scope.get("route"), "path", "unmatched")
+                queries_per_request.observe(stats.count, route=route)
+
+
+class AdmissionMiddleware:
+    """
+    Admission control: caps concurrent requests per class (`ADMISSION_*` settings)
+    so expensive endpoints like password logins can't starve cheap ones. \n
+    Requests over the limit wait in a bounded queue; when it's full or the wait exceeds
+    the class timeout they're shed with 503 and `Retry-After`.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.controller = admission.controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Routes are configured relative to the mount point, like the routers' paths
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path) :]
+
+        if (name := self.controller.classify(scope["method"], path)) is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            held = await self.controller.acquire(name)
+        except admission.Shed:
+            retry_after = self.controller.classes[name].retry_after
+            response = JSONResponse(
+                {"detail": "Server busy, retry later."},
+                status_code=503,
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(held)
+
+
+class LifecycleMiddleware:
+    """
+    Counts in-flight requests so shutdown can wait for them (see `v1.lifecycle`). \n
+    While the worker drains, new requests other than health checks get 503 with
+    `Connection: close`, sending clients and load balancers to another worker.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.lifecycle = lifecycle
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if not self.lifecycle.accepting:
+            path, root_path = scope["path"], scope.get("root_path", "")
+            if not path.removeprefix(root_path).startswith("/health/"):
+                response = JSONResponse(
+                    {"detail": "Shutting down, retry later."},
+                    status_code=503,
+                    headers={"Connection": "close", "Retry-After": "1"},
+                )
+                await response(scope, receive, send)
+                return
+
+        self.lifecycle.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.lifecycle.request_finished()
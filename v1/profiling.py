@@ -0,0 +1,151 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime, timezone
+from types import FrameType
+
+from v1 import metrics
+from v1.settings import settings, logger
+
+__all__ = ["ProfilerBusy", "profile", "LoopLagMonitor", "loop_monitor"]
+
+loop_stalls = metrics.Counter(
+    "event_loop_stalls_total", "Event loop stalls longer than LOOP_STALL_MS"
+)
+loop_lag_seconds = metrics.Histogram(
+    "event_loop_lag_seconds",
+    "Delay of the event loop lag monitor's heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _collapse(frame: FrameType | None) -> str:
+    """Stack in the collapsed format of flamegraph.pl / speedscope, root first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _is_idle(frame: FrameType | None) -> bool:
+    """Whether the event loop is waiting for I/O rather than running code"""
+    return frame is not None and frame.f_code.co_filename.endswith("selectors.py")
+
+
+_profile_lock = asyncio.Lock()
+
+
+async def profile(seconds: float, interval: float, include_idle: bool = False) -> str:
+    """
+    Sample the stack of this worker's event loop thread from a background thread. \n
+    Sampling only reads frames, so the overhead is bounded by `interval` and doesn't
+    depend on how much code runs. One profile runs at a time per worker.
+    :param seconds: Profile duration
+    :param interval: Seconds between samples
+    :param include_idle: Keep samples taken while the loop waits for I/O
+    :return: Collapsed stacks, one `stack count` line each
+    :raises ProfilerBusy: Another profile is running
+    """
+    if _profile_lock.locked():
+        raise ProfilerBusy
+
+    async with _profile_lock:
+        loop_thread = threading.get_ident()
+        samples: Counter[str] = Counter()
+        stop = threading.Event()
+
+        def sample() -> None:
+            while not stop.wait(interval):
+                frame = sys._current_frames().get(loop_thread)
+                if include_idle or not _is_idle(frame):
+                    samples[_collapse(frame)] += 1
+
+        sampler = threading.Thread(target=sample, name="profiler", daemon=True)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join)
+
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+class LoopLagMonitor:
+    """
+    Detects event loop stalls, e.g. CPU-bound work like password hashing on the loop. \n
+    A heartbeat task measures how late the loop runs it; a watchdog thread notices a
+    missing heartbeat while the stall is still happening and captures the loop's stack.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.05, history: int = 50):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: deque[dict] = deque(maxlen=history)
+        self._beat = time.monotonic()
+        self._stack: str | None = None
+        self._task: asyncio.Task | None = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        threading.Thread(
+            target=self._watch, args=(loop_thread,), name="loop-watchdog", daemon=True
+        ).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+
+            lag = now - expected
+            loop_lag_seconds.observe(max(lag, 0))
+            if lag >= self.threshold:
+                self._record(lag)
+            else:
+                # Captured on the edge of a stall that ended just in time
+                self._stack = None
+
+    def _record(self, lag: float) -> None:
+        stack, self._stack = self._stack, None
+        loop_stalls.inc()
+        self.stalls.append(
+            {
+                "ended_at": datetime.now(timezone.utc).isoformat(),
+                "duration_ms": round(lag * 1000, 1),
+                "stack": stack,
+            }
+        )
+        logger.warning(
+            f"Event loop stalled for {lag * 1000:.0f} ms"
+            + (f" in:\n{stack}" if stack else "")
+        )
+
+    def _watch(self, loop_thread: int) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            stalled = time.monotonic() - self._beat > self.interval + self.threshold
+            if stalled and self._stack is None:
+                frame = sys._current_frames().get(loop_thread)
+                self._stack = "".join(traceback.format_stack(frame)) if frame else None
+
+
+loop_monitor = LoopLagMonitor(threshold=settings.telemetry.loop_stall_ms / 1000)
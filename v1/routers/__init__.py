@@ -0,0 +1,25 @@
+"""Static router registry used by `main.include_routers` in the `fast` startup mode"""
+
+from . import (
+    auth,
+    events,
+    jobs,
+    misc,
+    profiling,
+    roles,
+    service_accounts,
+    tenants,
+    users,
+)
+
+ROUTERS = (
+    auth,
+    events,
+    jobs,
+    misc,
+    profiling,
+    roles,
+    service_accounts,
+    tenants,
+    users,
+)
@@ -1,4 +1,6 @@
-from datetime import timedelta
+import asyncio
+import datetime as dt
+from datetime import datetime, timedelta
 from typing import Annotated
 
 from fastapi import APIRouter, HTTPException, Request, Response, Depends, status
@@ -6,10 +8,12 @@ from fastapi.params import Security
 from fastapi.security import OAuth2PasswordRequestForm
 import jwt
 
-from v1.app import UserCRUD, auth, schemas
+from v1.app import ApiKeyCRUD, SessionCRUD, UserCRUD, auth, role_graph, schemas
 from v1.app.models import User
-from v1.dependencies import get_current_active_user
+from v1.app.serialization import json_response, make_etag, not_modified
+from v1.dependencies import get_current_active_user, get_request_tenant
 from v1.settings import settings
+from v1.tracing import traced
 
 __tags__ = ["auth"]
 __prefix__ = ""
@@ -17,54 +21,69 @@ __prefix__ = ""
 router = APIRouter()
 
 
+@traced("auth.get_user_roles_and_scopes")
 async def _get_user_roles_and_scopes(user: User) -> tuple[list, list, list]:
     """
-    Get user roles and aggregate scopes.
+    Get user roles and their aggregated scopes.
+    Scopes come from the materialized `effective_scopes` column, roles reuse the prefetch when present.
     Returns: (role_ids, role_names, aggregated_scopes)
     """
-    user_roles = await user.roles.all()
+    if user.roles._fetched:
+        user_roles = list(user.roles)
+    else:
+        user_roles = await user.roles.all()
+
     if not user_roles:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User has no assigned roles",
         )
 
-    all_user_scopes = set()
-    role_names = []
-    role_ids = []
+    await UserCRUD.ensure_effective_scopes(user)
 
-    for role in user_roles:
-        role_scopes = auth.get_scopes_for_role(role.name)
-        all_user_scopes.update(role_scopes)
-        role_names.append(role.name)
-        role_ids.append(role.id)
+    role_names = [role.name for role in user_roles]
+    role_ids = [role.id for role in user_roles]
 
-    return role_ids, role_names, list(all_user_scopes)
+    return role_ids, role_names, list(user.effective_scopes)
 
 
-def _create_token_data(user_email: str, role_ids: list, role_names: list) -> dict:
+def _create_token_data(
+    user_email: str, role_ids: list, role_names: list, tenant_id: int
+) -> dict:
     """Create standardized token data payload."""
+    if settings.security.compact_tokens:
+        return {"sub": user_email, "tid": tenant_id, "rid": role_ids}
+
     return {
         "sub": user_email,
+        "tid": tenant_id,
         "roles": role_ids,
         "role_names": role_names,
     }
 
 
-def _set_auth_cookie(response: Response, access_token: str) -> None:
-    """Set authentication cookie with standard parameters."""
+def _set_session_cookie(response: Response, token_id: str) -> None:
+    """Set the browser session cookie of the login session with standard parameters."""
     response.set_cookie(
-        "Authorization",
-        f"Bearer {access_token}",
+        auth.SESSION_COOKIE,
+        auth.create_session_cookie(token_id),
         max_age=settings.security.access_token_expire_minutes * 60,
         httponly=True,
+        secure=True,
+        samesite="lax",
+    )
+
+
+def _clear_session_cookie(response: Response) -> None:
+    """Delete the browser session cookie, matching the parameters it was set with."""
+    response.delete_cookie(
+        auth.SESSION_COOKIE, httponly=True, secure=True, samesite="lax"
     )
 
 
 def _decode_jwt_token(token: str, secret_key: str) -> dict:
     """Decode JWT token with error handling."""
     try:
-        print(token, secret_key, settings.security.algorithm)
         return jwt.decode(
             token,
             secret_key,
@@ -76,14 +95,21 @@ def _decode_jwt_token(token: str, secret_key: str) -> dict:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
-async def _validate_user_by_email(email: str) -> User:
-    """Validate and return user by email."""
-    user = await UserCRUD.get_by_email(email)
+@traced("auth.get_user_by_email")
+async def _validate_user_by_email(email: str, tenant_id: int) -> User:
+    """Validate and return user by email. Deactivated and deleted users are not found."""
+    user = await UserCRUD.get_active_by_email(email, tenant_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
+def _legacy_refresh_accepted() -> bool:
+    """Whether refresh tokens issued before sessions existed (no `jti`) still work"""
+    cutoff = settings.security.legacy_refresh_tokens_until
+    return cutoff is not None and datetime.now(dt.UTC) < cutoff
+
+
 def _filter_scopes(requested_scopes: list, available_scopes: list) -> list:
     """Filter requested scopes to only include allowed ones."""
     if not requested_scopes:
@@ -93,31 +119,61 @@ def _filter_scopes(requested_scopes: list, available_scopes: list) -> list:
 
 @router.post("/token")
 async def login_for_token(
-    *, form_data: Annotated[OAuth2PasswordRequestForm, Depends()], response: Response
+    *,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    request: Request,
+    response: Response,
+    tenant_id: Annotated[int, Depends(get_request_tenant)],
 ) -> schemas.TokenSchema:
-    user = await _validate_user_by_email(form_data.username)
+    user = await _validate_user_by_email(form_data.username, tenant_id)
 
-    if not auth.verify_password(form_data.password, user.password_hash):
+    if user.is_service:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Service accounts authenticate with API keys",
+        )
+
+    # Off the event loop: a hash costs tens of milliseconds of CPU
+    if not await asyncio.to_thread(
+        auth.verify_password, form_data.password, user.password_hash
+    ):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="The password is incorrect"
         )
 
+    # Transparently upgrade hashes made with an outdated scheme or cost
+    if auth.password_needs_rehash(user.password_hash):
+        user.password_hash = await asyncio.to_thread(
+            auth.hash_password, form_data.password
+        )
+        await UserCRUD.update_password_hash(user.id, user.password_hash)
+
     role_ids, role_names, user_scopes = await _get_user_roles_and_scopes(user)
     final_scopes = _filter_scopes(form_data.scopes or [], user_scopes)
 
-    token_data = _create_token_data(user.email, role_ids, role_names)
+    token_data = _create_token_data(user.email, role_ids, role_names, user.tenant_id)
     access_token = auth.create_access_token(
         data=token_data,
         expires_delta=timedelta(minutes=settings.security.access_token_expire_minutes),
         scopes=final_scopes,
     )
 
+    refresh_delta = timedelta(days=settings.security.refresh_token_expire_days)
+    session = await SessionCRUD.create(
+        user.id,
+        device=request.headers.get("User-Agent"),
+        expires_at=datetime.now(dt.UTC) + refresh_delta,
+        # The session cookie must not grant more than the access token
+        scopes=final_scopes if form_data.scopes else None,
+    )
     refresh_token = auth.create_refresh_token(
         email=user.email,
-        expires_delta=timedelta(days=settings.security.refresh_token_expire_days),
+        expires_delta=refresh_delta,
+        token_id=session.token_id,
+        tenant_id=user.tenant_id,
     )
 
-    _set_auth_cookie(response, access_token)
+    _set_session_cookie(response, session.token_id)
 
     return schemas.TokenSchema(
         access_token=access_token,
@@ -127,13 +183,49 @@ async def login_for_token(
     )
 
 
+@router.post("/token/api-key")
+async def exchange_api_key(
+    payload: schemas.ApiKeyExchangeRequest,
+) -> schemas.AccessTokenSchema:
+    """
+    Trade a service account's API key for a short-lived access token. \n
+    Keys are checked with a single HMAC (and usually a cache hit), so unlike `/token`
+    this never pays for a password hash. No refresh token is issued: exchange again.
+    """
+    if not (identity := await ApiKeyCRUD.authenticate(payload.api_key)):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+    user = await _validate_user_by_email(identity.email, identity.tenant_id)
+    role_ids, role_names, user_scopes = await _get_user_roles_and_scopes(user)
+    if identity.scopes is not None:
+        user_scopes = [scope for scope in user_scopes if scope in identity.scopes]
+
+    minutes = settings.security.api_key_token_minutes
+    access_token = auth.create_access_token(
+        data=_create_token_data(user.email, role_ids, role_names, user.tenant_id),
+        expires_delta=timedelta(minutes=minutes),
+        scopes=user_scopes,
+    )
+
+    return schemas.AccessTokenSchema(
+        access_token=access_token,
+        token_type="bearer",
+        expires_in=minutes * 60,
+        scopes=user_scopes,
+    )
+
+
 @router.post("/introspect")
 async def introspect_token(
     request: Request, token_data: schemas.TokenIntrospectionRequest
 ):
     try:
         payload = _decode_jwt_token(token_data.token, settings.security.secret_key)
-        return {"active": True, "payload": payload, "scopes": payload.get("scopes", [])}
+        return {
+            "active": True,
+            "payload": payload,
+            "scopes": auth.token_scopes(payload),
+        }
     except jwt.ExpiredSignatureError:
         return {"active": False, "error": "expired"}
     except jwt.InvalidTokenError:
@@ -155,17 +247,28 @@ async def refresh_token(
     if not email:
         raise HTTPException(status_code=400, detail="Invalid token")
 
-    user = await _validate_user_by_email(email)
+    token_id = refresh_payload.get("jti")
+    if token_id:
+        if not await SessionCRUD.use(token_id):
+            raise HTTPException(status_code=401, detail="Session revoked")
+    elif not _legacy_refresh_accepted():
+        raise HTTPException(status_code=401, detail="Refresh token no longer accepted")
+
+    user = await _validate_user_by_email(email, auth.token_tenant_id(refresh_payload))
+    if not token_id and user.tokens_revoked_at:
+        # Legacy tokens can't be revoked one by one, logging out everywhere ends all
+        raise HTTPException(status_code=401, detail="Session revoked")
     role_ids, role_names, user_scopes = await _get_user_roles_and_scopes(user)
 
-    token_data = _create_token_data(user.email, role_ids, role_names)
+    token_data = _create_token_data(user.email, role_ids, role_names, user.tenant_id)
     access_token = auth.create_access_token(
         data=token_data,
         expires_delta=timedelta(minutes=settings.security.access_token_expire_minutes),
         scopes=user_scopes,
     )
 
-    _set_auth_cookie(response, access_token)
+    if token_id:
+        _set_session_cookie(response, token_id)
 
     return schemas.TokenSchema(
         access_token=access_token,
@@ -175,71 +278,135 @@ async def refresh_token(
     )
 
 
-@router.get("/logout")
+@router.post("/logout")
 async def logout(
-    response: Response, _: Annotated[User, Security(get_current_active_user)]
+    request: Request,
+    response: Response,
+    _: Annotated[User, Security(get_current_active_user)],
 ):
-    response.delete_cookie(key="Authorization")
+    """Log out; a browser session also loses its refresh token"""
+    cookie = request.cookies.get(auth.SESSION_COOKIE)
+    if cookie and (token_id := auth.parse_session_cookie(cookie)):
+        await SessionCRUD.revoke_token(token_id)
+
+    _clear_session_cookie(response)
     return {"message": "Logout successful"}
 
 
+@router.get("/sessions")
+async def get_my_sessions(
+    current_user: Annotated[User, Security(get_current_active_user)],
+) -> list[schemas.SessionSchema]:
+    """List the current user's active sessions (issued refresh tokens)"""
+    return [
+        schemas.SessionSchema(
+            id=session.id,
+            device=session.device,
+            issued_at=session.created_at,
+            last_used_at=session.last_used_at,
+            expires_at=session.expires_at,
+        )
+        for session in await SessionCRUD.get_active(current_user.id)
+    ]
+
+
+@router.delete("/sessions/{session_id}")
+async def revoke_my_session(
+    session_id: int,
+    current_user: Annotated[User, Security(get_current_active_user)],
+) -> dict:
+    if not await SessionCRUD.revoke(current_user.id, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    return {"message": "Session revoked"}
+
+
+@router.post("/logout-everywhere")
+async def logout_everywhere(
+    response: Response,
+    current_user: Annotated[User, Security(get_current_active_user)],
+) -> dict:
+    """Revoke every refresh token of the current user"""
+    revoked = await SessionCRUD.revoke_all(current_user.id)
+    _clear_session_cookie(response)
+    return {"message": "Logged out everywhere", "revoked_sessions": revoked}
+
+
+def _me_etag(kind: str, user: User) -> str:
+    """ETag of per-user views: change with the user's row or the role hierarchy"""
+    return make_etag(kind, user.id, user.updated_at, role_graph.current().version)
+
+
 @router.get("/me/scopes")
 async def get_my_scopes(
+    request: Request,
     current_user: Annotated[User, Security(get_current_active_user)],
 ) -> dict:
     """Get current user's available scopes from all assigned roles"""
+    etag = _me_etag("me/scopes", current_user)
+    if response := not_modified(request, etag):
+        return response
+
     try:
         role_ids, role_names, all_scopes = await _get_user_roles_and_scopes(
             current_user
         )
 
         # Build detailed role info
-        user_roles = await current_user.roles.all()
         role_info = [
             {
-                "name": role.name,
-                "id": role.id,
-                "scopes": auth.get_scopes_for_role(role.name),
+                "name": role_name,
+                "id": role_id,
+                "scopes": auth.get_scopes_for_role_id(role_id),
             }
-            for role in user_roles
+            for role_id, role_name in zip(role_ids, role_names)
         ]
 
-        return {
+        content = {
             "user": current_user.email,
             "roles": role_info,
             "available_scopes": all_scopes,
         }
     except HTTPException:
-        return {
+        content = {
             "user": current_user.email,
             "roles": [],
             "available_scopes": [],
         }
 
+    return json_response(content, etag=etag)
+
 
 @router.get("/me/roles")
 async def get_my_roles(
+    request: Request,
     current_user: Annotated[User, Security(get_current_active_user)],
 ) -> dict:
     """Get current user's assigned roles with details"""
-    user_roles = await current_user.roles.all()
+    etag = _me_etag("me/roles", current_user)
+    if response := not_modified(request, etag):
+        return response
 
+    # Roles are prefetched by get_current_user
     roles_data = [
         {
             "id": role.id,
             "name": role.name,
-            "scopes": auth.get_scopes_for_role(role.name),
-            "created_at": getattr(role, "created_at", None),
-            "updated_at": getattr(role, "updated_at", None),
+            "scopes": auth.get_scopes_for_role_id(role.id),
+            "created_at": role.created_at,
+            "updated_at": role.updated_at,
         }
-        for role in user_roles
+        for role in current_user.roles
     ]
 
-    return {
-        "user": current_user.email,
-        "roles": roles_data,
-        "total_roles": len(roles_data),
-    }
+    return json_response(
+        {
+            "user": current_user.email,
+            "roles": roles_data,
+            "total_roles": len(roles_data),
+        },
+        etag=etag,
+    )
 
 
 @router.post("/me/check-permission")
@@ -248,16 +415,27 @@ async def check_user_permission(
     current_user: Annotated[User, Security(get_current_active_user)],
 ) -> dict:
     """Check if current user has specific permission/scope"""
-    try:
-        _, _, all_scopes = await _get_user_roles_and_scopes(current_user)
-        has_permission = permission_request.scope in all_scopes
-    except HTTPException:
-        all_scopes = []
-        has_permission = False
+    await UserCRUD.ensure_effective_scopes(current_user)
+    all_scopes = frozenset(current_user.effective_scopes)
 
     return {
         "user": current_user.email,
         "scope": permission_request.scope,
-        "has_permission": has_permission,
-        "user_scopes": all_scopes,
+        "has_permission": permission_request.scope in all_scopes,
+        "user_scopes": sorted(all_scopes),
     }
+
+
+@router.post("/me/permissions")
+async def decide_permissions(
+    decision_request: schemas.PermissionDecisionRequest,
+    current_user: Annotated[User, Security(get_current_active_user)],
+) -> schemas.PermissionDecisions:
+    """Check many scopes at once, answering only with the decisions"""
+    await UserCRUD.ensure_effective_scopes(current_user)
+    all_scopes = frozenset(current_user.effective_scopes)
+
+    return schemas.PermissionDecisions(
+        user=current_user.email,
+        decisions={scope: scope in all_scopes for scope in decision_request.scopes},
+    )
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.responses import StreamingResponse
+
+from v1.app import EventCRUD, User
+from v1.app.serialization import json_dumps
+from v1.dependencies import require_scopes
+from v1.settings import settings
+
+__tags__ = ["events"]
+__prefix__ = "/events"
+
+router = APIRouter()
+
+_KEEPALIVE_SECONDS = 15
+
+
+@router.get("/")
+async def poll_events(
+    current_user: Annotated[User, Depends(require_scopes("users:read"))],
+    after: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    wait: Annotated[float, Query(ge=0, le=30)] = 0,
+) -> dict:
+    """
+    Long-poll change events following the `after` cursor. \n
+    Waits up to `wait` seconds for new events; pass the returned cursor on the next call.
+    """
+    deadline = time.monotonic() + wait
+    tenant_id = current_user.tenant_id
+    while not (events := await EventCRUD.get_after(after, limit, tenant_id)):
+        if time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(settings.events_poll_seconds)
+
+    return {"events": events, "cursor": events[-1]["position"] if events else after}
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    current_user: Annotated[User, Depends(require_scopes("users:read"))],
+    after: Annotated[int, Query(ge=0)] = 0,
+    last_event_id: Annotated[int | None, Header()] = None,
+) -> StreamingResponse:
+    """
+    Server-Sent Events stream of change events. \n
+    Reconnecting clients resume from the `Last-Event-ID` header, falling back to `after`.
+    """
+    cursor = last_event_id if last_event_id is not None else after
+    tenant_id = current_user.tenant_id
+
+    async def stream():
+        nonlocal cursor
+        idle_since = time.monotonic()
+
+        while not await request.is_disconnected():
+            events = await EventCRUD.get_after(cursor, 100, tenant_id)
+            for event in events:
+                cursor = event["position"]
+                yield (
+                    f"id: {event['position']}\n"
+                    f"event: {event['kind']}\n"
+                    f"data: {json_dumps(event).decode()}\n\n"
+                )
+
+            if events:
+                idle_since = time.monotonic()
+                continue
+
+            if time.monotonic() - idle_since >= _KEEPALIVE_SECONDS:
+                idle_since = time.monotonic()
+                yield ": keepalive\n\n"
+
+            await asyncio.sleep(settings.events_poll_seconds)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,32 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from v1.app import User, schemas
+from v1.app.models import Job
+from v1.dependencies import require_scopes
+
+__tags__ = ["jobs"]
+__prefix__ = "/jobs"
+
+router = APIRouter()
+
+
+@router.get("/")
+async def get_recent_jobs(
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+) -> list[schemas.JobSchema]:
+    return await Job.filter(tenant_id=current_user.tenant_id).order_by("-id").limit(50)
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: int,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+) -> schemas.JobSchema:
+    if not (job := await Job.get_or_none(id=job_id, tenant_id=current_user.tenant_id)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found."
+        )
+
+    return job
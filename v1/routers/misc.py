@@ -1,6 +1,11 @@
-from fastapi import APIRouter
+import hmac
+from typing import Annotated
 
-from v1.settings import settings, logger
+from fastapi import APIRouter, Header, HTTPException, Response, status
+
+from v1 import metrics
+from v1.lifecycle import lifecycle
+from v1.settings import settings
 
 __tags__ = ["misc"]
 __prefix__ = ""
@@ -13,3 +18,38 @@ async def get_api_info():
     return dict(
         api_version=settings.api.version, build_version=settings.api.build_version
     )
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: Annotated[str | None, Header()] = None):
+    """
+    Metrics of the worker process serving the request, in the Prometheus text format. \n
+    Requires `METRICS_TOKEN` as a bearer token; without one configured the endpoint
+    only exists outside production.
+    """
+    if token := settings.telemetry.metrics_token:
+        expected = f"Bearer {token}"
+        if not authorization or not hmac.compare_digest(authorization, expected):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+    elif settings.is_prod:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@router.get("/health/live", include_in_schema=False)
+async def get_liveness():
+    """The worker's event loop responds; restart it when this fails"""
+    return {"status": "alive", "phase": lifecycle.phase}
+
+
+@router.get("/health/ready", include_in_schema=False)
+async def get_readiness(response: Response):
+    """Whether to route traffic here: 503 while starting up and while draining"""
+    if lifecycle.phase != "ready":
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": lifecycle.phase, "in_flight": lifecycle.requests}
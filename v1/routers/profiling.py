@@ -0,0 +1,44 @@
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from v1 import profiling
+from v1.dependencies import require_platform_admin
+
+__tags__ = ["profiling"]
+__prefix__ = "/profiling"
+
+router = APIRouter()
+
+
+@router.post("/cpu", response_class=PlainTextResponse)
+async def profile_cpu(
+    _: Annotated[Any, Depends(require_platform_admin)],
+    seconds: Annotated[float, Query(gt=0, le=60)] = 10,
+    interval_ms: Annotated[float, Query(ge=1, le=100)] = 5,
+    include_idle: bool = False,
+) -> str:
+    """
+    Sample the worker serving this request for `seconds` and return collapsed stacks,
+    ready for `flamegraph.pl` or speedscope. \n
+    Only the worker handling the request is profiled; with several workers, repeat
+    the call or profile a single-worker instance.
+    """
+    try:
+        return await profiling.profile(
+            seconds, interval_ms / 1000, include_idle=include_idle
+        )
+    except profiling.ProfilerBusy:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running on this worker.",
+        )
+
+
+@router.get("/stalls")
+async def get_loop_stalls(
+    _: Annotated[Any, Depends(require_platform_admin)],
+) -> list[dict]:
+    """Recent event loop stalls of this worker with the stack that blocked the loop"""
+    return list(profiling.loop_monitor.stalls)
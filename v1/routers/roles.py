@@ -1,8 +1,11 @@
-from typing import Annotated, Any
+from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 
-from v1.app import RoleCRUD, schemas
+from v1.app import RoleCRUD, User, role_graph, schemas
+from v1.app.jobs import runner
+from v1.app.models import DEFAULT_TENANT_ID
+from v1.app.serialization import json_response, make_etag, not_modified
 from v1.dependencies import require_scopes
 
 __tags__ = ["role"]
@@ -14,9 +17,12 @@ router = APIRouter()
 @router.post("/")
 async def create_role(
     payload: schemas.RolePayload,
-    _: Annotated[Any, Depends(require_scopes("admin:full"))],
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
 ) -> schemas.RoleSchema:
-    role, is_created = await RoleCRUD.create(payload)
+    try:
+        role, is_created = await RoleCRUD.create(payload, current_user.tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     if is_created:
         return role
@@ -26,16 +32,73 @@ async def create_role(
         )
 
 
+@router.put("/{role_name}")
+async def update_role_hierarchy(
+    role_name: str,
+    payload: schemas.RoleHierarchyPayload,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+) -> schemas.RoleSchema:
+    try:
+        role = await RoleCRUD.update_hierarchy(
+            role_name, payload, current_user.tenant_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except PermissionError as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+
+    if not role:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Role not found."
+        )
+
+    return role
+
+
+@router.delete("/{role_name}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_role(
+    role_name: str,
+    response: Response,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+) -> schemas.JobAccepted:
+    """Delete the role in the background; track it through the returned job"""
+    tenant_id = current_user.tenant_id
+    if not (role := await RoleCRUD.get_by_name(role_name, tenant_id)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Role not found."
+        )
+    if role.tenant_id is None and tenant_id != DEFAULT_TENANT_ID:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Built-in roles are shared."
+        )
+
+    job = await runner.submit("role.delete", tenant_id=tenant_id, role_name=role_name)
+    status_url = f"/jobs/{job.id}"
+    response.headers["Location"] = status_url
+    return schemas.JobAccepted(job_id=job.id, status_url=status_url)
+
+
 @router.post("/elevate")
 async def elevate_user(
     target_email: Annotated[str, Query(max_length=32)],
-    _: Annotated[Any, Depends(require_scopes("roles:manage"))],
+    current_user: Annotated[User, Depends(require_scopes("roles:manage"))],
 ) -> bool:
-    return await RoleCRUD.elevate_role(target_email)
+    return await RoleCRUD.elevate_role(target_email, current_user.tenant_id)
 
 
-@router.get("/")
+@router.get("/", response_model=list[schemas.RoleOut])
 async def get_all(
-    _: Annotated[Any, Depends(require_scopes("users:read"))],
-) -> list[schemas.RoleSchema]:
-    return await RoleCRUD.get_all()
+    request: Request,
+    current_user: Annotated[User, Depends(require_scopes("users:read"))],
+):
+    tenant_id = current_user.tenant_id
+    etag = make_etag(
+        "roles",
+        tenant_id,
+        role_graph.current().version,
+        *await RoleCRUD.get_list_version(tenant_id),
+    )
+    if response := not_modified(request, etag):
+        return response
+
+    return json_response(await RoleCRUD.get_all_rows(tenant_id), etag=etag)
@@ -0,0 +1,91 @@
+import datetime as dt
+from datetime import datetime, timedelta
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from v1.app import ApiKeyCRUD, User, UserCRUD, schemas
+from v1.app.serialization import user_to_dict
+from v1.dependencies import require_scopes
+
+__tags__ = ["service accounts"]
+__prefix__ = "/service-accounts"
+
+router = APIRouter()
+
+
+async def _get_service_account(user_id: int, tenant_id: int) -> User:
+    account = await User.get_or_none(
+        id=user_id, tenant_id=tenant_id, is_service=True, deleted_at__isnull=True
+    )
+    if not account:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Service account not found"
+        )
+    return account
+
+
+@router.post("/", response_model=schemas.UserOut)
+async def create_service_account(
+    payload: schemas.ServiceAccountPayload,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+):
+    """Create a machine client; issue it an API key through `POST /{user_id}/keys`"""
+    try:
+        account = await UserCRUD.create_service_account(
+            payload.name, payload.roles, current_user.tenant_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return user_to_dict(account)
+
+
+@router.post("/{user_id}/keys", status_code=status.HTTP_201_CREATED)
+async def create_api_key(
+    user_id: int,
+    payload: schemas.ApiKeyPayload,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+) -> schemas.ApiKeyCreated:
+    """Issue an API key. The key is only ever returned by this call."""
+    account = await _get_service_account(user_id, current_user.tenant_id)
+    expires_at = (
+        datetime.now(dt.UTC) + timedelta(days=payload.expires_in_days)
+        if payload.expires_in_days
+        else None
+    )
+
+    try:
+        api_key, key = await ApiKeyCRUD.create(
+            account, payload.name, scopes=payload.scopes, expires_at=expires_at
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    summary = schemas.ApiKeySchema.model_validate(api_key, from_attributes=True)
+    return schemas.ApiKeyCreated(**summary.model_dump(), key=key)
+
+
+@router.get("/{user_id}/keys")
+async def get_api_keys(
+    user_id: int,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+) -> list[schemas.ApiKeySchema]:
+    account = await _get_service_account(user_id, current_user.tenant_id)
+    return [
+        schemas.ApiKeySchema.model_validate(api_key, from_attributes=True)
+        for api_key in await ApiKeyCRUD.get_active(account.id)
+    ]
+
+
+@router.delete("/{user_id}/keys/{key_id}")
+async def revoke_api_key(
+    user_id: int,
+    key_id: int,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+) -> dict:
+    account = await _get_service_account(user_id, current_user.tenant_id)
+    if not await ApiKeyCRUD.revoke(account.id, key_id):
+        raise HTTPException(status_code=404, detail="API key not found")
+
+    return {"message": "API key revoked"}
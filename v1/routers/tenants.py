@@ -0,0 +1,36 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from v1.app import TenantCRUD, User, schemas
+from v1.dependencies import require_platform_admin
+
+__tags__ = ["tenants"]
+__prefix__ = "/tenants"
+
+router = APIRouter()
+
+
+@router.post("/")
+async def create_tenant(
+    payload: schemas.TenantPayload,
+    _: Annotated[User, Depends(require_platform_admin)],
+) -> schemas.TenantSchema:
+    """Create a tenant and its first admin, who signs in with `X-Tenant: <slug>`"""
+    tenant, is_created = await TenantCRUD.create(
+        payload.slug, payload.name, payload.admin
+    )
+
+    if is_created:
+        return tenant
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Tenant already exist."
+        )
+
+
+@router.get("/")
+async def get_tenants(
+    _: Annotated[User, Depends(require_platform_admin)],
+) -> list[schemas.TenantSchema]:
+    return await TenantCRUD.get_all()
@@ -1,10 +1,11 @@
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 
-from v1.app import User, UserCRUD, schemas
-from v1.app.schemas import UserSchema
-from v1.dependencies import require_scopes
+from v1.app import RoleCRUD, User, UserCRUD, role_graph, schemas
+from v1.app.scopes import SCOPES
+from v1.app.serialization import json_response, make_etag, not_modified, user_to_dict
+from v1.dependencies import get_request_tenant, require_scopes
 
 __tags__ = ["user"]
 __prefix__ = "/users"
@@ -12,34 +13,164 @@ __prefix__ = "/users"
 router = APIRouter()
 
 
-@router.get("/")
+@router.get("/", response_model=list[schemas.UserOut])
 async def get_users(
-    _: Annotated[User, Depends(require_scopes("users:read"))],
-) -> list[UserSchema]:
-    return await UserCRUD.get_all()
+    request: Request,
+    current_user: Annotated[User, Depends(require_scopes("users:read"))],
+):
+    tenant_id = current_user.tenant_id
+    etag = make_etag("users", tenant_id, *await UserCRUD.get_list_version(tenant_id))
+    if response := not_modified(request, etag):
+        return response
 
+    return json_response(await UserCRUD.get_all_rows(tenant_id), etag=etag)
 
-@router.post("/")
+
+@router.get("/search")
+async def search_users(
+    current_user: Annotated[User, Depends(require_scopes("users:read"))],
+    q: Annotated[str, Query(min_length=1, max_length=255)],
+    mode: Literal["prefix", "fuzzy"] = "prefix",
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    after: str | None = None,
+) -> schemas.UserSearchPage:
+    """
+    Find users by username or email. \n
+    `prefix` matches the beginning of either field, `fuzzy` tolerates typos (3+ characters).
+    Pass the returned `next_cursor` as `after` to fetch the next page.
+    """
+    if mode == "fuzzy" and len(q) < 3:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Fuzzy search needs at least 3 characters",
+        )
+
+    try:
+        users, next_cursor = await UserCRUD.search(
+            q,
+            fuzzy=mode == "fuzzy",
+            limit=limit,
+            after=after,
+            tenant_id=current_user.tenant_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return schemas.UserSearchPage(users=users, next_cursor=next_cursor)
+
+
+@router.get("/with-scope")
+async def get_users_with_scope(
+    current_user: Annotated[User, Depends(require_scopes("users:read"))],
+    scope: Annotated[str, Query(max_length=64)],
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    after: Annotated[int, Query(ge=0)] = 0,
+) -> schemas.ScopeHoldersPage:
+    """
+    Users effectively holding a scope through any of their roles, for access reviews. \n
+    Pass the returned `next_cursor` as `after` to fetch the next page.
+    """
+    if scope not in SCOPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown scope"
+        )
+
+    tenant_id = current_user.tenant_id
+    roles = role_graph.current().roles_granting(scope, tenant_id)
+    users, next_cursor = await RoleCRUD.get_users_with_scope(
+        scope, limit=limit, after=after, tenant_id=tenant_id
+    )
+    return schemas.ScopeHoldersPage(
+        scope=scope,
+        roles=sorted(roles.values()),
+        users=users,
+        next_cursor=next_cursor,
+    )
+
+
+@router.post("/", response_model=schemas.UserOut)
 async def create_user(
     payload: schemas.UserPayload,
-) -> UserSchema:
+    tenant_id: Annotated[int, Depends(get_request_tenant)],
+):
     """
     Creating user in the database. Payload must contain **username**, **email** and **password**
-    Note:
+    Note: the user signs up to the tenant of the `X-Tenant` header, the default one without it
     """
-    user, is_created = await UserCRUD.create(payload)
+    user, is_created = await UserCRUD.create(payload, tenant_id=tenant_id)
 
     if is_created:
-        return user
+        await user.fetch_related("roles")
+        return user_to_dict(user)
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="User already exist."
         )
 
 
-@router.get("/me")
+@router.get("/me", response_model=schemas.UserOut)
 async def get_current_user_info(
+    request: Request,
     current_user: Annotated[User, Depends(require_scopes("users:me"))],
-) -> UserSchema:
+):
     """Get current user information"""
-    return current_user
+    etag = make_etag("me", current_user.id, current_user.updated_at)
+    if response := not_modified(request, etag):
+        return response
+
+    return json_response(user_to_dict(current_user), etag=etag)
+
+
+@router.post("/{user_id}/deactivate", response_model=schemas.UserOut)
+async def deactivate_user(
+    user_id: int,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+):
+    """Block the user from authenticating and revoke its sessions"""
+    if user_id == current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You can't deactivate yourself.",
+        )
+
+    if not (user := await UserCRUD.set_active(user_id, False, current_user.tenant_id)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    return user_to_dict(user)
+
+
+@router.post("/{user_id}/activate", response_model=schemas.UserOut)
+async def activate_user(
+    user_id: int,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+):
+    if not (user := await UserCRUD.set_active(user_id, True, current_user.tenant_id)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    return user_to_dict(user)
+
+
+@router.delete("/{user_id}")
+async def delete_user(
+    user_id: int,
+    current_user: Annotated[User, Depends(require_scopes("admin:full"))],
+) -> dict:
+    """
+    Soft-delete the user: it disappears from listings and can no longer authenticate. \n
+    The email stays taken.
+    """
+    if user_id == current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="You can't delete yourself."
+        )
+
+    if not await UserCRUD.soft_delete(user_id, current_user.tenant_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    return {"message": "User deleted"}
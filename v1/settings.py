@@ -1,7 +1,8 @@
 from pathlib import Path
+from typing import Literal
 import logging
 
-from pydantic import Field
+from pydantic import AwareDatetime, BaseModel, Field
 from pydantic_settings import BaseSettings
 
 ENVS_PATH = Path("env")
@@ -18,6 +19,29 @@ class _SecuritySettings(BaseSettings):
     secret_key: str = Field(alias="JWT_ACCESS_SECRET_KEY")
     refresh_secret_key: str = Field(alias="JWT_REFRESH_SECRET_KEY")  # New
     algorithm: str = Field(alias="JWT_ALGORITHM")
+    password_hash_scheme: Literal["bcrypt", "argon2id"] = Field(
+        alias="PASSWORD_HASH_SCHEME", default="bcrypt"
+    )
+    bcrypt_rounds: int = Field(alias="BCRYPT_ROUNDS", default=12, ge=4, le=31)
+    argon2_time_cost: int = Field(alias="ARGON2_TIME_COST", default=3, ge=1)
+    argon2_memory_cost: int = Field(
+        alias="ARGON2_MEMORY_COST", default=65536, ge=8
+    )  # KiB
+    argon2_parallelism: int = Field(alias="ARGON2_PARALLELISM", default=4, ge=1)
+    # Encode scopes as a bitmap and roles as IDs only in access tokens; enable once
+    # every service verifying them reads `scp`/`rid` instead of `scopes`/`roles`
+    compact_tokens: bool = Field(alias="COMPACT_TOKENS", default=False)
+    # HMAC key of stored API keys, falls back to JWT_ACCESS_SECRET_KEY
+    api_key_secret: str | None = Field(alias="API_KEY_SECRET", default=None)
+    # How long a worker may keep accepting a key revoked through another worker
+    api_key_cache_seconds: float = Field(alias="API_KEY_CACHE_SECONDS", default=30.0)
+    api_key_token_minutes: int = Field(alias="API_KEY_TOKEN_MINUTES", default=15, ge=1)
+    # How long a worker may keep accepting a session cookie logged out through another worker
+    session_cache_seconds: float = Field(alias="SESSION_CACHE_SECONDS", default=30.0)
+    # Refresh tokens issued before sessions existed (no `jti`) are accepted until then
+    legacy_refresh_tokens_until: AwareDatetime | None = Field(
+        alias="LEGACY_REFRESH_TOKENS_UNTIL", default=None
+    )
 
 
 # noinspection PyUnboundLocalVariable
@@ -26,16 +50,137 @@ class _APISettings(BaseSettings):
     version: str | Path = Path("v1")
     build_version: str
     version_path: Path | None = Path(version)
+    # `dev` scans the routers directory and generates schemas,
+    # `fast` uses the static router registry and relies on aerich migrations
+    startup_mode: Literal["dev", "fast"] = "dev"
+
+
+class AdmissionClass(BaseModel):
+    # Requests of the class served at once, 0 for no limit
+    concurrency: int = Field(default=0, ge=0)
+    # Requests waiting for a slot; more are shed right away
+    queue: int = Field(default=0, ge=0)
+    # Seconds a request may wait before it's shed
+    timeout: float = Field(default=1.0, ge=0)
+    # Waiters for the worker-wide limit are admitted highest priority first
+    priority: int = 0
+    # Seconds clients are told to wait in `Retry-After` when shed
+    retry_after: int = Field(default=1, ge=0)
+
+
+def _default_admission_classes() -> dict[str, AdmissionClass]:
+    return {
+        # Password hashing costs tens of milliseconds of CPU per request
+        "hashing": AdmissionClass(concurrency=4, queue=64, timeout=5, priority=0),
+        "default": AdmissionClass(priority=5),
+        "critical": AdmissionClass(priority=10),
+    }
+
+
+def _default_admission_routes() -> dict[str, str]:
+    return {
+        "POST /token": "hashing",
+        "POST /users/": "hashing",
+        "POST /tenants/": "hashing",
+        "GET /api-info": "critical",
+        "GET /metrics": "critical",
+        "POST /introspect": "critical",
+        "GET /health/*": "critical",
+    }
+
+
+class _ServerSettings(BaseSettings):
+    host: str = Field(alias="SERVER_HOST", default="0.0.0.0")
+    port: int = Field(alias="SERVER_PORT", default=8000)
+    workers: int = Field(alias="SERVER_WORKERS", default=1, ge=1)
+    keep_alive: int = Field(alias="SERVER_KEEP_ALIVE", default=5)
+    backlog: int = Field(alias="SERVER_BACKLOG", default=2048)
+    loop: Literal["auto", "asyncio", "uvloop"] = Field(
+        alias="SERVER_LOOP", default="auto"
+    )
+    http: Literal["auto", "h11", "httptools"] = Field(
+        alias="SERVER_HTTP", default="auto"
+    )
+    compression: Literal["off", "gzip", "brotli"] = Field(
+        alias="COMPRESSION", default="gzip"
+    )
+    compression_min_size: int = Field(alias="COMPRESSION_MIN_SIZE", default=1024)
+    # gzip level (1-9) or brotli quality (0-11)
+    compression_level: int = Field(alias="COMPRESSION_LEVEL", default=5)
+    admission_control: bool = Field(alias="ADMISSION_CONTROL", default=True)
+    # Requests served at once by a worker across all classes, 0 for no limit
+    admission_max_concurrency: int = Field(
+        alias="ADMISSION_MAX_CONCURRENCY", default=0, ge=0
+    )
+    admission_queue: int = Field(alias="ADMISSION_QUEUE", default=256, ge=0)
+    admission_classes: dict[str, AdmissionClass] = Field(
+        alias="ADMISSION_CLASSES", default_factory=_default_admission_classes
+    )
+    # `METHOD /path` (relative to /v1, `*` wildcards allowed) -> class, others are `default`
+    admission_routes: dict[str, str] = Field(
+        alias="ADMISSION_ROUTES", default_factory=_default_admission_routes
+    )
+    # Seconds in-flight requests and background jobs get to finish after SIGTERM
+    shutdown_timeout: int = Field(alias="SHUTDOWN_TIMEOUT", default=25, ge=0)
+
+    def uvicorn_options(self) -> dict:
+        return dict(
+            host=self.host,
+            port=self.port,
+            workers=self.workers,
+            timeout_keep_alive=self.keep_alive,
+            backlog=self.backlog,
+            loop=self.loop,
+            http=self.http,
+            timeout_graceful_shutdown=self.shutdown_timeout,
+        )
+
+
+class _TelemetrySettings(BaseSettings):
+    # `off` disables tracing entirely, `file` and `otlp` select the span exporter
+    trace_exporter: Literal["off", "file", "otlp"] = Field(
+        alias="TRACE_EXPORTER", default="off"
+    )
+    # Share of new traces recorded; traces started upstream keep the caller's decision
+    trace_sample_rate: float = Field(
+        alias="TRACE_SAMPLE_RATE", default=0.01, ge=0, le=1
+    )
+    trace_file: Path = Field(alias="TRACE_FILE", default=Path("traces.jsonl"))
+    otlp_endpoint: str = Field(
+        alias="OTLP_ENDPOINT", default="http://localhost:4318/v1/traces"
+    )
+    service_name: str = Field(alias="SERVICE_NAME", default="users")
+    # Queries at least this slow are logged and counted, 0 disables the log
+    slow_query_ms: float = Field(alias="SLOW_QUERY_MS", default=100.0, ge=0)
+    # Event loop stalls at least this long are recorded with the blocking stack, 0 disables
+    loop_stall_ms: float = Field(alias="LOOP_STALL_MS", default=100.0, ge=0)
+    # Bearer token scrapers send to GET /metrics; without one it's only served outside production
+    metrics_token: str | None = Field(alias="METRICS_TOKEN", default=None)
 
 
 class _Settings(BaseSettings):
     security: _SecuritySettings
     api: _APISettings
+    server: _ServerSettings
+    telemetry: _TelemetrySettings
     db_url: str = Field(alias="DATABASE_URL")
     is_prod: bool = Field(alias="IS_PRODUCTION")
+    role_graph_refresh_seconds: float = Field(
+        alias="ROLE_GRAPH_REFRESH_SECONDS", default=5.0
+    )
+    events_poll_seconds: float = Field(alias="EVENTS_POLL_SECONDS", default=1.0)
+    jobs_concurrency: int = Field(alias="JOBS_CONCURRENCY", default=2, ge=1)
+    jobs_stale_seconds: float = Field(alias="JOBS_STALE_SECONDS", default=300.0)
 
 
 _security_settings = _SecuritySettings(_env_file=ENVS_PATH / "security.env")  # type: ignore
 _api_settings = _APISettings(_env_file=ENVS_PATH / "api.env")  # type: ignore
+_server_settings = _ServerSettings(_env_file=ENVS_PATH / "server.env")  # type: ignore
+_telemetry_settings = _TelemetrySettings(_env_file=ENVS_PATH / "telemetry.env")  # type: ignore
 
-settings = _Settings(security=_security_settings, api=_api_settings)  # type: ignore
+settings = _Settings(
+    security=_security_settings,
+    api=_api_settings,
+    server=_server_settings,
+    telemetry=_telemetry_settings,
+)  # type: ignore
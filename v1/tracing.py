@@ -0,0 +1,246 @@
+import asyncio
+import functools
+import inspect
+import json
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+from v1.settings import settings, logger
+
+__all__ = [
+    "Span",
+    "Trace",
+    "start_trace",
+    "finish_trace",
+    "span",
+    "traced",
+    "current_trace_id",
+    "exporter",
+]
+
+
+@dataclass(slots=True)
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    name: str
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+    # OTLP span kind: 1 internal, 2 server
+    kind: int = 1
+
+
+@dataclass(slots=True)
+class Trace:
+    trace_id: str
+    sampled: bool
+    spans: list[Span] = field(default_factory=list)
+
+
+_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_parent: ContextVar[Span | None] = ContextVar("parent_span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def start_trace(traceparent: str | None = None) -> tuple[Trace, Span | None]:
+    """
+    Begin a trace for the current task, continuing the caller's W3C `traceparent`. \n
+    Sampling is decided once here (head-based): upstream decisions are honoured,
+    otherwise `TRACE_SAMPLE_RATE` of the traces are kept. Unsampled traces only carry an id.
+    :return: (trace, remote parent span to attach the root span to)
+    """
+    parts = traceparent.split("-") if traceparent else []
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        remote = Span(parts[1], parts[2], None, "remote", 0)
+        trace = Trace(parts[1], sampled=parts[3] == "01")
+    else:
+        remote = None
+        trace = Trace(
+            _new_id(128),
+            sampled=random.random() < settings.telemetry.trace_sample_rate,
+        )
+
+    _trace.set(trace)
+    _parent.set(remote)
+    return trace, remote
+
+
+def finish_trace(trace: Trace) -> None:
+    if trace.sampled and trace.spans:
+        exporter.export(trace.spans)
+
+
+def current_trace_id() -> str | None:
+    trace = _trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span | None]:
+    """Record the enclosed block as a child of the current span, no-op outside sampled traces"""
+    trace = _trace.get()
+    if trace is None or not trace.sampled:
+        yield None
+        return
+
+    parent = _parent.get()
+    current = Span(
+        trace_id=trace.trace_id,
+        span_id=_new_id(64),
+        parent_id=parent.span_id if parent else None,
+        name=name,
+        start_ns=time.time_ns(),
+        attributes=attributes,
+    )
+    token = _parent.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _parent.reset(token)
+        trace.spans.append(current)
+
+
+def traced(name: str) -> Callable:
+    """Decorator wrapping every call of a sync or async function in a span"""
+
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(span: Span) -> dict:
+    data = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [
+            {"key": key, "value": _otlp_value(value)}
+            for key, value in span.attributes.items()
+        ],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    return data
+
+
+class SpanExporter:
+    """
+    Buffers finished spans and writes them out in batches on a worker thread,
+    so exporting never blocks the event loop. \n
+    `TRACE_EXPORTER=file` appends one OTLP JSON span per line to `TRACE_FILE`,
+    `otlp` posts OTLP/HTTP JSON batches to `OTLP_ENDPOINT`.
+    """
+
+    def __init__(self, batch_size: int = 256, flush_seconds: float = 5.0):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._buffer: list[Span] = []
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        self._buffer.extend(spans)
+        if (
+            len(self._buffer) >= self.batch_size
+            or time.monotonic() - self._flushed_at >= self.flush_seconds
+        ):
+            batch, self._buffer = self._buffer, []
+            self._flushed_at = time.monotonic()
+            asyncio.get_running_loop().run_in_executor(None, self._write, batch)
+
+    def shutdown(self) -> None:
+        batch, self._buffer = self._buffer, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch: list[Span]) -> None:
+        telemetry = settings.telemetry
+        try:
+            with self._lock:
+                if telemetry.trace_exporter == "file":
+                    with open(telemetry.trace_file, "a") as file:
+                        file.writelines(
+                            json.dumps(_otlp_span(span)) + "\n" for span in batch
+                        )
+                elif telemetry.trace_exporter == "otlp":
+                    self._post(batch)
+        except Exception:
+            logger.exception(f"Failed to export {len(batch)} span(s)")
+
+    @staticmethod
+    def _post(batch: list[Span]) -> None:
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": _otlp_value(settings.telemetry.service_name),
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "v1.tracing"},
+                            "spans": [_otlp_span(span) for span in batch],
+                        }
+                    ],
+                }
+            ]
+        }
+        request = urllib.request.Request(
+            settings.telemetry.otlp_endpoint,
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+
+
+exporter = SpanExporter()